@@ -1,49 +1,191 @@
-#!/usr/bin/env
-import subprocess
+import argparse
 import json
-import pprint
+import logging
+import math
+import os
+import signal
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from sms import notificar, cerrar_despachador
 
+load_dotenv()
 
-cmd = "df -h  | grep /dev* | awk '{ if (length($5)>2 && $5>70) print $6 " " $5 }'"
-output = ""
-#output1="El estado del filesystem es del 90%"
-test = subprocess.Popen(cmd, stdout = subprocess.PIPE, stderr = subprocess.PIPE, shell = True)
-while True:
-    output = test.stdout.read().decode("utf-8")
-   
-    if test.poll() is not None:
-        break
-print("%s" % (output)) 
+_logger = logging.getLogger(__name__)
 
-if output != "":
-  auth = "curl -k -X POST -H 'Content-Type: application/json' -d '{\"password\": \"M3d1n*2024\", \"username\": \"medin\"}\' https://172.28.97.20/auth/v1/"
+# Configuración del monitor de disco (se puede ajustar desde el archivo .env)
+UMBRAL_ALARMA = float(os.getenv("ALARMA_UMBRAL", "70"))
+# Uso por debajo del cual una alarma se considera resuelta (histéresis)
+UMBRAL_RECUPERACION = float(os.getenv("ALARMA_UMBRAL_RECUPERACION", "65"))
+INTERVALO_ALARMA = float(os.getenv("ALARMA_INTERVALO", "60"))
+PUNTOS_MONTAJE = [punto.strip() for punto in os.getenv("ALARMA_PUNTOS_MONTAJE", "").split(",") if punto.strip()]
+DESTINOS_ALARMA = [destino.strip() for destino in
+                   os.getenv("ALARMA_DESTINOS", "59940709,53056449,59940907,52887195,59940498,52188129").split(",")
+                   if destino.strip()]
+# Espacio libre que se exige además de lo que ocupará la descompresión
+MARGEN_ESPACIO = float(os.getenv("ALARMA_MARGEN_ESPACIO_MB", "512")) * 1024 * 1024
 
-  token = subprocess.Popen(auth, stdout = subprocess.PIPE, stderr = subprocess.PIPE, shell = True)
-  json_token = json.loads(token.stdout.read())
 
-  data_token = json.dumps(json_token["token"])
-  token_ok = data_token.replace('"',"")
-  msj=""
+def puntos_montaje_locales() -> List[str]:
+    """
+    Devuelve los puntos de montaje de dispositivos /dev (los que revisaba 'df | grep /dev').
 
-  for c in output:
-      if c != "":
-         msj += c.rstrip()
-  
-  lista_destinos = {"59940709","53056449","59940907","52887195","59940498","52188129"}
-  for l in lista_destinos:
-    ll ='"' + l +'"'
-    mensaje = '"filesystems: ' + msj.rstrip() + '" '
-    mensaje = mensaje.replace('%', '%, ')
-    
-    print (mensaje)
-    
-    sms = "curl -k -X POST -H \"Authorization: Bearer %s \" -H 'Content-Type: application/json' -d '{\"channel\": \"SMS\",\"sms\": {\"destination\": %s,\"message\": %s, \"sender\": \"Medin\"}}' https://172.28.97.20/notifications/v2/" % (token_ok, ll, mensaje)
-    print(sms)
+    Returns:
+        List[str]: Puntos de montaje; ['/'] si no se puede leer /proc/mounts.
+    """
+    try:
+        lineas = Path("/proc/mounts").read_text().splitlines()
+    except OSError:
+        return ["/"]
+    puntos = []
+    for linea in lineas:
+        campos = linea.split()
+        if len(campos) >= 2 and campos[0].startswith("/dev") and campos[1] not in puntos:
+            puntos.append(campos[1].replace("\\040", " "))
+    return puntos or ["/"]
 
-    enviar_sms = subprocess.Popen(sms, stdout = subprocess.PIPE, stderr = subprocess.PIPE, shell = True)
 
-    json_sms = json.dumps(enviar_sms.stdout.read())
+def uso_disco(punto: str) -> Tuple[int, int]:
+    """
+    Lee el uso de un sistema de archivos con os.statvfs, con el mismo cálculo que la columna Use% de df.
 
+    Args:
+        punto (str): Punto de montaje o cualquier ruta dentro del sistema de archivos.
 
- 
+    Returns:
+        Tuple[int, int]: Porcentaje de uso (redondeado hacia arriba) y bytes libres para usuarios sin privilegios.
+    """
+    estado = os.statvfs(punto)
+    usados = (estado.f_blocks - estado.f_bfree) * estado.f_frsize
+    libres = estado.f_bavail * estado.f_frsize
+    porcentaje = math.ceil(usados * 100 / (usados + libres)) if usados + libres else 0
+    return porcentaje, libres
 
+
+class MonitorDisco:
+    """
+    Vigila el uso de varios sistemas de archivos y avisa por SMS con histéresis.
+
+    Un punto de montaje entra en alarma cuando su uso supera 'umbral' y solo sale de ella cuando baja
+    de 'recuperacion', de modo que un disco que oscila alrededor del umbral no genera un SMS en cada
+    revisión. Las alarmas nuevas de una revisión se agrupan en un solo mensaje.
+
+    Attributes:
+        puntos (List[str]): Puntos de montaje vigilados.
+        umbral (float): Porcentaje de uso que dispara la alarma.
+        recuperacion (float): Porcentaje de uso por debajo del cual se resuelve la alarma.
+        destinos (List[str]): Números que reciben los avisos.
+        en_alarma (Dict[str, int]): Puntos en alarma y el uso con que entraron.
+        estado (Optional[Path]): Archivo donde se guardan las alarmas activas entre ejecuciones (modo cron).
+    """
+
+    def __init__(self, puntos: Optional[List[str]] = None, umbral: float = UMBRAL_ALARMA,
+                 recuperacion: float = UMBRAL_RECUPERACION, destinos: Optional[List[str]] = None,
+                 enviar: Callable[[str, Optional[List[str]]], None] = notificar, estado: Optional[Path] = None) -> None:
+        if recuperacion > umbral:
+            raise ValueError(f"El umbral de recuperacion ({recuperacion}) no puede superar al de alarma ({umbral})")
+        self.puntos = puntos or PUNTOS_MONTAJE or puntos_montaje_locales()
+        self.umbral = umbral
+        self.recuperacion = recuperacion
+        self.destinos = destinos or DESTINOS_ALARMA
+        self.estado = estado
+        self.en_alarma: Dict[str, int] = {}
+        if estado and estado.exists():
+            try:
+                self.en_alarma = json.loads(estado.read_text())
+            except ValueError as e:
+                _logger.warning(f"Estado de alarmas ilegible, se ignora: {e}")
+        self._enviar = enviar
+        self._detener = threading.Event()
+
+    def revisar(self) -> List[str]:
+        """
+        Revisa todos los puntos de montaje una vez y envía los avisos que correspondan.
+
+        Returns:
+            List[str]: Mensajes enviados en esta revisión.
+        """
+        nuevas, resueltas = [], []
+        for punto in self.puntos:
+            try:
+                porcentaje, _ = uso_disco(punto)
+            except OSError as e:
+                _logger.error(f"No se pudo leer el uso de {punto}: {e}")
+                continue
+            if punto not in self.en_alarma and porcentaje > self.umbral:
+                self.en_alarma[punto] = porcentaje
+                nuevas.append(f"{punto} {porcentaje}%")
+            elif punto in self.en_alarma and porcentaje < self.recuperacion:
+                del self.en_alarma[punto]
+                resueltas.append(f"{punto} {porcentaje}%")
+            _logger.debug(f"Uso de {punto}: {porcentaje}%")
+
+        mensajes = []
+        if nuevas:
+            mensajes.append(f"filesystems: {', '.join(nuevas)}")
+        if resueltas:
+            mensajes.append(f"filesystems normalizados: {', '.join(resueltas)}")
+        for mensaje in mensajes:
+            _logger.warning(mensaje)
+            self._enviar(mensaje, self.destinos)
+        if self.estado and mensajes:
+            self.estado.write_text(json.dumps(self.en_alarma))
+        return mensajes
+
+    def ejecutar(self, intervalo: float = INTERVALO_ALARMA) -> None:
+        """
+        Revisa los discos cada 'intervalo' segundos hasta que se llame a detener().
+        """
+        _logger.info(f"Vigilando {', '.join(self.puntos)} cada {intervalo:.0f} s (alarma > {self.umbral}%, "
+                     f"recuperacion < {self.recuperacion}%)")
+        while not self._detener.is_set():
+            self.revisar()
+            self._detener.wait(intervalo)
+
+    def detener(self) -> None:
+        self._detener.set()
+
+
+def avisar_espacio_insuficiente(directorio: Path, bytes_necesarios: int, margen: float = MARGEN_ESPACIO) -> bool:
+    """
+    Comprueba si hay espacio para escribir 'bytes_necesarios' en el directorio y, si no, avisa por SMS.
+
+    Args:
+        directorio (Path): Directorio donde se va a escribir (por ejemplo, el de descompresión).
+        bytes_necesarios (int): Bytes que se van a escribir.
+        margen (float): Bytes libres que deben quedar además de los necesarios.
+
+    Returns:
+        bool: True si hay espacio suficiente.
+    """
+    porcentaje, libres = uso_disco(str(directorio))
+    if libres >= bytes_necesarios + margen:
+        return True
+    mensaje = (f"Espacio insuficiente en {directorio} para descomprimir: se necesitan "
+               f"{bytes_necesarios / 1024 / 1024:.0f} MB y hay {libres / 1024 / 1024:.0f} MB libres ({porcentaje}% usado)")
+    _logger.warning(mensaje)
+    notificar(mensaje, DESTINOS_ALARMA)
+    return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monitor de uso de disco con avisos por SMS")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_ALARMA, help="Segundos entre revisiones")
+    parser.add_argument("--una-vez", action="store_true", help="Revisa una sola vez y termina (para usar desde cron)")
+    parser.add_argument("--estado", type=Path, default=Path(".alarmas_disco.json"),
+                        help="Archivo con las alarmas activas, para mantener la histéresis entre ejecuciones de cron")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    monitor = MonitorDisco(estado=args.estado if args.una_vez else None)
+    signal.signal(signal.SIGTERM, lambda *_: monitor.detener())
+    try:
+        if args.una_vez:
+            monitor.revisar()
+        else:
+            monitor.ejecutar(args.intervalo)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cerrar_despachador(timeout=30)
@@ -0,0 +1,86 @@
+import io
+import logging
+import random
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import List, Sequence
+
+_logger = logging.getLogger(__name__)
+
+FORMATOS = ("zip", "tar.gz", "rar")
+
+
+def pdf_falso(generador: random.Random, tamanho: int) -> bytes:
+    """
+    Devuelve un "PDF" de relleno del tamaño pedido: cabecera y cierre de PDF con bytes aleatorios en
+    medio, que no se comprimen (como el contenido de un PDF real, que ya va comprimido).
+
+    Args:
+        generador (random.Random): Generador con semilla para que los archivos sean reproducibles.
+        tamanho (int): Tamaño en bytes del PDF.
+
+    Returns:
+        bytes: Contenido del PDF.
+    """
+    cabecera, cierre = b"%PDF-1.4\n", b"\n%%EOF\n"
+    return cabecera + generador.randbytes(max(0, tamanho - len(cabecera) - len(cierre))) + cierre
+
+
+def generar_comprimidos(directorio: Path, periodo: str, archivos_por_formato: int = 1, pdfs_por_archivo: int = 50,
+                        tamanho_pdf_kb: int = 100, formatos: Sequence[str] = FORMATOS, semilla: int = 0) -> List[Path]:
+    """
+    Genera comprimidos de facturas sintéticos con el nombre 'YYYYMM_...' que espera el proceso.
+
+    Los .rar necesitan el programa 'rar' instalado; si no está se omiten con un aviso.
+
+    Args:
+        directorio (Path): Directorio donde se crean los comprimidos (la raíz del servidor de benchmark).
+        periodo (str): Periodo 'YYYYMM' con que empiezan los nombres.
+        archivos_por_formato (int): Comprimidos de cada formato.
+        pdfs_por_archivo (int): PDF dentro de cada comprimido.
+        tamanho_pdf_kb (int): Tamaño de cada PDF en KB.
+        formatos (Sequence[str]): Formatos a generar, de entre 'zip', 'tar.gz' y 'rar'.
+        semilla (int): Semilla del contenido, para repetir exactamente el mismo juego de datos.
+
+    Returns:
+        List[Path]: Comprimidos generados.
+    """
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    generador = random.Random(semilla)
+    tamanho = tamanho_pdf_kb * 1024
+    generados = []
+
+    for formato in formatos:
+        if formato == "rar" and shutil.which("rar") is None:
+            _logger.warning("No se encontro el programa 'rar', no se generan comprimidos .rar")
+            continue
+        for numero in range(archivos_por_formato):
+            ruta = directorio / f"{periodo}_facturas_{numero}.{formato}"
+            pdfs = [(f"factura_{numero}_{i}.pdf", pdf_falso(generador, tamanho)) for i in range(pdfs_por_archivo)]
+            if formato == "zip":
+                with zipfile.ZipFile(ruta, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+                    for nombre, contenido in pdfs:
+                        zip_ref.writestr(nombre, contenido)
+            elif formato == "tar.gz":
+                with tarfile.open(ruta, "w:gz") as tar_ref:
+                    for nombre, contenido in pdfs:
+                        info = tarfile.TarInfo(nombre)
+                        info.size = len(contenido)
+                        tar_ref.addfile(info, io.BytesIO(contenido))
+            elif formato == "rar":
+                with tempfile.TemporaryDirectory() as temporal:
+                    for nombre, contenido in pdfs:
+                        (Path(temporal) / nombre).write_bytes(contenido)
+                    subprocess.run(["rar", "a", "-ep", "-inul", str(ruta.resolve()), "."], cwd=temporal, check=True)
+            else:
+                raise ValueError(f"Formato no soportado: {formato}")
+            generados.append(ruta)
+
+    total = sum(ruta.stat().st_size for ruta in generados)
+    _logger.info(f"Generados {len(generados)} comprimidos del periodo {periodo} ({total / 1024 / 1024:.1f} MB)")
+    return generados
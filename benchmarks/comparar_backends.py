@@ -0,0 +1,97 @@
+"""
+Compara los motores de descompresión disponibles (ver descompresion.BACKENDS) sobre comprimidos
+sintéticos con la forma de los de Cubacel: muchos PDF pequeños o pocos PDF grandes.
+
+Uso (desde la raíz del proyecto):
+
+    python -m benchmarks.comparar_backends
+    python -m benchmarks.comparar_backends --formas muchos_pequenhos --formatos tar.gz --repeticiones 5
+    python -m benchmarks.comparar_backends --salida backends.json
+
+Los motores que no están instalados (pigz, python-isal) se informan como no disponibles.
+"""
+import argparse
+import json
+import logging
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+from benchmarks.archivos_sinteticos import FORMATOS, generar_comprimidos
+from descompresion import BACKENDS, extraer_comprimido
+
+_logger = logging.getLogger(__name__)
+
+# Forma de cada juego de datos: (PDF por comprimido, tamaño de cada PDF en KB)
+FORMAS = {
+    "muchos_pequenhos": (500, 60),
+    "pocos_grandes": (8, 12 * 1024),
+}
+
+
+def medir(comprimido: Path, backend: str, repeticiones: int, trabajo: Path) -> Dict[str, float]:
+    """
+    Extrae el comprimido varias veces con un motor y devuelve la mediana.
+
+    Args:
+        comprimido (Path): Comprimido a extraer.
+        backend (str): Nombre del motor.
+        repeticiones (int): Extracciones completas.
+        trabajo (Path): Directorio temporal donde extraer.
+
+    Returns:
+        Dict[str, float]: Duración mediana en segundos, MB/s descomprimidos y bytes escritos.
+    """
+    duraciones, escritos = [], 0
+    for _ in range(repeticiones):
+        destino = trabajo / "salida"
+        shutil.rmtree(destino, ignore_errors=True)
+        destino.mkdir(parents=True)
+        inicio = time.perf_counter()
+        escritos = extraer_comprimido(comprimido, destino, backend=backend)
+        duraciones.append(time.perf_counter() - inicio)
+    shutil.rmtree(trabajo / "salida", ignore_errors=True)
+    duracion = statistics.median(duraciones)
+    return {"duracion_s": round(duracion, 4), "mb_s": round(escritos / 1024 / 1024 / duracion, 2), "bytes": escritos}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compara los motores de descompresión sobre comprimidos sintéticos")
+    parser.add_argument("--formas", default=",".join(FORMAS), help=f"Juegos de datos separados por comas: {', '.join(FORMAS)}")
+    parser.add_argument("--formatos", default=",".join(FORMATOS), help="Formatos a comparar separados por comas")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Extracciones por motor; se informa la mediana")
+    parser.add_argument("--salida", type=Path, default=None, help="Guarda el resultado en este JSON")
+    parser.add_argument("--verbose", action="store_true", help="Muestra los logs de la extracción")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    formatos = [formato.strip() for formato in args.formatos.split(",") if formato.strip()]
+    resultados: List[dict] = []
+
+    print(f"{'forma':<18}{'formato':<9}{'motor':<10}{'duracion (s)':>14}{'MB/s':>10}")
+    with tempfile.TemporaryDirectory(prefix="benchmark_backends_") as temporal:
+        for forma in [forma.strip() for forma in args.formas.split(",") if forma.strip()]:
+            pdfs, tamanho_kb = FORMAS[forma]
+            comprimidos = generar_comprimidos(Path(temporal) / forma, "202401", 1, pdfs, tamanho_kb, formatos)
+            for comprimido in comprimidos:
+                formato = next(f for f in FORMATOS if comprimido.name.endswith(f".{f}"))
+                for backend in BACKENDS[formato]:
+                    if not backend.disponible():
+                        print(f"{forma:<18}{formato:<9}{backend.nombre:<10}{'no disponible':>14}")
+                        continue
+                    medida = medir(comprimido, backend.nombre, args.repeticiones, Path(temporal))
+                    resultados.append({"forma": forma, "formato": formato, "motor": backend.nombre} | medida)
+                    print(f"{forma:<18}{formato:<9}{backend.nombre:<10}{medida['duracion_s']:>14.3f}{medida['mb_s']:>10.1f}")
+
+    if args.salida:
+        args.salida.write_text(json.dumps({"parametros": vars(args) | {"salida": str(args.salida)},
+                                           "resultados": resultados}, indent=1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Benchmark del proceso completo contra un servidor SFTP local con latencia y ancho de banda simulados.
+
+Uso (desde la raíz del proyecto):
+
+    python -m benchmarks.ejecutar_benchmark --latencia-ms 40 --ancho-banda-mbps 100 --repeticiones 3
+    python -m benchmarks.ejecutar_benchmark --salida referencia.json
+    python -m benchmarks.ejecutar_benchmark --referencia referencia.json --tolerancia 0.2
+
+Con --referencia el programa termina con código 1 si alguna etapa es más lenta que la referencia
+por encima de la tolerancia, para detectar regresiones antes de desplegar.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+from benchmarks.archivos_sinteticos import FORMATOS, generar_comprimidos
+from benchmarks.servidor_sftp import ServidorSFTPLocal
+from functions import (fecha_mes_vencido, read_from_sftp, filtrar_facturas_mes_vencido, descargar_archivos_sftp,
+                       descomprimir_archivos, subir_carpeta_a_sftp)
+from metricas import InformeEjecucion
+from pool_sftp import cerrar_pools, obtener_pool
+from sftp_async import read_from_sftp_async, descargar_archivos_sftp_async, subir_carpeta_a_sftp_async
+from streaming import procesar_archivos_streaming
+
+_logger = logging.getLogger(__name__)
+
+MODOS = ("normal", "streaming", "async")
+DESTINO_DESCARGA = "archivos_descargados"
+
+
+def ejecutar_proceso(modo: str, host: str, port: int, workers: int, informe: InformeEjecucion) -> None:
+    """
+    Ejecuta las etapas del proceso (sin el aviso por SMS) midiendo cada una en el informe.
+
+    Args:
+        modo (str): 'normal' (descarga, descompresión y subida), 'streaming' o 'async'.
+        host (str): Dirección del servidor SFTP de benchmark.
+        port (int): Puerto del servidor SFTP de benchmark.
+        workers (int): Procesos usados para descomprimir.
+        informe (InformeEjecucion): Informe donde se miden las etapas.
+    """
+    usuario, clave = "benchmark", "benchmark"
+    direccion_destino_descarga = Path.cwd() / DESTINO_DESCARGA
+    direccion_destino_descarga.mkdir(parents=True, exist_ok=True)
+
+    if modo == "async":
+        async def proceso() -> None:
+            with informe.etapa("listado"):
+                conteo_archivos = await read_from_sftp_async(host, port, usuario, clave)
+            lista_archivos_copiar = filtrar_facturas_mes_vencido(conteo_archivos)
+            with informe.etapa("descarga"):
+                await descargar_archivos_sftp_async(host, port, usuario, clave, lista_archivos_copiar, direccion_destino_descarga)
+            with informe.etapa("descompresion"):
+                carpeta_buscar = await asyncio.to_thread(descomprimir_archivos, direccion_destino_descarga, workers)
+            with informe.etapa("subida"):
+                await subir_carpeta_a_sftp_async(host, port, usuario, clave, DESTINO_DESCARGA, carpeta_buscar)
+        asyncio.run(proceso())
+        return
+
+    with informe.etapa("listado"):
+        conteo_archivos = read_from_sftp(host, port, usuario, clave)
+    lista_archivos_copiar = filtrar_facturas_mes_vencido(conteo_archivos)
+    if modo == "streaming":
+        with informe.etapa("streaming"):
+            lista_archivos_copiar = procesar_archivos_streaming(obtener_pool(host, port, usuario, clave), lista_archivos_copiar)
+        if not lista_archivos_copiar:
+            return
+    with informe.etapa("descarga"):
+        descargar_archivos_sftp(conteo_archivos, host, port, usuario, clave, lista_archivos_copiar, direccion_destino_descarga)
+    with informe.etapa("descompresion"):
+        carpeta_buscar = descomprimir_archivos(direccion_destino_descarga, workers)
+    with informe.etapa("subida"):
+        subir_carpeta_a_sftp(host, port, usuario, clave, DESTINO_DESCARGA, carpeta_buscar)
+
+
+def resumir(informes: List[dict]) -> Dict[str, dict]:
+    """
+    Calcula la mediana de cada medida por etapa entre las repeticiones.
+
+    Args:
+        informes (List[dict]): Informes de InformeEjecucion.resumen de cada repetición.
+
+    Returns:
+        Dict[str, dict]: Duración, MB/s, latencia media por archivo, bytes y archivos de cada etapa.
+    """
+    etapas: Dict[str, dict] = {}
+    for tipo in sorted({tipo for informe in informes for tipo in informe["totales"]}):
+        totales = [informe["totales"][tipo] for informe in informes if tipo in informe["totales"]]
+        resumen = {}
+        for campo in ("duracion_s", "mb_s", "latencia_media_s", "bytes", "archivos"):
+            valores = [total[campo] for total in totales if total.get(campo) is not None]
+            resumen[campo] = round(statistics.median(valores), 4) if valores else None
+        etapas[tipo] = resumen
+    etapas["total"] = {"duracion_s": round(statistics.median(informe["duracion_s"] for informe in informes), 4)}
+    return etapas
+
+
+def comparar(resultado: Dict[str, dict], referencia: Dict[str, dict], tolerancia: float) -> List[str]:
+    """
+    Devuelve las etapas cuya duración empeoró respecto a la referencia más allá de la tolerancia.
+    """
+    regresiones = []
+    for tipo, medidas in resultado.items():
+        anterior = referencia.get(tipo, {}).get("duracion_s")
+        actual = medidas.get("duracion_s")
+        if anterior and actual and actual > anterior * (1 + tolerancia):
+            regresiones.append(f"{tipo}: {actual:.3f} s frente a {anterior:.3f} s de referencia (+{(actual / anterior - 1) * 100:.0f}%)")
+    return regresiones
+
+
+def imprimir(resultado: Dict[str, dict]) -> None:
+    print(f"{'etapa':<15}{'duracion (s)':>14}{'MB/s':>10}{'latencia (ms)':>15}{'archivos':>10}")
+    for tipo, medidas in resultado.items():
+        latencia = medidas.get("latencia_media_s")
+        print(f"{tipo:<15}{medidas['duracion_s']:>14.3f}{medidas.get('mb_s') or 0:>10.2f}"
+              f"{(latencia or 0) * 1000:>15.1f}{medidas.get('archivos') or 0:>10.0f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark del procesamiento de facturas contra un servidor SFTP local")
+    parser.add_argument("--modo", choices=MODOS, default="normal", help="Camino del proceso a medir")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Ejecuciones completas; se informa la mediana")
+    parser.add_argument("--latencia-ms", type=float, default=20.0, help="Latencia de ida y vuelta simulada")
+    parser.add_argument("--ancho-banda-mbps", type=float, default=None, help="Caudal máximo por conexión (sin límite por defecto)")
+    parser.add_argument("--archivos-por-formato", type=int, default=2, help="Comprimidos de cada formato")
+    parser.add_argument("--pdfs", type=int, default=50, help="PDF por comprimido")
+    parser.add_argument("--tamanho-pdf-kb", type=int, default=100, help="Tamaño de cada PDF en KB")
+    parser.add_argument("--formatos", default=",".join(FORMATOS), help="Formatos a generar separados por comas")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para descomprimir")
+    parser.add_argument("--salida", type=Path, default=None, help="Guarda el resultado en este JSON (para usarlo como referencia)")
+    parser.add_argument("--referencia", type=Path, default=None, help="Resultado anterior con el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="Empeoramiento relativo admitido frente a la referencia")
+    parser.add_argument("--verbose", action="store_true", help="Muestra los logs del proceso")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    periodo = fecha_mes_vencido()
+    directorio_original = Path.cwd()
+    informes = []
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_facturas_") as temporal:
+        raiz_remota = Path(temporal) / "sftp"
+        generar_comprimidos(raiz_remota, periodo, args.archivos_por_formato, args.pdfs, args.tamanho_pdf_kb,
+                            [formato.strip() for formato in args.formatos.split(",") if formato.strip()])
+        with ServidorSFTPLocal(raiz_remota, args.latencia_ms, args.ancho_banda_mbps) as servidor:
+            for repeticion in range(1, args.repeticiones + 1):
+                # Cada repetición parte de cero: sin descargas previas, sin carpeta subida y sin conexiones abiertas
+                trabajo = Path(temporal) / f"trabajo_{repeticion}"
+                trabajo.mkdir()
+                shutil.rmtree(raiz_remota / periodo, ignore_errors=True)
+                os.chdir(trabajo)
+                try:
+                    informe = InformeEjecucion(f"benchmark_{periodo}", trabajo / "logs")
+                    error = None
+                    try:
+                        # Dentro del with los bytes y archivos de cada etapa se suman al informe
+                        with informe:
+                            ejecutar_proceso(args.modo, "127.0.0.1", servidor.puerto, args.workers, informe)
+                    except Exception as e:
+                        error = e
+                    resumen = informe.resumen(error)
+                    if error:
+                        _logger.error(f"Repeticion {repeticion} fallida: {error}")
+                        return 2
+                    informes.append(resumen)
+                    print(f"Repeticion {repeticion}: {resumen['duracion_s']:.2f} s")
+                finally:
+                    cerrar_pools()
+                    os.chdir(directorio_original)
+
+    resultado = resumir(informes)
+    print(f"\nModo {args.modo}, latencia {args.latencia_ms} ms, ancho de banda {args.ancho_banda_mbps or 'sin limite'} Mbit/s, "
+          f"mediana de {len(informes)} repeticiones:")
+    imprimir(resultado)
+
+    if args.salida:
+        args.salida.write_text(json.dumps({"parametros": vars(args) | {"salida": str(args.salida), "referencia": str(args.referencia)},
+                                           "etapas": resultado}, indent=1))
+    if args.referencia:
+        regresiones = comparar(resultado, json.loads(args.referencia.read_text())["etapas"], args.tolerancia)
+        if regresiones:
+            print("\nRegresiones detectadas:")
+            for regresion in regresiones:
+                print(f"  {regresion}")
+            return 1
+        print("\nSin regresiones respecto a la referencia")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+import heapq
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+import paramiko
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface
+
+_logger = logging.getLogger(__name__)
+
+TAMANHO_LECTURA_SOCKET = 64 * 1024
+
+
+class _Autorizacion(paramiko.ServerInterface):
+    """
+    Acepta cualquier usuario y contraseña: el servidor solo se usa en benchmarks locales.
+    """
+
+    def check_auth_password(self, username: str, password: str) -> int:
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username: str) -> str:
+        return "password"
+
+    def check_channel_request(self, kind: str, chanid: int) -> int:
+        return paramiko.OPEN_SUCCEEDED
+
+
+class _Manejador(SFTPHandle):
+
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+
+class _SistemaArchivos(SFTPServerInterface):
+    """
+    Expone un directorio local como raíz del servidor SFTP.
+    """
+
+    raiz: Path = Path(".")
+
+    def _local(self, path: str) -> str:
+        return str(self.raiz) + self.canonicalize(path)
+
+    def canonicalize(self, path: str) -> str:
+        return os.path.normpath("/" + path).replace("//", "/")
+
+    def list_folder(self, path: str):
+        directorio = self._local(path)
+        try:
+            nombres = os.listdir(directorio)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        atributos = []
+        for nombre in nombres:
+            entrada = SFTPAttributes.from_stat(os.stat(os.path.join(directorio, nombre)))
+            entrada.filename = nombre
+            atributos.append(entrada)
+        return atributos
+
+    def stat(self, path: str):
+        try:
+            return SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path: str, flags: int, attr):
+        try:
+            descriptor = os.open(self._local(path), flags, 0o644)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            modo = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            modo = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            modo = "rb"
+        archivo = os.fdopen(descriptor, modo)
+        manejador = _Manejador(flags)
+        manejador.filename = path
+        manejador.readfile = archivo
+        manejador.writefile = archivo
+        return manejador
+
+    def remove(self, path: str) -> int:
+        try:
+            os.remove(self._local(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath: str, newpath: str) -> int:
+        try:
+            os.replace(self._local(oldpath), self._local(newpath))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    posix_rename = rename
+
+    def mkdir(self, path: str, attr) -> int:
+        try:
+            os.mkdir(self._local(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path: str) -> int:
+        try:
+            os.rmdir(self._local(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path: str, attr) -> int:
+        return paramiko.SFTP_OK
+
+
+class _LineaConRetardo:
+    """
+    Reenvía los bytes de un socket a otro como un enlace de red: cada trozo llega 'retardo' segundos
+    después de enviado (sin frenar a los siguientes, como un cable con latencia) y la salida no supera
+    'bytes_por_segundo'.
+    """
+
+    def __init__(self, origen: socket.socket, destino: socket.socket, retardo: float, bytes_por_segundo: Optional[float]) -> None:
+        self.origen = origen
+        self.destino = destino
+        self.retardo = retardo
+        self.bytes_por_segundo = bytes_por_segundo
+        self._pendientes: List[Tuple[float, int, bytes]] = []
+        self._condicion = threading.Condition()
+        self._cerrado = False
+        threading.Thread(target=self._leer, daemon=True).start()
+        threading.Thread(target=self._entregar, daemon=True).start()
+
+    def _leer(self) -> None:
+        secuencia = 0
+        while True:
+            try:
+                datos = self.origen.recv(TAMANHO_LECTURA_SOCKET)
+            except OSError:
+                datos = b""
+            with self._condicion:
+                if not datos:
+                    self._cerrado = True
+                else:
+                    heapq.heappush(self._pendientes, (time.monotonic() + self.retardo, secuencia, datos))
+                    secuencia += 1
+                self._condicion.notify()
+            if not datos:
+                return
+
+    def _entregar(self) -> None:
+        libre_desde = time.monotonic()
+        while True:
+            with self._condicion:
+                while not self._pendientes and not self._cerrado:
+                    self._condicion.wait()
+                if not self._pendientes:
+                    break
+                llegada, _, datos = heapq.heappop(self._pendientes)
+            espera = llegada - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            if self.bytes_por_segundo:
+                # El enlace está ocupado hasta terminar de "transmitir" el trozo anterior
+                libre_desde = max(libre_desde, time.monotonic()) + len(datos) / self.bytes_por_segundo
+                espera = libre_desde - time.monotonic()
+                if espera > 0:
+                    time.sleep(espera)
+            try:
+                self.destino.sendall(datos)
+            except OSError:
+                break
+        try:
+            self.destino.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+class ServidorSFTPLocal:
+    """
+    Servidor SFTP en proceso sobre localhost para los benchmarks, con latencia y ancho de banda
+    configurables.
+
+    Las conexiones pasan por un enlace simulado: cada sentido añade la mitad de 'latencia_ms' a cada
+    trozo de datos y limita el caudal a 'ancho_banda_mbps'. Así las mejoras que dependen de la latencia
+    (pipelining, varios canales, menos idas y vueltas) se notan igual que contra el servidor real.
+
+    Attributes:
+        raiz (Path): Directorio local que hace de raíz del servidor.
+        latencia_ms (float): Tiempo de ida y vuelta añadido, en milisegundos.
+        ancho_banda_mbps (Optional[float]): Caudal máximo por conexión y sentido en Mbit/s; None sin límite.
+        puerto (int): Puerto en el que escucha el servidor (asignado al arrancar).
+        conexiones (int): Cantidad de conexiones aceptadas (handshakes).
+    """
+
+    def __init__(self, raiz: Path, latencia_ms: float = 0.0, ancho_banda_mbps: Optional[float] = None) -> None:
+        self.raiz = Path(raiz).resolve()
+        self.latencia_ms = latencia_ms
+        self.ancho_banda_mbps = ancho_banda_mbps
+        self.puerto = 0
+        self.conexiones = 0
+        self._clave = paramiko.RSAKey.generate(2048)
+        self._socket: Optional[socket.socket] = None
+        self._transportes: List[paramiko.Transport] = []
+
+    def __enter__(self) -> "ServidorSFTPLocal":
+        self.iniciar()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.detener()
+
+    def iniciar(self) -> int:
+        """
+        Empieza a aceptar conexiones en un hilo y devuelve el puerto.
+        """
+        self._socket = socket.socket()
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.listen(50)
+        self.puerto = self._socket.getsockname()[1]
+        threading.Thread(target=self._aceptar, daemon=True).start()
+        _logger.info(f"Servidor SFTP de benchmark en 127.0.0.1:{self.puerto} (latencia {self.latencia_ms} ms, "
+                     f"ancho de banda {self.ancho_banda_mbps or 'sin limite'} Mbit/s)")
+        return self.puerto
+
+    def detener(self) -> None:
+        for transporte in self._transportes:
+            transporte.close()
+        if self._socket:
+            self._socket.close()
+
+    def _aceptar(self) -> None:
+        while True:
+            try:
+                cliente, _ = self._socket.accept()
+            except OSError:
+                return
+            self.conexiones += 1
+            threading.Thread(target=self._atender, args=(cliente,), daemon=True).start()
+
+    def _atender(self, cliente: socket.socket) -> None:
+        conexion = cliente
+        if self.latencia_ms or self.ancho_banda_mbps:
+            # El transporte del servidor usa un extremo de un par de sockets; el enlace simulado une el otro con el cliente
+            conexion, extremo = socket.socketpair()
+            retardo = self.latencia_ms / 1000 / 2
+            caudal = self.ancho_banda_mbps * 1_000_000 / 8 if self.ancho_banda_mbps else None
+            _LineaConRetardo(cliente, extremo, retardo, caudal)
+            _LineaConRetardo(extremo, cliente, retardo, caudal)
+
+        sistema = type("SistemaArchivos", (_SistemaArchivos,), {"raiz": self.raiz})
+        transporte = paramiko.Transport(conexion)
+        transporte.add_server_key(self._clave)
+        transporte.set_subsystem_handler("sftp", SFTPServer, sistema)
+        transporte.start_server(server=_Autorizacion())
+        self._transportes.append(transporte)
@@ -0,0 +1,210 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from schemas.schemas import Factura
+from subidas import ManifiestoHashes
+
+load_dotenv()
+
+_logger = logging.getLogger(__name__)
+
+# Configuración del catálogo de facturas (se puede ajustar desde el archivo .env)
+RUTA_CATALOGO = Path(os.getenv("CATALOGO_RUTA", "catalogo_facturas.sqlite3"))
+# Expresión que se busca en el nombre de cada PDF; sus grupos 'telefono' y 'cuenta' (si los tiene) se guardan en el
+# catálogo. Por defecto el teléfono (con o sin el 53 delante) y, si lo precede separado por '_', el número de cuenta
+PATRON_NOMBRE = re.compile(os.getenv("CATALOGO_PATRON_NOMBRE",
+                                     r"(?:(?<!\d)(?P<cuenta>\d+)_)?(?<!\d)(?:53)?(?P<telefono>5\d{7})(?!\d)"))
+# Máximo de facturas que devuelve una búsqueda
+LIMITE_BUSQUEDA = int(os.getenv("CATALOGO_LIMITE_BUSQUEDA", "1000"))
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS facturas (
+    periodo TEXT NOT NULL,
+    archivo TEXT NOT NULL,
+    telefono TEXT,
+    cuenta TEXT,
+    tamanho INTEGER NOT NULL,
+    sha256 TEXT,
+    ruta_local TEXT,
+    ruta_remota TEXT,
+    actualizado REAL NOT NULL,
+    PRIMARY KEY (periodo, archivo)
+);
+CREATE INDEX IF NOT EXISTS facturas_por_telefono ON facturas (telefono, periodo);
+CREATE INDEX IF NOT EXISTS facturas_por_cuenta ON facturas (cuenta, periodo);
+"""
+
+_COLUMNAS = "periodo, archivo, telefono, cuenta, tamanho, sha256, ruta_remota, actualizado"
+
+
+def identificadores(nombre: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Saca el teléfono y la cuenta del nombre de un PDF según CATALOGO_PATRON_NOMBRE.
+
+    Returns:
+        Tuple[Optional[str], Optional[str]]: Teléfono y cuenta; None si el nombre no los tiene.
+    """
+    coincidencia = PATRON_NOMBRE.search(Path(nombre).stem)
+    if coincidencia is None:
+        return None, None
+    grupos = coincidencia.groupdict()
+    return grupos.get("telefono"), grupos.get("cuenta")
+
+
+def _factura(fila: tuple) -> Factura:
+    return Factura(**dict(zip(_COLUMNAS.split(", "), fila[:-1])), actualizado=datetime.fromtimestamp(fila[-1]))
+
+
+class CatalogoFacturas:
+    """
+    Catálogo local (SQLite) de los PDF extraídos: periodo, nombre, teléfono y cuenta sacados del
+    nombre, tamaño, SHA-256, ruta local y ruta en el servidor.
+
+    Los PDF se anotan en cuanto se extraen, con su ruta local; la subida de la carpeta les completa la
+    ruta en el servidor (ver functions.subir_carpeta_a_sftp). Los del modo streaming no pasan por
+    disco y se anotan sin ruta local. Las búsquedas por periodo y nombre, por teléfono o por cuenta van
+    por índice, sin recorrer las carpetas.
+
+    Attributes:
+        ruta (Path): Archivo de la base de datos.
+    """
+
+    def __init__(self, ruta: Optional[Path] = None) -> None:
+        self.ruta = Path(ruta or RUTA_CATALOGO)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(self.ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.executescript(_ESQUEMA)
+
+    def cerrar(self) -> None:
+        self._conexion.close()
+
+    def _guardar(self, filas: List[tuple]) -> None:
+        with self._lock, self._conexion:
+            # Un PDF que no se pudo subir esta vez conserva la ruta remota de una subida anterior, y uno
+            # sin hash (streaming sin verificación por hash) el anterior si no cambió de tamaño
+            self._conexion.executemany(
+                "INSERT INTO facturas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (periodo, archivo) DO UPDATE SET "
+                "telefono = excluded.telefono, cuenta = excluded.cuenta, tamanho = excluded.tamanho, "
+                "sha256 = COALESCE(excluded.sha256, CASE WHEN facturas.tamanho = excluded.tamanho THEN facturas.sha256 END), "
+                "ruta_local = excluded.ruta_local, ruta_remota = COALESCE(excluded.ruta_remota, facturas.ruta_remota), "
+                "actualizado = excluded.actualizado", filas)
+
+    def registrar_carpeta(self, periodo: str, carpeta: Path, en_servidor: List[Path],
+                          remote_directory_path: Optional[str] = None) -> int:
+        """
+        Cataloga los PDF del primer nivel de una carpeta extraída.
+
+        El hash se toma del manifiesto local de la carpeta (el mismo de la verificación por hash de las
+        subidas), así que solo se leen los PDF nuevos o cambiados.
+
+        Args:
+            periodo (str): Periodo 'YYYYMM' de la carpeta.
+            carpeta (Path): Carpeta local con los PDF.
+            en_servidor (List[Path]): PDF de la carpeta que ya están en el servidor (ninguno al extraer).
+            remote_directory_path (Optional[str]): Directorio remoto de la carpeta, si ya se subió.
+
+        Returns:
+            int: Cantidad de PDF catalogados.
+        """
+        carpeta = Path(carpeta).resolve()
+        archivos = list(carpeta.glob("*.pdf"))
+        manifiesto = ManifiestoHashes(carpeta)
+        entradas = manifiesto.actualizar(archivos)
+        manifiesto.guardar()
+        remotos = {archivo.name for archivo in en_servidor}
+        ahora = time.time()
+        filas = [(periodo, archivo.name, *identificadores(archivo.name), entradas[archivo.name]["tamanho"],
+                  entradas[archivo.name]["sha256"], str(archivo),
+                  f"{remote_directory_path}/{archivo.name}" if archivo.name in remotos else None, ahora)
+                 for archivo in archivos]
+        self._guardar(filas)
+        _logger.info(f"{len(filas)} facturas de {periodo} en el catalogo")
+        return len(filas)
+
+    def registrar_remotos(self, periodo: str, facturas: Dict[str, dict], remote_directory_path: str) -> int:
+        """
+        Cataloga PDF que están en el servidor sin haber pasado por disco (los del modo streaming): sin
+        ruta local y con el hash calculado al subirlos, si se calculó.
+
+        Args:
+            periodo (str): Periodo 'YYYYMM' de los PDF.
+            facturas (Dict[str, dict]): Tamaño y sha256 (o None) de cada PDF, por nombre.
+            remote_directory_path (str): Directorio remoto de los PDF.
+
+        Returns:
+            int: Cantidad de PDF catalogados.
+        """
+        ahora = time.time()
+        filas = [(periodo, nombre, *identificadores(nombre), entrada["tamanho"], entrada.get("sha256"), None,
+                  f"{remote_directory_path}/{nombre}", ahora)
+                 for nombre, entrada in facturas.items()]
+        self._guardar(filas)
+        _logger.info(f"{len(filas)} facturas de {periodo} procesadas en streaming en el catalogo")
+        return len(filas)
+
+    def buscar(self, periodo: Optional[str] = None, telefono: Optional[str] = None, cuenta: Optional[str] = None,
+               archivo: Optional[str] = None, limite: int = LIMITE_BUSQUEDA) -> List[Factura]:
+        """
+        Busca facturas por cualquier combinación de periodo, teléfono, cuenta y nombre de archivo.
+
+        Args:
+            periodo (Optional[str]): Periodo 'YYYYMM'.
+            telefono (Optional[str]): Teléfono, con o sin el prefijo 53.
+            cuenta (Optional[str]): Cuenta del cliente.
+            archivo (Optional[str]): Nombre exacto del PDF.
+            limite (int): Máximo de facturas devueltas.
+
+        Returns:
+            List[Factura]: Facturas encontradas, de la más reciente a la más antigua.
+        """
+        if telefono and len(telefono) == 10 and telefono.startswith("53"):
+            telefono = telefono[2:]
+        condiciones: Dict[str, Optional[str]] = {"periodo": periodo, "telefono": telefono, "cuenta": cuenta, "archivo": archivo}
+        condiciones = {columna: valor for columna, valor in condiciones.items() if valor}
+        where = " AND ".join(f"{columna} = ?" for columna in condiciones) or "1"
+        with self._lock:
+            filas = self._conexion.execute(
+                f"SELECT {_COLUMNAS} FROM facturas WHERE {where} ORDER BY periodo DESC, archivo LIMIT ?",
+                (*condiciones.values(), max(1, min(limite, LIMITE_BUSQUEDA)))).fetchall()
+        return [_factura(fila) for fila in filas]
+
+    def ruta_local(self, periodo: str, archivo: str) -> Optional[Path]:
+        """
+        Devuelve la ruta en disco de un PDF catalogado, o None si no está en el catálogo.
+        """
+        with self._lock:
+            fila = self._conexion.execute("SELECT ruta_local FROM facturas WHERE periodo = ? AND archivo = ?",
+                                          (periodo, archivo)).fetchone()
+        return Path(fila[0]) if fila and fila[0] else None
+
+
+# Un catálogo por archivo: cada cuenta (ver cuentas.py) tiene el suyo en su directorio de trabajo
+_catalogos: Dict[Path, CatalogoFacturas] = {}
+_lock_catalogo = threading.Lock()
+
+
+def obtener_catalogo(ruta: Optional[Path] = None) -> CatalogoFacturas:
+    """
+    Devuelve el catálogo guardado en 'ruta' (por defecto CATALOGO_RUTA), abriéndolo la primera vez.
+    """
+    ruta = Path(ruta or RUTA_CATALOGO).resolve()
+    with _lock_catalogo:
+        if ruta not in _catalogos:
+            _catalogos[ruta] = CatalogoFacturas(ruta)
+        return _catalogos[ruta]
+
+
+def ruta_catalogo(directorio_trabajo: Optional[Path] = None) -> Path:
+    """
+    Devuelve la ruta del catálogo de un directorio de trabajo, o la configurada si no se indica.
+    """
+    return Path(directorio_trabajo) / RUTA_CATALOGO.name if directorio_trabajo else RUTA_CATALOGO
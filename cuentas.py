@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Callable, List, Optional
+from dotenv import load_dotenv
+from schemas.schemas import ConteoArchivos, CuentaSFTP, EstadoTrabajo
+from functions import (ejecutar_archivos_nuevos, ejecutar_backfill, ejecutar_descompactar_facturas, fecha_mes_vencido,
+                       rango_periodos)
+from pool_sftp import usar_pool
+from trabajos import GestorTrabajos, Progreso
+from vigilancia_remota import VigilanteRemoto
+
+load_dotenv()
+
+_logger = logging.getLogger(__name__)
+
+# Configuración del procesamiento de varias cuentas (se puede ajustar desde el archivo .env)
+ARCHIVO_CUENTAS = Path(os.getenv("CUENTAS_ARCHIVO", "cuentas.json"))
+# Cuentas que se procesan a la vez; las conexiones y el ancho de banda se limitan aparte (ver pool_sftp.py)
+CUENTAS_SIMULTANEAS = int(os.getenv("CUENTAS_SIMULTANEAS", "2"))
+
+
+def cargar_cuentas(ruta: Optional[Path] = None) -> List[CuentaSFTP]:
+    """
+    Lee las cuentas SFTP de un archivo JSON con una lista de objetos con los campos de CuentaSFTP.
+
+    Args:
+        ruta (Optional[Path]): Archivo de cuentas. Por defecto CUENTAS_ARCHIVO.
+
+    Returns:
+        List[CuentaSFTP]: Cuentas en el orden del archivo, con las contraseñas ya resueltas.
+
+    Raises:
+        ValueError: Si el archivo no es válido, se repite un nombre o dos cuentas usan el mismo
+            servidor, usuario y directorio remoto (compartirían pool de conexiones, listado remoto y
+            carpetas de subida). Con directorios remotos distintos sí pueden compartir servidor y usuario.
+    """
+    ruta = Path(ruta or ARCHIVO_CUENTAS)
+    try:
+        datos = json.loads(ruta.read_text())
+    except ValueError as e:
+        raise ValueError(f"Archivo de cuentas {ruta} ilegible: {e}")
+    if not isinstance(datos, list) or not datos:
+        raise ValueError(f"El archivo de cuentas {ruta} debe tener una lista de cuentas")
+
+    cuentas = [CuentaSFTP(**dato) for dato in datos]
+    nombres, servidores = set(), set()
+    for cuenta in cuentas:
+        cuenta.password = os.path.expandvars(cuenta.password)
+        servidor = (cuenta.host, cuenta.port, cuenta.username, cuenta.directorio_remoto)
+        if cuenta.nombre in nombres:
+            raise ValueError(f"Cuenta repetida en {ruta}: {cuenta.nombre}")
+        if servidor in servidores:
+            raise ValueError(f"La cuenta {cuenta.nombre} repite servidor, usuario y directorio remoto: "
+                             f"{cuenta.username}@{cuenta.host}:{cuenta.port}:{cuenta.directorio_remoto}")
+        nombres.add(cuenta.nombre)
+        servidores.add(servidor)
+    return cuentas
+
+
+def directorio_trabajo(cuenta: CuentaSFTP) -> Path:
+    """
+    Devuelve el directorio local de la cuenta: descargas, registro de ejecuciones e informes.
+    """
+    return Path(cuenta.directorio_trabajo or Path("cuentas") / cuenta.nombre)
+
+
+def procesar_cuenta(cuenta: CuentaSFTP, desde: Optional[str] = None, hasta: Optional[str] = None,
+                    workers: Optional[int] = None, progreso: Optional[Progreso] = None) -> None:
+    """
+    Procesa una cuenta con el proceso de siempre (el mes vencido, o un backfill si se indica 'desde'),
+    trabajando en su directorio remoto y en su directorio local.
+
+    Cada cuenta tiene su propio pool de conexiones (uno por directorio remoto), listado remoto,
+    registro de ejecuciones y manifiestos, así que no comparte estado con las demás. Al terminar se
+    libera su pool, que se cierra si ningún otro trabajo lo usa, para que las conexiones queden
+    libres para la siguiente cuenta (ver SFTP_CONEXIONES_MAX).
+
+    Args:
+        cuenta (CuentaSFTP): Cuenta a procesar.
+        desde (Optional[str]): Primer periodo 'YYYYMM' del backfill; si no se indica, el mes vencido.
+        hasta (Optional[str]): Último periodo 'YYYYMM' del backfill. Por defecto igual a 'desde'.
+        workers (Optional[int]): Procesos usados para descomprimir.
+        progreso (Optional[Progreso]): Donde se reporta la etapa y el avance de la cuenta.
+    """
+    trabajo = directorio_trabajo(cuenta)
+    trabajo.mkdir(parents=True, exist_ok=True)
+    _logger.info(f"Cuenta {cuenta.nombre}: {cuenta.username}@{cuenta.host}:{cuenta.port}:{cuenta.directorio_remoto}, "
+                 f"trabajando en {trabajo}")
+    # Dentro del bloque las etapas del proceso toman el pool que abre cada canal en el directorio remoto de la cuenta
+    with usar_pool(cuenta.host, cuenta.port, cuenta.username, cuenta.password, cuenta.directorio_remoto):
+        if desde:
+            ejecutar_backfill(cuenta.host, cuenta.port, cuenta.username, cuenta.password, desde, hasta or desde,
+                              workers=workers, progreso=progreso, directorio_trabajo=trabajo)
+        else:
+            ejecutar_descompactar_facturas(cuenta.host, cuenta.port, cuenta.username, cuenta.password,
+                                           workers=workers, progreso=progreso, directorio_trabajo=trabajo)
+
+
+def procesar_archivos_nuevos(cuenta: CuentaSFTP, periodo: str, archivos: List[str], conteo_archivos: ConteoArchivos,
+                             workers: Optional[int] = None, progreso: Optional[Progreso] = None) -> None:
+    """
+    Procesa los comprimidos nuevos de una cuenta que detectó su vigilante, en su directorio remoto y
+    en su directorio local, igual que procesar_cuenta.
+
+    Args:
+        cuenta (CuentaSFTP): Cuenta de los comprimidos.
+        periodo (str): Periodo 'YYYYMM' de los comprimidos.
+        archivos (List[str]): Comprimidos a procesar.
+        conteo_archivos (ConteoArchivos): Listado remoto del que salen el tamaño y la fecha de cada comprimido.
+        workers (Optional[int]): Procesos usados para descomprimir.
+        progreso (Optional[Progreso]): Donde se reporta la etapa y el avance si el proceso corre como trabajo.
+    """
+    trabajo = directorio_trabajo(cuenta)
+    trabajo.mkdir(parents=True, exist_ok=True)
+    with usar_pool(cuenta.host, cuenta.port, cuenta.username, cuenta.password, cuenta.directorio_remoto):
+        ejecutar_archivos_nuevos(cuenta.host, cuenta.port, cuenta.username, cuenta.password, periodo, archivos,
+                                 conteo_archivos, workers=workers, progreso=progreso, directorio_trabajo=trabajo)
+
+
+def vigilante_cuenta(cuenta: CuentaSFTP, procesar: Optional[Callable[[str, List[str], ConteoArchivos], None]] = None,
+                     **opciones) -> VigilanteRemoto:
+    """
+    Crea el vigilante de una cuenta: sondea su directorio remoto, consulta su registro de ejecuciones y
+    procesa lo nuevo en su directorio de trabajo.
+
+    Args:
+        cuenta (CuentaSFTP): Cuenta a vigilar.
+        procesar (Optional[Callable]): Lo que se hace con los comprimidos nuevos de un periodo. Por defecto
+            se procesan en el mismo hilo con procesar_archivos_nuevos.
+        **opciones: Resto de parámetros de VigilanteRemoto (desde, estable, reintento).
+
+    Returns:
+        VigilanteRemoto: Vigilante de la cuenta, sin arrancar.
+    """
+    trabajo = directorio_trabajo(cuenta)
+    trabajo.mkdir(parents=True, exist_ok=True)
+    procesar = procesar or (lambda periodo, archivos, conteo_archivos:
+                            procesar_archivos_nuevos(cuenta, periodo, archivos, conteo_archivos))
+    return VigilanteRemoto(cuenta.host, cuenta.port, cuenta.username, cuenta.password, procesar=procesar,
+                           directorio_remoto=cuenta.directorio_remoto, directorio_trabajo=trabajo, **opciones)
+
+
+def iniciar_cuentas(gestor: GestorTrabajos, cuentas: List[CuentaSFTP], desde: Optional[str] = None,
+                    hasta: Optional[str] = None, workers: Optional[int] = None) -> List[EstadoTrabajo]:
+    """
+    Lanza un trabajo por cuenta en el gestor. Cada trabajo ocupa los periodos de su cuenta, así que un
+    mes de una cuenta no se procesa dos veces a la vez pero cuentas distintas sí corren en paralelo.
+
+    Returns:
+        List[EstadoTrabajo]: Trabajo de cada cuenta, con su etapa y su avance.
+    """
+    periodos = rango_periodos(desde, hasta or desde) if desde else [fecha_mes_vencido()]
+    return [gestor.iniciar(periodos, procesar_cuenta, cuenta, desde, hasta, workers, cuenta=cuenta.nombre)
+            for cuenta in cuentas]
+
+
+def ejecutar_cuentas(cuentas: List[CuentaSFTP], simultaneas: Optional[int] = None, desde: Optional[str] = None,
+                     hasta: Optional[str] = None, workers: Optional[int] = None) -> List[EstadoTrabajo]:
+    """
+    Procesa varias cuentas a la vez, como mucho 'simultaneas', y espera a que terminen todas.
+
+    Args:
+        cuentas (List[CuentaSFTP]): Cuentas a procesar.
+        simultaneas (Optional[int]): Cuentas procesándose a la vez. Por defecto CUENTAS_SIMULTANEAS.
+        desde (Optional[str]): Primer periodo 'YYYYMM' del backfill; si no se indica, el mes vencido.
+        hasta (Optional[str]): Último periodo 'YYYYMM' del backfill.
+        workers (Optional[int]): Procesos usados para descomprimir en cada cuenta.
+
+    Returns:
+        List[EstadoTrabajo]: Estado final del trabajo de cada cuenta.
+
+    Raises:
+        RuntimeError: Si alguna cuenta falló (las demás se procesan igual).
+    """
+    gestor = GestorTrabajos(workers=simultaneas or CUENTAS_SIMULTANEAS)
+    try:
+        trabajos = gestor.esperar(iniciar_cuentas(gestor, cuentas, desde, hasta, workers))
+    finally:
+        gestor.cerrar()
+    for trabajo in trabajos:
+        _logger.info(f"Cuenta {trabajo.cuenta} ({trabajo.periodo}): {trabajo.estado}, {trabajo.archivos_procesados} archivos, "
+                     f"{trabajo.bytes_transferidos / 1024 / 1024:.1f} MB")
+    fallidas = [trabajo.cuenta for trabajo in trabajos if trabajo.estado == "fallido"]
+    if fallidas:
+        raise RuntimeError(f"No se pudieron procesar las cuentas: {fallidas}")
+    return trabajos
@@ -0,0 +1,406 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from pool_sftp import PoolSFTP, LIMITE_ANCHO_BANDA
+from trabajos import Progreso
+from metricas import registrar_bytes, contar_archivo, registrar_error, propagar_contexto
+from log_configuration import por_archivo
+
+load_dotenv()
+
+_logger = logging.getLogger(__name__)
+
+# Configuración del motor de descargas (se puede ajustar desde el archivo .env)
+CONCURRENCIA_DESCARGA = int(os.getenv("DESCARGA_CONCURRENCIA", "4"))
+TAMANHO_BLOQUE_DESCARGA = int(os.getenv("DESCARGA_TAMANHO_BLOQUE_MB", "32")) * 1024 * 1024
+# Tamaño de cada lectura pedida con readv dentro de un bloque
+TAMANHO_LECTURA = 1024 * 1024
+# El manifiesto se guarda tras esta cantidad de bloques nuevos o estos segundos, lo que llegue antes
+GUARDAR_MANIFIESTO_BLOQUES = int(os.getenv("DESCARGA_MANIFIESTO_BLOQUES", "16"))
+GUARDAR_MANIFIESTO_S = float(os.getenv("DESCARGA_MANIFIESTO_S", "5"))
+SUFIJO_PARCIAL = ".parte"
+
+
+def planificar_bloques(tamanho: int, tamanho_bloque: int) -> List[Tuple[int, int]]:
+    """
+    Divide un archivo en rangos de bytes (offset, longitud) de como máximo tamanho_bloque.
+
+    Args:
+        tamanho (int): Tamaño total del archivo en bytes.
+        tamanho_bloque (int): Tamaño máximo de cada rango.
+
+    Returns:
+        List[Tuple[int, int]]: Lista de rangos. Un archivo vacío produce un único rango vacío.
+    """
+    if tamanho == 0:
+        return [(0, 0)]
+    return [(offset, min(tamanho_bloque, tamanho - offset)) for offset in range(0, tamanho, tamanho_bloque)]
+
+
+def descargar_bloque(pool: PoolSFTP, remote_file_path: str, local_file_path: Path, offset: int, longitud: int) -> int:
+    """
+    Descarga un rango de bytes de un archivo remoto y lo escribe en la misma posición del archivo local.
+
+    Las lecturas se piden en paralelo con readv (prefetch de paramiko), por lo que el rango
+    completo viaja sin esperar un viaje de ida y vuelta por cada lectura.
+
+    Args:
+        pool (PoolSFTP): Pool de donde se toma el canal SFTP.
+        remote_file_path (str): Ruta del archivo en el servidor SFTP.
+        local_file_path (Path): Archivo local ya creado con su tamaño final.
+        offset (int): Posición inicial del rango.
+        longitud (int): Cantidad de bytes del rango.
+
+    Returns:
+        int: Cantidad de bytes escritos.
+    """
+    if longitud == 0:
+        return 0
+    lecturas = planificar_bloques(longitud, TAMANHO_LECTURA)
+    escritos = 0
+    # Con límite de ancho de banda cada lectura se pide después de reservar su turno; si no, todo el rango de una vez
+    lotes = [[lectura] for lectura in lecturas] if LIMITE_ANCHO_BANDA.activo else [lecturas]
+    with pool.sesion() as sftp:
+        with sftp.open(remote_file_path, "rb") as remoto, open(local_file_path, "r+b") as local:
+            local.seek(offset)
+            for lote in lotes:
+                LIMITE_ANCHO_BANDA.consumir(sum(tamanho for _, tamanho in lote))
+                for datos in remoto.readv([(offset + inicio, tamanho) for inicio, tamanho in lote]):
+                    local.write(datos)
+                    escritos += len(datos)
+    if escritos != longitud:
+        raise IOError(f"Bloque incompleto de {remote_file_path} en offset {offset}: {escritos} de {longitud} bytes")
+    return escritos
+
+
+def calcular_sha256(file_path: Path) -> str:
+    """
+    Calcula el hash SHA-256 de un archivo leyéndolo por partes.
+
+    Args:
+        file_path (Path): Ruta del archivo.
+
+    Returns:
+        str: Hash en hexadecimal.
+    """
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for datos in iter(lambda: f.read(TAMANHO_LECTURA), b""):
+            h.update(datos)
+    return h.hexdigest()
+
+
+class ManifiestoDescargas:
+    """
+    Registro local de las descargas hechas en un directorio, guardado como JSON junto a los archivos.
+
+    Por cada archivo se anota el tamaño y la fecha de modificación remotos, el tamaño de bloque usado,
+    los bloques ya escritos y, al terminar, el hash SHA-256 del archivo local. Con eso una descarga
+    cortada se retoma desde los bloques que faltan y un archivo solo se vuelve a descargar si cambió
+    en el servidor.
+
+    Los hilos de descarga anotan bloques a la vez, así que toda modificación de las entradas pasa por
+    los métodos de la clase, bajo el mismo lock con que se serializa el JSON. Los bloques no se
+    guardan uno a uno: el archivo se reescribe cada GUARDAR_MANIFIESTO_BLOQUES bloques o cada
+    GUARDAR_MANIFIESTO_S segundos, y al final de la descarga. Si el proceso se corta antes, solo se
+    vuelven a pedir los bloques que no llegaron a guardarse.
+
+    Attributes:
+        ruta (Path): Ruta del archivo JSON del manifiesto.
+        entradas (Dict[str, dict]): Estado de cada archivo, por nombre. Solo lectura fuera de la clase.
+    """
+
+    NOMBRE = ".manifiesto_descargas.json"
+
+    def __init__(self, destino: Path) -> None:
+        self.ruta = Path(destino) / self.NOMBRE
+        self._lock = threading.Lock()
+        self._sin_guardar = 0
+        self._guardado = time.monotonic()
+        try:
+            self.entradas: Dict[str, dict] = json.loads(self.ruta.read_text())
+        except FileNotFoundError:
+            self.entradas = {}
+        except ValueError as e:
+            _logger.warning(f"Manifiesto de descargas ilegible, se ignora: {e}")
+            self.entradas = {}
+
+    def guardar(self) -> None:
+        """
+        Escribe el manifiesto en disco de forma atómica.
+        """
+        with self._lock:
+            self._guardar()
+
+    def _guardar(self) -> None:
+        # Se llama con el lock tomado
+        temporal = self.ruta.with_suffix(".tmp")
+        temporal.write_text(json.dumps(self.entradas, indent=1))
+        temporal.replace(self.ruta)
+        self._sin_guardar = 0
+        self._guardado = time.monotonic()
+
+    def entrada(self, archivo: str) -> Optional[dict]:
+        """
+        Devuelve una copia de la entrada de un archivo, o None si no está en el manifiesto.
+        """
+        with self._lock:
+            entrada = self.entradas.get(archivo)
+            return dict(entrada, bloques_completos=list(entrada["bloques_completos"])) if entrada else None
+
+    def reiniciar(self, archivo: str, tamanho: int, mtime: int, tamanho_bloque: int) -> None:
+        """
+        Crea (o reemplaza) la entrada de un archivo sin ningún bloque descargado.
+        """
+        with self._lock:
+            self.entradas[archivo] = {"tamanho": tamanho, "mtime": mtime, "bloque": tamanho_bloque,
+                                      "bloques_completos": [], "completo": False}
+
+    def actualizar(self, archivo: str, **campos) -> None:
+        """
+        Cambia campos de la entrada de un archivo.
+        """
+        with self._lock:
+            self.entradas[archivo].update(campos)
+
+    def finalizar(self, archivo: str, sha256: str, mtime_local: int) -> None:
+        """
+        Marca un archivo como completo con el hash y la fecha de modificación de la copia local.
+        """
+        self.actualizar(archivo, sha256=sha256, mtime_local=mtime_local, completo=True, bloques_completos=[])
+
+    def marcar_bloque(self, archivo: str, offset: int) -> None:
+        """
+        Anota un bloque escrito y guarda el manifiesto si toca (ver GUARDAR_MANIFIESTO_BLOQUES).
+        """
+        with self._lock:
+            self.entradas[archivo]["bloques_completos"].append(offset)
+            self._sin_guardar += 1
+            if (self._sin_guardar >= GUARDAR_MANIFIESTO_BLOQUES
+                    or time.monotonic() - self._guardado >= GUARDAR_MANIFIESTO_S):
+                self._guardar()
+
+
+def descargar_archivos_paralelo(pool: PoolSFTP, archivos: List[str], destino: Path,
+                                concurrencia: Optional[int] = None,
+                                tamanho_bloque: Optional[int] = None,
+                                progreso: Optional[Progreso] = None) -> List[str]:
+    """
+    Descarga varios archivos a la vez desde el servidor SFTP, dividiendo los grandes en bloques
+    que se leen en paralelo por canales distintos del pool y se reensamblan en disco.
+
+    Cada archivo se escribe primero con el sufijo '.parte' y solo se renombra a su nombre final
+    cuando todos sus bloques llegaron completos. El avance se guarda en un ManifiestoDescargas:
+
+    - Si el archivo ya está completo y su tamaño y fecha remotos no cambiaron, se omite.
+    - Si hay una descarga a medias del mismo archivo remoto, solo se piden los bloques que faltan.
+    - Si el archivo cambió en el servidor, se descarta lo local y se descarga de nuevo.
+
+    Args:
+        pool (PoolSFTP): Pool de conexiones SFTP.
+        archivos (List[str]): Nombres de los archivos remotos a descargar.
+        destino (Path): Directorio local de descarga.
+        concurrencia (Optional[int]): Cantidad de bloques descargándose a la vez.
+        tamanho_bloque (Optional[int]): Tamaño máximo en bytes de cada bloque.
+        progreso (Optional[Progreso]): Donde se suman los bytes y archivos descargados.
+
+    Returns:
+        List[str]: Nombres de los archivos descargados satisfactoriamente en esta ejecución.
+    """
+    concurrencia = concurrencia or CONCURRENCIA_DESCARGA
+    tamanho_bloque = tamanho_bloque or TAMANHO_BLOQUE_DESCARGA
+    destino = Path(destino)
+    manifiesto, pendientes = planificar_descargas(pool, archivos, destino, tamanho_bloque)
+    if not pendientes:
+        return []
+
+    inicio = time.monotonic()
+    total_bytes = sum(longitud for bloques in pendientes.values() for _, longitud in bloques)
+    _logger.info(f"Descargando {len(pendientes)} archivos ({total_bytes / 1024 / 1024:.1f} MB pendientes) con {concurrencia} flujos en paralelo")
+
+    descargados = []
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        futuros = {executor.submit(propagar_contexto(descargar_bloque_registrado), pool, manifiesto, archivo, destino, offset, longitud, progreso): archivo
+                   for archivo, bloques in pendientes.items() for offset, longitud in bloques}
+
+        restantes = {archivo: len(bloques) for archivo, bloques in pendientes.items()}
+        fallidos = set()
+        for futuro in as_completed(futuros):
+            archivo = futuros[futuro]
+            try:
+                futuro.result()
+            except Exception as e:
+                if archivo not in fallidos:
+                    _logger.error(f"Error descargando el archivo: {archivo}: {e}")
+                fallidos.add(archivo)
+            restantes[archivo] -= 1
+            if restantes[archivo] == 0 and archivo not in fallidos:
+                completar_descarga(manifiesto, archivo, destino, progreso)
+                descargados.append(archivo)
+    manifiesto.guardar()
+
+    registrar_resumen(len(descargados), len(pendientes), total_bytes, time.monotonic() - inicio)
+    return descargados
+
+
+def planificar_descargas(pool: PoolSFTP, archivos: List[str], destino: Path,
+                         tamanho_bloque: int) -> Tuple[ManifiestoDescargas, Dict[str, List[Tuple[int, int]]]]:
+    """
+    Consulta el tamaño y la fecha remotos de cada archivo y decide, con el manifiesto, qué bloques faltan.
+
+    Args:
+        pool (PoolSFTP): Pool de conexiones SFTP.
+        archivos (List[str]): Nombres de los archivos remotos a descargar.
+        destino (Path): Directorio local de descarga.
+        tamanho_bloque (int): Tamaño máximo en bytes de cada bloque.
+
+    Returns:
+        Tuple[ManifiestoDescargas, Dict[str, List[Tuple[int, int]]]]: Manifiesto cargado y bloques pendientes por archivo.
+    """
+    manifiesto = ManifiestoDescargas(destino)
+    pendientes: Dict[str, List[Tuple[int, int]]] = {}
+    with pool.sesion() as sftp:
+        for archivo in archivos:
+            try:
+                atributos = sftp.stat(archivo)
+            except IOError as e:
+                _logger.error(f"No se pudo consultar el archivo remoto {archivo}: {e}")
+                continue
+            bloques = _planificar_archivo(manifiesto, archivo, atributos.st_size, int(atributos.st_mtime or 0),
+                                          destino, tamanho_bloque)
+            if bloques:
+                pendientes[archivo] = bloques
+    manifiesto.guardar()
+    return manifiesto, pendientes
+
+
+def descargar_bloque_registrado(pool: PoolSFTP, manifiesto: ManifiestoDescargas, archivo: str, destino: Path,
+                                offset: int, longitud: int, progreso: Optional[Progreso] = None) -> int:
+    """
+    Descarga un bloque en el '.parte' del archivo y lo anota en el manifiesto y en el progreso.
+
+    Returns:
+        int: Cantidad de bytes escritos.
+    """
+    inicio = time.monotonic()
+    try:
+        escritos = descargar_bloque(pool, archivo, destino / (archivo + SUFIJO_PARCIAL), offset, longitud)
+    except Exception:
+        registrar_error("descarga")
+        raise
+    registrar_bytes("descarga", escritos, time.monotonic() - inicio)
+    manifiesto.marcar_bloque(archivo, offset)
+    if progreso:
+        progreso.sumar(bytes_transferidos=escritos)
+    return escritos
+
+
+def completar_descarga(manifiesto: ManifiestoDescargas, archivo: str, destino: Path, progreso: Optional[Progreso] = None) -> None:
+    """
+    Cierra la descarga de un archivo cuyos bloques llegaron todos: lo renombra y guarda su hash.
+    """
+    _finalizar_archivo(manifiesto, archivo, destino)
+    contar_archivo("descarga")
+    if progreso:
+        progreso.sumar(archivos=1)
+    _logger.info("%s descargado satisfactoriamente", archivo, extra=por_archivo("descarga"))
+
+
+def comprobar_descarga(archivos: List[str], destino: Path) -> None:
+    """
+    Comprueba que todos los archivos pedidos quedaron completos en el directorio de descarga.
+
+    Raises:
+        IOError: Si falta alguno; los bloques ya descargados quedan en el manifiesto para retomarlo.
+    """
+    faltantes = [archivo for archivo in archivos if not (Path(destino) / archivo).is_file()]
+    if faltantes:
+        raise IOError(f"No se pudieron descargar {len(faltantes)} de {len(archivos)} archivos: {', '.join(faltantes)}")
+
+
+def registrar_resumen(descargados: int, total: int, total_bytes: int, duracion: float) -> None:
+    _logger.info(f"Descarga terminada: {descargados}/{total} archivos, "
+                 f"{total_bytes / 1024 / 1024:.1f} MB en {duracion:.1f} s "
+                 f"({total_bytes / 1024 / 1024 / max(duracion, 1e-6):.1f} MB/s)")
+
+
+def _planificar_archivo(manifiesto: ManifiestoDescargas, archivo: str, tamanho: int, mtime: int,
+                        destino: Path, tamanho_bloque: int) -> List[Tuple[int, int]]:
+    """
+    Decide qué bloques de un archivo hay que descargar según el manifiesto y lo que hay en disco.
+
+    Returns:
+        List[Tuple[int, int]]: Bloques pendientes; lista vacía si el archivo ya está completo.
+    """
+    local_file_path = destino / archivo
+    parcial = destino / (archivo + SUFIJO_PARCIAL)
+    entrada = manifiesto.entrada(archivo)
+    mismo_remoto = entrada is not None and entrada["tamanho"] == tamanho and entrada["mtime"] == mtime
+
+    if local_file_path.exists():
+        estado_local = local_file_path.stat()
+        if mismo_remoto and entrada.get("completo") and estado_local.st_size == tamanho:
+            # Solo se recalcula el hash si el archivo local se tocó después de verificarlo
+            if entrada.get("mtime_local") != int(estado_local.st_mtime):
+                if calcular_sha256(local_file_path) != entrada.get("sha256"):
+                    _logger.warning(f"El hash de {local_file_path} no coincide con el manifiesto, se descarga de nuevo")
+                    return _reiniciar_archivo(manifiesto, archivo, tamanho, mtime, destino, tamanho_bloque)
+                manifiesto.actualizar(archivo, mtime_local=int(estado_local.st_mtime))
+            _logger.info("El archivo ya existe en el directorio de descarga y no cambio en el servidor, se omite: %s",
+                         local_file_path, extra=por_archivo("descarga"))
+            return []
+        if entrada is None and estado_local.st_size == tamanho:
+            # Archivo descargado antes de existir el manifiesto: se adopta tal cual
+            _logger.info("Registrando en el manifiesto el archivo ya descargado: %s", local_file_path, extra=por_archivo("descarga"))
+            manifiesto.reiniciar(archivo, tamanho, mtime, tamanho_bloque)
+            _finalizar_archivo(manifiesto, archivo, destino, renombrar=False)
+            return []
+        _logger.warning(f"El archivo {local_file_path} cambio en el servidor o esta incompleto, se descarga de nuevo")
+        return _reiniciar_archivo(manifiesto, archivo, tamanho, mtime, destino, tamanho_bloque)
+
+    if (mismo_remoto and not entrada.get("completo") and entrada.get("bloque") == tamanho_bloque
+            and parcial.exists() and parcial.stat().st_size == tamanho):
+        completos = set(entrada["bloques_completos"])
+        bloques = [b for b in planificar_bloques(tamanho, tamanho_bloque) if b[0] not in completos]
+        faltan = sum(longitud for _, longitud in bloques)
+        _logger.info(f"Retomando descarga de {archivo}: faltan {faltan / 1024 / 1024:.1f} de {tamanho / 1024 / 1024:.1f} MB")
+        if not bloques:
+            _finalizar_archivo(manifiesto, archivo, destino)
+        return bloques
+
+    return _reiniciar_archivo(manifiesto, archivo, tamanho, mtime, destino, tamanho_bloque)
+
+
+def _reiniciar_archivo(manifiesto: ManifiestoDescargas, archivo: str, tamanho: int, mtime: int,
+                       destino: Path, tamanho_bloque: int) -> List[Tuple[int, int]]:
+    """
+    Prepara una descarga desde cero: descarta lo local, reserva el '.parte' y reinicia su entrada.
+
+    Returns:
+        List[Tuple[int, int]]: Todos los bloques del archivo.
+    """
+    (destino / archivo).unlink(missing_ok=True)
+    parcial = destino / (archivo + SUFIJO_PARCIAL)
+    # Reservar el archivo con su tamaño final para que cada bloque escriba en su posición
+    with open(parcial, "wb") as f:
+        f.truncate(tamanho)
+    manifiesto.reiniciar(archivo, tamanho, mtime, tamanho_bloque)
+    return planificar_bloques(tamanho, tamanho_bloque)
+
+
+def _finalizar_archivo(manifiesto: ManifiestoDescargas, archivo: str, destino: Path, renombrar: bool = True) -> None:
+    """
+    Renombra el '.parte' a su nombre final y anota el hash del archivo en el manifiesto.
+    """
+    local_file_path = destino / archivo
+    if renombrar:
+        (destino / (archivo + SUFIJO_PARCIAL)).replace(local_file_path)
+    # El hash se calcula fuera del lock del manifiesto: los demás bloques siguen anotándose mientras tanto
+    manifiesto.finalizar(archivo, calcular_sha256(local_file_path), int(local_file_path.stat().st_mtime))
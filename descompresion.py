@@ -0,0 +1,860 @@
+import fnmatch
+import json
+from abc import ABC, abstractmethod
+import logging
+import os
+import re
+import shutil
+import struct
+import subprocess
+import time
+import zipfile
+import rarfile
+import tarfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from dotenv import load_dotenv
+from descargas import ManifiestoDescargas
+from trabajos import Progreso
+from metricas import registrar_archivo, registrar_error
+from log_configuration import cola_para_procesos, inicializar_proceso
+
+# python-isal es opcional: si está instalado, los tar.gz se descomprimen con ISA-L en lugar de zlib
+try:
+    from isal import igzip
+except ImportError:
+    igzip = None
+try:
+    from isal import igzip_threaded
+except ImportError:
+    igzip_threaded = None
+
+load_dotenv()
+
+_logger = logging.getLogger(__name__)
+
+# Procesos usados para descomprimir (se puede ajustar desde el archivo .env o con --workers)
+WORKERS_DESCOMPRESION = int(os.getenv("DESCOMPRESION_WORKERS", "0")) or os.cpu_count() or 1
+# Buffer de copia al extraer cada miembro: escrituras grandes en lugar de las de 64 KB de extractall
+BUFFER_EXTRACCION = int(float(os.getenv("DESCOMPRESION_BUFFER_MB", "4")) * 1024 * 1024)
+# Memoria máxima que puede usar la copia de un miembro, por grande que sea el miembro o el buffer configurado
+MEMORIA_MAXIMA_MIEMBRO = int(float(os.getenv("DESCOMPRESION_MEMORIA_MIEMBRO_MB", "16")) * 1024 * 1024)
+# fsync de cada archivo extraído. Sin él un corte de luz puede dejar archivos incompletos, que la
+# siguiente ejecución vuelve a extraer porque su tamaño no coincide con el del comprimido
+FSYNC_EXTRACCION = os.getenv("DESCOMPRESION_FSYNC", "").lower() in ("1", "true", "si")
+SUFIJO_EXTRAYENDO = ".extrayendo"
+# Tamaño de cada lectura del miembro descomprimido; el buffer de escritura se llena con varias
+LECTURA_MIEMBRO = 256 * 1024
+
+
+class FiltroMiembros:
+    """
+    Decide qué miembros de un comprimido se extraen, a partir de su nombre en el índice del comprimido.
+
+    Cada patrón es un glob (por ejemplo '*.pdf' o 'facturas/*') que se compara con la ruta completa
+    del miembro y con su nombre, o una expresión regular si empieza por 're:'. Un miembro se extrae
+    si cumple algún patrón de 'incluir' y ninguno de 'excluir'. Las comparaciones distinguen
+    mayúsculas, igual que la subida, que solo busca '*.pdf'.
+
+    Attributes:
+        incluir (List[str]): Patrones de los miembros que se extraen.
+        excluir (List[str]): Patrones de los miembros que se omiten aunque cumplan 'incluir'.
+    """
+
+    def __init__(self, incluir: Sequence[str] = ("*.pdf",), excluir: Sequence[str] = ()) -> None:
+        self.incluir = list(incluir)
+        self.excluir = list(excluir)
+        self._incluir = [self._compilar(patron) for patron in self.incluir]
+        self._excluir = [self._compilar(patron) for patron in self.excluir]
+
+    @staticmethod
+    def _compilar(patron: str) -> Tuple[bool, "re.Pattern[str]"]:
+        if patron.startswith("re:"):
+            return True, re.compile(patron[3:])
+        return False, re.compile(fnmatch.translate(patron))
+
+    @staticmethod
+    def _cumple(patrones: List[Tuple[bool, "re.Pattern[str]"]], nombre: str) -> bool:
+        base = nombre.rsplit("/", 1)[-1]
+        return any(patron.search(nombre) if es_regex else (patron.match(nombre) or patron.match(base))
+                   for es_regex, patron in patrones)
+
+    @classmethod
+    def desde_texto(cls, incluir: str, excluir: str = "") -> "FiltroMiembros":
+        """
+        Crea el filtro a partir de listas de patrones separados por comas (como en el archivo .env).
+        """
+        return cls([patron.strip() for patron in incluir.split(",") if patron.strip()],
+                   [patron.strip() for patron in excluir.split(",") if patron.strip()])
+
+    def __call__(self, nombre: str) -> bool:
+        return self._cumple(self._incluir, nombre) and not self._cumple(self._excluir, nombre)
+
+    def __repr__(self) -> str:
+        return f"FiltroMiembros(incluir={self.incluir}, excluir={self.excluir})"
+
+
+# Miembros que se extraen: patrones glob o 're:<expresion>' separados por comas (se puede ajustar desde el archivo .env)
+FILTRO_MIEMBROS = FiltroMiembros.desde_texto(os.getenv("DESCOMPRESION_INCLUIR", "*.pdf"),
+                                            os.getenv("DESCOMPRESION_EXCLUIR", ""))
+
+
+def _ruta_destino(output_dir: Path, nombre: str) -> Path:
+    """
+    Devuelve la ruta de extracción de un miembro, sin permitir que salga del directorio de salida.
+
+    Raises:
+        ValueError: Si el nombre del miembro apunta fuera de output_dir (rutas absolutas o con '..').
+    """
+    partes = [parte for parte in nombre.replace('\\', '/').split('/') if parte not in ('', '.')]
+    if not partes or '..' in partes:
+        raise ValueError(f"Nombre de miembro no valido: {nombre}")
+    return Path(output_dir).joinpath(*partes)
+
+
+def _aconsejar(fd: int, consejo: str) -> None:
+    """
+    Llama a os.posix_fadvise si el sistema lo soporta; es solo una pista para el kernel.
+    """
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, 0, 0, getattr(os, consejo))
+        except OSError:
+            pass
+
+
+def _preasignar(fd: int, tamanho: int) -> None:
+    """
+    Reserva de una vez el espacio del archivo de salida para que quede contiguo en disco. Si el
+    sistema de archivos no lo soporta se sigue sin reservar; si no hay espacio se falla antes de escribir.
+    """
+    if tamanho <= 0 or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(fd, 0, tamanho)
+    except OSError as e:
+        if e.errno == 28:  # ENOSPC
+            raise
+
+
+def _escribir_miembro(destino: Path, tamanho: int, copiar) -> int:
+    """
+    Escribe un miembro en un temporal oculto junto a su destino y lo renombra al terminar, de modo que
+    nunca queda en la carpeta un PDF a medias con el tamaño ya reservado.
+
+    Args:
+        destino (Path): Ruta final del miembro.
+        tamanho (int): Tamaño esperado, para reservar el espacio.
+        copiar (Callable[[int], int]): Recibe el descriptor de salida y devuelve los bytes escritos.
+
+    Returns:
+        int: Bytes escritos.
+    """
+    temporal = destino.with_name(f".{destino.name}{SUFIJO_EXTRAYENDO}")
+    fd = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        _preasignar(fd, tamanho)
+        escritos = copiar(fd)
+        if escritos != tamanho:
+            os.ftruncate(fd, escritos)
+        if FSYNC_EXTRACCION:
+            os.fsync(fd)
+    except BaseException:
+        os.close(fd)
+        temporal.unlink(missing_ok=True)
+        raise
+    os.close(fd)
+    os.replace(temporal, destino)
+    return escritos
+
+
+def copiar_miembro(origen: BinaryIO, destino: Path, tamanho: int, buffer: int = BUFFER_EXTRACCION) -> int:
+    """
+    Copia un miembro ya abierto del comprimido a disco por bloques de tamaño fijo, reutilizando
+    siempre el mismo buffer, de modo que la memoria no depende del tamaño del miembro.
+
+    Args:
+        origen (BinaryIO): Miembro abierto (ZipExtFile, RarExtFile o el de tarfile.extractfile).
+        destino (Path): Ruta final del miembro.
+        tamanho (int): Tamaño descomprimido del miembro.
+        buffer (int): Tamaño del bloque de copia; nunca mayor que MEMORIA_MAXIMA_MIEMBRO.
+
+    Returns:
+        int: Bytes escritos.
+    """
+    bloque = memoryview(bytearray(max(LECTURA_MIEMBRO, min(buffer, MEMORIA_MAXIMA_MIEMBRO, tamanho or buffer))))
+
+    def copiar(fd: int) -> int:
+        escritos, lleno, fin = 0, 0, False
+        while not fin:
+            # Se descomprime en lecturas cortas, que caben en la caché del procesador, y se escribe
+            # a disco solo cuando el buffer está lleno
+            leidos = origen.readinto(bloque[lleno:lleno + LECTURA_MIEMBRO])
+            lleno += leidos
+            fin = not leidos
+            if lleno == len(bloque) or (fin and lleno):
+                vista = bloque[:lleno]
+                while vista:
+                    vista = vista[os.write(fd, vista):]
+                escritos += lleno
+                lleno = 0
+        return escritos
+
+    return _escribir_miembro(destino, tamanho, copiar)
+
+
+def copiar_rango(fd_origen: int, offset: int, destino: Path, tamanho: int, buffer: int = BUFFER_EXTRACCION) -> int:
+    """
+    Copia un tramo de un archivo a otro dentro del kernel (copy_file_range o sendfile), sin pasar los
+    datos por Python. Se usa para los miembros de zip guardados sin comprimir.
+
+    Args:
+        fd_origen (int): Descriptor del comprimido.
+        offset (int): Posición de los datos del miembro dentro del comprimido.
+        destino (Path): Ruta final del miembro.
+        tamanho (int): Bytes a copiar.
+        buffer (int): Bloque de la copia en Python si el kernel no permite la copia directa.
+
+    Returns:
+        int: Bytes escritos.
+    """
+    def copiar(fd: int) -> int:
+        escritos = 0
+        try:
+            while escritos < tamanho:
+                if hasattr(os, "copy_file_range"):
+                    copiados = os.copy_file_range(fd_origen, fd, tamanho - escritos, offset + escritos)
+                else:
+                    copiados = os.sendfile(fd, fd_origen, offset + escritos, tamanho - escritos)
+                if not copiados:
+                    break
+                escritos += copiados
+        except OSError:
+            # Sistemas de archivos o kernels sin copia directa: se sigue con lecturas normales
+            pass
+        while escritos < tamanho:
+            datos = os.pread(fd_origen, min(buffer, MEMORIA_MAXIMA_MIEMBRO, tamanho - escritos), offset + escritos)
+            if not datos:
+                break
+            os.pwrite(fd, datos, escritos)
+            escritos += len(datos)
+        return escritos
+
+    return _escribir_miembro(destino, tamanho, copiar)
+
+
+def _offset_datos_zip(fd: int, info: zipfile.ZipInfo) -> int:
+    """
+    Posición de los datos de un miembro de zip: tras la cabecera local, cuyos campos variables
+    (nombre y extra) pueden no coincidir con los del directorio central.
+    """
+    cabecera = os.pread(fd, 30, info.header_offset)
+    longitud_nombre, longitud_extra = struct.unpack("<HH", cabecera[26:30])
+    return info.header_offset + 30 + longitud_nombre + longitud_extra
+
+
+# Firmas (magic bytes) con que empieza cada formato; mandan sobre la extensión del nombre
+FIRMAS_FORMATO = ((b"PK\x03\x04", "zip"), (b"PK\x05\x06", "zip"), (b"Rar!\x1a\x07", "rar"), (b"\x1f\x8b", "tar.gz"))
+EXTENSIONES_FORMATO = ((".tar.gz", "tar.gz"), (".tgz", "tar.gz"), (".zip", "zip"), (".rar", "rar"))
+# Archivos cuya extensión no coincide con su contenido, para avisar una sola vez de cada uno
+_extension_equivocada: Set[Path] = set()
+
+
+def formato_por_nombre(nombre: str) -> Optional[str]:
+    """
+    Devuelve el formato que indica la extensión de un nombre de archivo, o None si no es un comprimido.
+    """
+    for extension, formato in EXTENSIONES_FORMATO:
+        if nombre.endswith(extension):
+            return formato
+    return None
+
+
+def formato_por_firma(cabecera: bytes) -> Optional[str]:
+    """
+    Devuelve el formato que indican los primeros bytes de un archivo, o None si no se reconoce la firma.
+    """
+    for firma, formato in FIRMAS_FORMATO:
+        if cabecera.startswith(firma):
+            return formato
+    return None
+
+
+def detectar_formato(file_path: Path, cabecera: Optional[bytes] = None) -> Optional[str]:
+    """
+    Detecta el formato de un comprimido por sus primeros bytes, de modo que los '.tgz' y los archivos
+    con la extensión equivocada se descomprimen igual. Si la firma no se reconoce se usa la extensión.
+
+    Args:
+        file_path (Path): Ruta del archivo.
+        cabecera (Optional[bytes]): Primeros bytes ya leídos (por ejemplo, de un archivo remoto en modo
+            streaming). Si no se indican se leen de file_path.
+
+    Returns:
+        Optional[str]: 'zip', 'rar', 'tar.gz' o None si no es un comprimido soportado.
+    """
+    por_nombre = formato_por_nombre(file_path.name)
+    if cabecera is None:
+        try:
+            with open(file_path, 'rb') as archivo:
+                cabecera = archivo.read(8)
+        except OSError:
+            return por_nombre
+    formato = formato_por_firma(cabecera)
+    if formato is None:
+        return por_nombre
+    if por_nombre and por_nombre != formato and file_path not in _extension_equivocada:
+        _extension_equivocada.add(file_path)
+        _logger.warning(f"{file_path.name} tiene extension de {por_nombre} pero su contenido es {formato}")
+    return formato
+
+
+class BackendComprimido(ABC):
+    """
+    Motor de un formato de comprimido: lista sus miembros y los extrae con copiar_miembro.
+
+    Los motores se registran con registrar_backend; para cada formato se usa el indicado en
+    DESCOMPRESION_BACKEND_<FORMATO> (por ejemplo DESCOMPRESION_BACKEND_TAR_GZ=pigz) o, con 'auto',
+    el primero disponible en orden de registro. Las subclases deben implementar listar y extraer: un
+    motor a medio implementar no se puede instanciar y falla al registrarlo, no a mitad de una extracción.
+
+    Attributes:
+        nombre (str): Nombre del motor en la configuración.
+        formato (str): Formato que descomprime ('zip', 'rar' o 'tar.gz').
+        repartible (bool): Si sus miembros se pueden extraer por separado en varios procesos.
+    """
+
+    nombre = ""
+    formato = ""
+    repartible = False
+
+    def disponible(self) -> bool:
+        return True
+
+    @abstractmethod
+    def listar(self, file_path: Path) -> Dict[str, int]:
+        """
+        Devuelve el tamaño descomprimido de cada archivo (no directorio) del comprimido.
+        """
+
+    @abstractmethod
+    def extraer(self, file_path: Path, output_dir: Path, quiere: Callable[[str], bool], buffer: int) -> int:
+        """
+        Extrae los miembros para los que 'quiere' devuelve True y devuelve los bytes escritos.
+        """
+
+
+class BackendZip(BackendComprimido):
+    """
+    zip con zipfile. Los miembros guardados sin comprimir se copian dentro del kernel; su integridad
+    ya la garantiza el hash del comprimido que registra el manifiesto de descargas.
+    """
+
+    nombre = "zipfile"
+    formato = "zip"
+    repartible = True
+
+    def listar(self, file_path: Path) -> Dict[str, int]:
+        with zipfile.ZipFile(file_path, 'r') as zip_ref:
+            return {info.filename: info.file_size for info in zip_ref.infolist() if not info.is_dir()}
+
+    def extraer(self, file_path: Path, output_dir: Path, quiere: Callable[[str], bool], buffer: int) -> int:
+        escritos = 0
+        with open(file_path, 'rb', buffering=buffer) as archivo, zipfile.ZipFile(archivo, 'r') as zip_ref:
+            fd = archivo.fileno()
+            _aconsejar(fd, "POSIX_FADV_SEQUENTIAL")
+            for info in zip_ref.infolist():
+                if not quiere(info.filename):
+                    continue
+                destino = _ruta_destino(output_dir, info.filename)
+                if info.is_dir():
+                    destino.mkdir(parents=True, exist_ok=True)
+                    continue
+                destino.parent.mkdir(parents=True, exist_ok=True)
+                if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+                    escritos += copiar_rango(fd, _offset_datos_zip(fd, info), destino, info.file_size, buffer)
+                else:
+                    with zip_ref.open(info) as origen:
+                        escritos += copiar_miembro(origen, destino, info.file_size, buffer)
+            _aconsejar(fd, "POSIX_FADV_DONTNEED")
+        return escritos
+
+
+class BackendRar(BackendComprimido):
+    """
+    rar con rarfile (que a su vez usa unrar, unar o bsdtar para los miembros comprimidos).
+    """
+
+    nombre = "rarfile"
+    formato = "rar"
+
+    def listar(self, file_path: Path) -> Dict[str, int]:
+        with rarfile.RarFile(file_path, 'r') as rar_ref:
+            return {info.filename: info.file_size for info in rar_ref.infolist() if not info.is_dir()}
+
+    def extraer(self, file_path: Path, output_dir: Path, quiere: Callable[[str], bool], buffer: int) -> int:
+        escritos = 0
+        with rarfile.RarFile(file_path, 'r') as rar_ref:
+            for info in rar_ref.infolist():
+                if not quiere(info.filename):
+                    continue
+                destino = _ruta_destino(output_dir, info.filename)
+                if info.is_dir():
+                    destino.mkdir(parents=True, exist_ok=True)
+                    continue
+                destino.parent.mkdir(parents=True, exist_ok=True)
+                with rar_ref.open(info) as origen:
+                    escritos += copiar_miembro(origen, destino, info.file_size, buffer)
+        return escritos
+
+
+class BackendTarGz(BackendComprimido):
+    """
+    tar.gz con tarfile y el zlib de Python, en modo flujo: el comprimido se lee una sola vez de
+    principio a fin y los miembros que no se quieren se saltan sin escribirlos. Las subclases solo
+    cambian de dónde sale el tar ya descomprimido (_abrir_tar).
+    """
+
+    nombre = "tarfile"
+    formato = "tar.gz"
+
+    @contextmanager
+    def _abrir_tar(self, file_path: Path) -> Iterator[tarfile.TarFile]:
+        # Lecturas de descompresión mayores que LECTURA_MIEMBRO son más lentas: la lectura anticipada del disco la hace el kernel
+        with open(file_path, 'rb') as archivo:
+            _aconsejar(archivo.fileno(), "POSIX_FADV_SEQUENTIAL")
+            with tarfile.open(fileobj=archivo, mode='r|gz', bufsize=LECTURA_MIEMBRO) as tar_ref:
+                yield tar_ref
+            _aconsejar(archivo.fileno(), "POSIX_FADV_DONTNEED")
+
+    def listar(self, file_path: Path) -> Dict[str, int]:
+        with self._abrir_tar(file_path) as tar_ref:
+            return {info.name: info.size for info in tar_ref if info.isfile()}
+
+    def extraer(self, file_path: Path, output_dir: Path, quiere: Callable[[str], bool], buffer: int) -> int:
+        escritos = 0
+        with self._abrir_tar(file_path) as tar_ref:
+            for info in tar_ref:
+                if not quiere(info.name):
+                    continue
+                destino = _ruta_destino(output_dir, info.name)
+                if info.isdir():
+                    destino.mkdir(parents=True, exist_ok=True)
+                elif info.isfile():
+                    destino.parent.mkdir(parents=True, exist_ok=True)
+                    escritos += copiar_miembro(tar_ref.extractfile(info), destino, info.size, buffer)
+                    os.utime(destino, (info.mtime, info.mtime))
+                else:
+                    _logger.warning(f"Se omite {info.name} de {file_path.name}: no es un archivo regular")
+        return escritos
+
+
+class BackendTarGzPigz(BackendTarGz):
+    """
+    tar.gz descomprimido por pigz en otro proceso: la descompresión (con sus hilos de lectura,
+    escritura y verificación) corre en paralelo con la extracción en Python, que lee el tar ya
+    descomprimido de una tubería.
+    """
+
+    nombre = "pigz"
+
+    def disponible(self) -> bool:
+        # Con un solo núcleo la tubería solo añade copias: pigz y la extracción no pueden solaparse
+        return shutil.which("pigz") is not None and (os.cpu_count() or 1) > 1
+
+    @contextmanager
+    def _abrir_tar(self, file_path: Path) -> Iterator[tarfile.TarFile]:
+        proceso = subprocess.Popen(["pigz", "-dc", str(file_path)], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   bufsize=LECTURA_MIEMBRO)
+        try:
+            with tarfile.open(fileobj=proceso.stdout, mode='r|', bufsize=LECTURA_MIEMBRO) as tar_ref:
+                yield tar_ref
+            # El tar termina antes que el flujo (bloques de relleno): se vacía la tubería para que pigz acabe bien
+            while proceso.stdout.read(LECTURA_MIEMBRO):
+                pass
+        except BaseException:
+            proceso.kill()
+            raise
+        finally:
+            proceso.stdout.close()
+            error = proceso.stderr.read().decode(errors="replace").strip()
+            proceso.stderr.close()
+            proceso.wait()
+        if proceso.returncode != 0:
+            raise OSError(f"pigz termino con codigo {proceso.returncode}: {error}")
+
+
+class BackendTarGzIsal(BackendTarGz):
+    """
+    tar.gz con python-isal (Intel ISA-L), varias veces más rápido que zlib al descomprimir. Si la
+    versión instalada lo permite, la lectura y la descompresión van en un hilo aparte.
+    """
+
+    nombre = "isal"
+
+    def disponible(self) -> bool:
+        return igzip is not None
+
+    @contextmanager
+    def _abrir_tar(self, file_path: Path) -> Iterator[tarfile.TarFile]:
+        if igzip_threaded is not None and (os.cpu_count() or 1) > 1:
+            flujo = igzip_threaded.open(file_path, "rb", threads=1)
+        else:
+            flujo = igzip.open(file_path, "rb")
+        with flujo, tarfile.open(fileobj=flujo, mode='r|', bufsize=LECTURA_MIEMBRO) as tar_ref:
+            yield tar_ref
+
+
+BACKENDS: Dict[str, List[BackendComprimido]] = {}
+
+
+def registrar_backend(backend: BackendComprimido, primero: bool = False) -> None:
+    """
+    Registra un motor para su formato. Con 'auto' se usa el primero disponible en orden de registro.
+
+    Args:
+        backend (BackendComprimido): Motor a registrar.
+        primero (bool): Si se antepone a los ya registrados para su formato.
+
+    Raises:
+        ValueError: Si el motor no tiene nombre o formato.
+    """
+    if not backend.nombre or not backend.formato:
+        raise ValueError(f"El motor {type(backend).__name__} debe indicar su nombre y su formato")
+    motores = BACKENDS.setdefault(backend.formato, [])
+    if primero:
+        motores.insert(0, backend)
+    else:
+        motores.append(backend)
+
+
+for _backend in (BackendZip(), BackendRar(), BackendTarGzIsal(), BackendTarGzPigz(), BackendTarGz()):
+    registrar_backend(_backend)
+
+
+def backend_para(formato: Optional[str], nombre: Optional[str] = None) -> BackendComprimido:
+    """
+    Elige el motor de un formato.
+
+    Args:
+        formato (Optional[str]): Formato devuelto por detectar_formato.
+        nombre (Optional[str]): Motor a usar. Por defecto DESCOMPRESION_BACKEND_<FORMATO> o 'auto'.
+
+    Returns:
+        BackendComprimido: Motor elegido.
+
+    Raises:
+        ValueError: Si el formato no está soportado o el motor pedido no existe o no está disponible.
+    """
+    if formato not in BACKENDS:
+        raise ValueError(f"Formato de comprimido no soportado: {formato}")
+    nombre = nombre or os.getenv(f"DESCOMPRESION_BACKEND_{formato.upper().replace('.', '_')}", "auto")
+    for backend in BACKENDS[formato]:
+        if (nombre == "auto" or backend.nombre == nombre) and backend.disponible():
+            return backend
+    raise ValueError(f"No hay un motor '{nombre}' disponible para {formato}: "
+                     f"{', '.join(b.nombre for b in BACKENDS[formato] if b.disponible())}")
+
+
+def extraer_comprimido(file_path: Path, output_dir: Path, miembros: Optional[Iterable[str]] = None,
+                       buffer: int = BUFFER_EXTRACCION, filtro: Optional[FiltroMiembros] = None,
+                       backend: Optional[str] = None) -> int:
+    """
+    Extrae los miembros de un zip, rar o tar.gz con el motor de su formato, copiándolos por bloques grandes.
+
+    Cada archivo de salida se reserva de una vez con su tamaño conocido, se escribe en un temporal y
+    se renombra al terminar. El comprimido se lee con aviso de lectura secuencial y al terminar se
+    libera de la caché, pues no se vuelve a leer; los PDF extraídos se quedan en caché para la subida.
+
+    Args:
+        file_path (Path): Ruta del archivo comprimido.
+        output_dir (Path): Directorio de salida.
+        miembros (Optional[Iterable[str]]): Nombres a extraer. Por defecto los que cumplen el filtro.
+        buffer (int): Bloque de copia. Por defecto DESCOMPRESION_BUFFER_MB.
+        filtro (Optional[FiltroMiembros]): Filtro usado si no se indican los miembros. Por defecto FILTRO_MIEMBROS.
+        backend (Optional[str]): Motor a usar (ver backend_para).
+
+    Returns:
+        int: Bytes escritos.
+    """
+    quiere = set(miembros).__contains__ if miembros is not None else filtro or FILTRO_MIEMBROS
+    motor = backend_para(detectar_formato(file_path), backend)
+    return motor.extraer(file_path, Path(output_dir), quiere, buffer)
+
+
+def listar_miembros(file_path: Path, filtro: Optional[FiltroMiembros] = None) -> Dict[str, int]:
+    """
+    Lista los archivos (no directorios) de un comprimido que cumplen el filtro, con su tamaño descomprimido.
+
+    Para zip y rar basta con leer el índice del archivo; para tar.gz hay que recorrer el flujo completo,
+    aunque los miembros se saltan sin descomprimirlos a disco.
+
+    Args:
+        file_path (Path): Ruta del archivo comprimido.
+        filtro (Optional[FiltroMiembros]): Miembros que interesan. Por defecto FILTRO_MIEMBROS.
+
+    Returns:
+        Dict[str, int]: Tamaño de cada miembro, por nombre.
+    """
+    filtro = filtro or FILTRO_MIEMBROS
+    todos = backend_para(detectar_formato(file_path)).listar(file_path)
+    miembros = {nombre: tamanho for nombre, tamanho in todos.items() if filtro(nombre)}
+    if len(miembros) < len(todos):
+        _logger.info(f"{file_path.name}: se omiten {len(todos) - len(miembros)} de {len(todos)} miembros que no cumplen {filtro}")
+    return miembros
+
+
+def extraer_miembros(file_path: Path, output_dir: Path, miembros: List[str]) -> Tuple[float, float, bool]:
+    """
+    Extrae solo los miembros indicados de un comprimido. Se usa para repartir un mismo zip entre
+    varios procesos y para volver a extraer solo los miembros que faltan.
+
+    Args:
+        file_path (Path): Ruta del archivo comprimido.
+        output_dir (Path): Directorio de salida.
+        miembros (List[str]): Nombres de los miembros a extraer.
+
+    Returns:
+        Tuple[float, float, bool]: Momento de inicio y de fin (time.time()) y si terminó sin errores.
+    """
+    inicio = time.time()
+    try:
+        extraer_comprimido(file_path, output_dir, miembros)
+        return inicio, time.time(), True
+    except Exception as e:
+        _logger.error(f"Error al descomprimir el archivo {file_path}: {e}")
+        return inicio, time.time(), False
+
+
+class IndiceExtraccion:
+    """
+    Índice persistente de lo extraído en una carpeta 'YYYYMM', guardado como JSON dentro de ella.
+
+    Por cada comprimido se anota su tamaño, su fecha de modificación, su hash (si lo registró el
+    manifiesto de descargas) y el tamaño de cada miembro extraído. Si el comprimido no cambió desde
+    la última extracción completa se omite sin abrirlo; si cambió o faltan miembros, solo se
+    extraen los miembros que faltan o tienen otro tamaño.
+
+    Attributes:
+        ruta (Path): Ruta del archivo JSON del índice.
+        entradas (Dict[str, dict]): Estado de cada comprimido, por nombre.
+    """
+
+    NOMBRE = ".indice_extraccion.json"
+
+    def __init__(self, output_dir: Path) -> None:
+        self.ruta = Path(output_dir) / self.NOMBRE
+        try:
+            self.entradas: Dict[str, dict] = json.loads(self.ruta.read_text())
+        except FileNotFoundError:
+            self.entradas = {}
+        except ValueError as e:
+            _logger.warning(f"Indice de extraccion ilegible, se ignora: {e}")
+            self.entradas = {}
+
+    def guardar(self) -> None:
+        """
+        Escribe el índice en disco de forma atómica.
+        """
+        temporal = self.ruta.with_suffix(".tmp")
+        temporal.write_text(json.dumps(self.entradas, indent=1))
+        temporal.replace(self.ruta)
+
+    @staticmethod
+    def clave(file_path: Path, sha256: Optional[str], filtro: Optional[FiltroMiembros] = None) -> dict:
+        estado = file_path.stat()
+        # El filtro forma parte de la clave: si cambia, los miembros que ahora se piden se extraen
+        return {"tamanho": estado.st_size, "mtime": int(estado.st_mtime), "sha256": sha256,
+                "filtro": repr(filtro or FILTRO_MIEMBROS)}
+
+    def esta_completo(self, nombre: str, clave: dict, presentes: Set[str]) -> bool:
+        """
+        Indica si el comprimido no cambió desde su última extracción completa y sus miembros siguen
+        en la carpeta. La presencia se comprueba contra los nombres de un único listado de la carpeta,
+        sin abrir el comprimido ni consultar cada miembro.
+        """
+        entrada = self.entradas.get(nombre)
+        if (entrada is None or not entrada.get("completo")
+                or entrada["tamanho"] != clave["tamanho"] or entrada["mtime"] != clave["mtime"]
+                or entrada.get("filtro") != clave["filtro"]):
+            return False
+        return all(miembro.split('/')[0] in presentes for miembro in entrada["miembros"])
+
+    def mismo_contenido(self, nombre: str, clave: dict) -> bool:
+        """
+        Indica si el comprimido tiene el mismo contenido que cuando se registró, según su hash.
+        Si alguno de los dos hashes no se conoce se asume que puede ser el mismo.
+        """
+        entrada = self.entradas.get(nombre)
+        if entrada is None or not entrada.get("sha256") or not clave["sha256"]:
+            return True
+        return entrada["sha256"] == clave["sha256"]
+
+    def registrar(self, nombre: str, clave: dict, miembros: Dict[str, int]) -> None:
+        self.entradas[nombre] = dict(clave, miembros=miembros, completo=True)
+
+
+def _hashes_descargados(directorio: Path) -> Dict[str, str]:
+    """
+    Devuelve los hashes SHA-256 que el manifiesto de descargas tiene para los comprimidos del directorio.
+    """
+    manifiesto = ManifiestoDescargas(directorio)
+    return {nombre: entrada["sha256"] for nombre, entrada in manifiesto.entradas.items() if entrada.get("sha256")}
+
+
+def _planificar_extraccion(file_path: Path, output_dir: Path, indice: IndiceExtraccion, clave: dict,
+                           filtro: Optional[FiltroMiembros] = None) -> Tuple[Dict[str, int], List[str]]:
+    """
+    Decide qué miembros de un comprimido hay que extraer.
+
+    Returns:
+        Tuple[Dict[str, int], List[str]]: Todos los miembros con su tamaño y los que hay que extraer.
+    """
+    miembros = listar_miembros(file_path, filtro)
+    if not indice.mismo_contenido(file_path.name, clave):
+        _logger.info(f"El archivo {file_path.name} cambio desde la ultima extraccion, se extrae completo")
+        return miembros, list(miembros)
+
+    pendientes = []
+    for nombre, tamanho in miembros.items():
+        destino = output_dir / nombre
+        try:
+            if destino.stat().st_size != tamanho:
+                pendientes.append(nombre)
+        except FileNotFoundError:
+            pendientes.append(nombre)
+    return miembros, pendientes
+
+
+def _repartir(file_path: Path, miembros: Dict[str, int], pendientes: List[str], workers: int) -> List[List[str]]:
+    """
+    Reparte los miembros pendientes en grupos de tamaño parecido. Solo los formatos con acceso directo
+    a cada miembro (zip) se reparten entre varios procesos; rar y tar.gz se extraen en un único grupo.
+
+    Returns:
+        List[List[str]]: Grupos de miembros a extraer.
+    """
+    if not backend_para(detectar_formato(file_path)).repartible or workers <= 1:
+        return [pendientes]
+    # Repartir los miembros, de mayor a menor, al grupo con menos bytes acumulados
+    grupos: List[List[str]] = [[] for _ in range(max(1, min(workers, len(pendientes))))]
+    cargas = [0] * len(grupos)
+    for nombre in sorted(pendientes, key=lambda n: miembros[n], reverse=True):
+        posicion = cargas.index(min(cargas))
+        grupos[posicion].append(nombre)
+        cargas[posicion] += miembros[nombre]
+    return [grupo for grupo in grupos if grupo]
+
+
+def descomprimir_en_paralelo(archivos: List[Tuple[Path, Path]], workers: Optional[int] = None,
+                             progreso: Optional[Progreso] = None, filtro: Optional[FiltroMiembros] = None) -> None:
+    """
+    Descomprime varios archivos a la vez en un pool de procesos.
+
+    Los archivos independientes se extraen en paralelo y, como los zip permiten acceso directo a cada
+    miembro, sus miembros se reparten además entre varios procesos. Los rar y tar.gz se extraen cada
+    uno en un solo proceso. Al terminar cada archivo se registra su tiempo y el avance total.
+
+    Antes de extraer se consulta el IndiceExtraccion de cada carpeta de salida: los comprimidos que
+    no cambiaron desde su última extracción completa (y cuyos miembros siguen en la carpeta) se omiten
+    sin abrirlos, y del resto solo se extraen los miembros que faltan o tienen otro tamaño. Solo se
+    consideran los miembros que cumplen el filtro: los demás no llegan a descomprimirse.
+
+    Args:
+        archivos (List[Tuple[Path, Path]]): Pares (archivo comprimido, directorio de salida).
+        workers (Optional[int]): Cantidad de procesos. Por defecto DESCOMPRESION_WORKERS o los núcleos disponibles.
+        progreso (Optional[Progreso]): Donde se suman los miembros extraídos.
+        filtro (Optional[FiltroMiembros]): Miembros a extraer. Por defecto FILTRO_MIEMBROS ('*.pdf').
+
+    Returns:
+        None
+    """
+    workers = workers or WORKERS_DESCOMPRESION
+    inicio_total = time.time()
+    indices: Dict[Path, IndiceExtraccion] = {}
+    hashes: Dict[Path, Dict[str, str]] = {}
+    presentes: Dict[Path, Set[str]] = {}
+
+    # Planificar: qué grupos de miembros extraer de cada archivo
+    planes: Dict[Path, Tuple[Path, dict, Dict[str, int], List[List[str]]]] = {}
+    for file_path, output_dir in archivos:
+        if output_dir not in indices:
+            indices[output_dir] = IndiceExtraccion(output_dir)
+        if file_path.parent not in hashes:
+            hashes[file_path.parent] = _hashes_descargados(file_path.parent)
+        if output_dir not in presentes:
+            presentes[output_dir] = {entrada.name for entrada in os.scandir(output_dir)}
+        indice = indices[output_dir]
+        clave = IndiceExtraccion.clave(file_path, hashes[file_path.parent].get(file_path.name), filtro)
+        if indice.esta_completo(file_path.name, clave, presentes[output_dir]):
+            _logger.info(f"El archivo {file_path.name} ya estaba descomprimido en {output_dir} segun el indice de extraccion")
+            continue
+        try:
+            miembros, pendientes = _planificar_extraccion(file_path, output_dir, indice, clave, filtro)
+        except Exception as e:
+            registrar_error("descompresion")
+            _logger.error(f"Error al leer el archivo {file_path}: {e}")
+            continue
+        if not miembros:
+            _logger.warning(f"El archivo {file_path.name} no tiene miembros que cumplan {filtro or FILTRO_MIEMBROS}")
+            indice.registrar(file_path.name, clave, miembros)
+            continue
+        if not pendientes:
+            _logger.info(f"El archivo {file_path.name} ya estaba descomprimido en {output_dir}")
+            indice.registrar(file_path.name, clave, miembros)
+            continue
+        _logger.info(f"Descomprimiendo {len(pendientes)} de {len(miembros)} miembros de {file_path.name}")
+        # Crear de antemano los directorios para que los procesos no compitan al crearlos
+        for nombre in pendientes:
+            (output_dir / nombre).parent.mkdir(parents=True, exist_ok=True)
+        planes[file_path] = (output_dir, clave, miembros, _repartir(file_path, miembros, pendientes, workers))
+
+    def terminar(file_path: Path, resultados: List[Tuple[float, float, bool]], numero: int) -> None:
+        output_dir, clave, miembros, grupos = planes[file_path]
+        if progreso:
+            progreso.sumar(archivos=sum(len(grupo) for grupo in grupos))
+        duracion = max(r[1] for r in resultados) - min(r[0] for r in resultados)
+        registrar_archivo("descompresion", file_path.stat().st_size, duracion)
+        if all(r[2] for r in resultados):
+            indices[output_dir].registrar(file_path.name, clave, miembros)
+            indices[output_dir].guardar()
+        else:
+            registrar_error("descompresion")
+        _logger.info(f"Archivo {file_path.name} procesado en {duracion:.1f} s ({numero}/{len(planes)})")
+
+    try:
+        if planes and workers <= 1:
+            for numero, (file_path, (output_dir, _, _, grupos)) in enumerate(planes.items(), start=1):
+                terminar(file_path, [extraer_miembros(file_path, output_dir, grupo) for grupo in grupos], numero)
+        elif planes:
+            _logger.info(f"Descomprimiendo {len(planes)} archivos con {workers} procesos")
+            # Los procesos envían sus logs al proceso principal por una cola (ver log_configuration.py)
+            with ProcessPoolExecutor(max_workers=workers, initializer=inicializar_proceso, initargs=(cola_para_procesos(),)) as executor:
+                archivo_de = {executor.submit(extraer_miembros, file_path, output_dir, grupo): file_path
+                              for file_path, (output_dir, _, _, grupos) in planes.items() for grupo in grupos}
+                # Informar cada archivo en cuanto terminan todas sus tareas
+                pendientes = {file_path: len(plan[3]) for file_path, plan in planes.items()}
+                resultados: Dict[Path, List[Tuple[float, float, bool]]] = {file_path: [] for file_path in planes}
+                terminados = 0
+                for tarea in as_completed(archivo_de):
+                    file_path = archivo_de[tarea]
+                    try:
+                        resultados[file_path].append(tarea.result())
+                    except Exception as e:
+                        # Un proceso muerto (por ejemplo, por falta de memoria) solo hace fallar sus archivos;
+                        # terminar registra el error una vez por archivo
+                        ahora = time.time()
+                        if all(r[2] for r in resultados[file_path]):
+                            _logger.error(f"Error descomprimiendo {file_path.name}: {e!r}")
+                        resultados[file_path].append((ahora, ahora, False))
+                    pendientes[file_path] -= 1
+                    if pendientes[file_path] == 0:
+                        terminados += 1
+                        terminar(file_path, resultados[file_path], terminados)
+    finally:
+        # Los índices de los archivos ya terminados se guardan aunque la etapa se interrumpa
+        for indice in indices.values():
+            indice.guardar()
+    _logger.info(f"Descompresion terminada en {time.time() - inicio_total:.1f} s")
@@ -2,15 +2,26 @@ import paramiko
 from schemas.schemas import ConteoArchivos
 from datetime import datetime
 import logging
-from typing import List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import os
 from pathlib import Path
-import zipfile
-import rarfile
-import tarfile
 from dotenv import load_dotenv
-from sms import obtener_token_servidor_sms, envio_sms
+from sms import notificar
+from alarmas_sms import avisar_espacio_insuficiente
 from log_configuration import configurar_logging
+from pool_sftp import PoolSFTP, sesion_sftp, obtener_pool
+from listado_remoto import extraer_fecha, construir_conteo, listar_con_snapshot
+from descargas import comprobar_descarga, descargar_archivos_paralelo, SUFIJO_PARCIAL
+from streaming import procesar_archivos_streaming
+from descompresion import descomprimir_en_paralelo, detectar_formato
+from subidas import indice_remoto, subir_archivos_paralelo, VerificacionSubida
+from trabajos import Progreso
+from metricas import InformeEjecucion, propagar_contexto, registrar_error
+from planificacion import planificar_espacio
+from registro_ejecuciones import RegistroEjecuciones, obtener_registro, ruta_registro
+from catalogo import CatalogoFacturas, obtener_catalogo, ruta_catalogo
 
 load_dotenv()
 
@@ -38,9 +49,6 @@ def fecha_mes_vencido() -> str:
 # Obtener un logger para este módulo
 _logger = logging.getLogger(__name__)
 
-# Declaración de la variable global 
-lista_archivos_copiar_1 = []
-
 def clear_console() -> None:
     """
     Limpia la consola en Windows, macOS y Linux.
@@ -85,6 +93,8 @@ def cliente_sft(host: str, port: int, username: str, password: str) -> Tuple[par
 def read_from_sftp(host: str, port: int, username: str, password: str) -> ConteoArchivos:
     """
     Conecta a un servidor SFTP, lista los archivos y clasifica los archivos por tipo.
+    La conexión se toma del pool compartido, por lo que no se repite el handshake si ya hay
+    un transporte abierto con el servidor.
 
     Args:
         host (str): Dirección del servidor SFTP.
@@ -93,37 +103,11 @@ def read_from_sftp(host: str, port: int, username: str, password: str) -> Conteo
         password (str): Contraseña para el acceso SFTP.
 
     Returns:
-        ConteoArchivos: Objeto que contiene listas de archivos .tar.gz, .zip y .rar.
+        ConteoArchivos: Objeto que contiene listas de archivos .tar.gz, .zip y .rar y su índice por periodo.
     """
-    sftp, transport = cliente_sft(host, port, username, password)
-
-    # Listar todos los archivos en el directorio remoto
-    archivos = sftp.listdir()
-
-    # Filtrar archivos con las extensiones deseadas
-    archivos_tar_gz = [archivo for archivo in archivos if archivo.endswith('.tar.gz')]
-    archivos_zip = [archivo for archivo in archivos if archivo.endswith('.zip')]
-    archivos_rar = [archivo for archivo in archivos if archivo.endswith('.rar')]
-
-    # Cerrar la conexión SFTP
-    sftp.close()
-    transport.close()
-    return ConteoArchivos(tar_gz_files=archivos_tar_gz, zip_files=archivos_zip, rar_files=archivos_rar)
-
-
-
-
-
-def extraer_fecha(nombre:str) -> str:
-    """
-    Extrae y devuelve el año y mes desde el nombre de un archivo.
-    Args: 
-        nombre (str): El nombre del archivo desde el cual se extraerá la fecha. 
-    Returns: 
-        str: Una cadena representando el año y el mes en formato 'YYYYMM'.
-    """
-    fecha_str = nombre[:6]
-    return fecha_str
+    with sesion_sftp(host, port, username, password) as sftp:
+        # El listado se toma del snapshot local, que solo se refresca si el directorio cambió
+        return listar_con_snapshot(sftp, host, port, username)
 
 
 def filtrar_facturas_mes_vencido(conteo_archivos: ConteoArchivos) -> List[str]:
@@ -135,167 +119,123 @@ def filtrar_facturas_mes_vencido(conteo_archivos: ConteoArchivos) -> List[str]:
         List[str]: Una lista de nombres de archivos que corresponden al mes vencido.
     """
     fecha_vencida = fecha_mes_vencido()
+    _logger.info(f"Fecha del mes vencido: {fecha_vencida}")
 
-    lista_atributos_ConteoArchivos = ["tar_gz_files", "zip_files", "rar_files"]
-    lista_archivos_copiar = []
-    for atributo in lista_atributos_ConteoArchivos:
-        archivos = getattr(conteo_archivos, atributo)
-        print()
-        for archivo in archivos:
-            print()
-            _logger.info(f"Archivo: {archivo} encontrado en el sftp")
-            if extraer_fecha(archivo) == fecha_vencida:
-                _logger.info(f"Fecha del encontrada en el nombre del archivo: {extraer_fecha(archivo)}")
-                _logger.info(f"Fecha del mes vencido: {fecha_vencida}")
-                lista_archivos_copiar.append(archivo)
+    # Búsqueda directa en el índice por periodo, sin recorrer todo el listado
+    lista_archivos_copiar = list(indice_periodos(conteo_archivos).get(fecha_vencida, []))
     print()
-    _logger.info(f"Lista final: {lista_archivos_copiar}")
+    _logger.info(f"Lista final: {len(lista_archivos_copiar)} comprimidos del periodo {fecha_vencida}")
+    _logger.debug("Comprimidos del periodo: %s", lista_archivos_copiar)
     print()
     return lista_archivos_copiar
 
 
 
-def descargar_archivos_sftp(conteo_archivos: ConteoArchivos, host: str, port: int, username: str, password: str, lista_archivos_copiar: List[str], destino: str) -> None:
-
+def rango_periodos(desde: str, hasta: str) -> List[str]:
     """
-    Descarga archivos desde un servidor SFTP cuyos nombres coincidan con los de una lista dada.
+    Devuelve todos los periodos 'YYYYMM' entre desde y hasta, ambos incluidos.
 
     Args:
-        host (str): Dirección del servidor SFTP.
-        port (int): Puerto del servidor SFTP.
-        username (str): Nombre de usuario para el acceso SFTP.
-        password (str): Contraseña para el acceso SFTP.
-        archivos_a_descargar (List[str]): Lista de nombres de archivos a descargar.
-        destino (str): Directorio destino donde se guardarán los archivos descargados.
+        desde (str): Primer periodo en formato 'YYYYMM'.
+        hasta (str): Último periodo en formato 'YYYYMM'.
 
     Returns:
-        None
-    """
-    try:
-        _logger.info(f"Entrando en la funcion de descarga")
-        global lista_archivos_copiar_1
-        # Crear el cliente SFTP
-        _logger.info("Estableciendo conexion SFTP para descarga")
-        sftp, transport = cliente_sft(host, port, username, password)
-        
-        lista_archivos_copiar_1 = filtrar_facturas_mes_vencido(conteo_archivos)
-            
-        # Descargar los archivos que coinciden con los nombres en la lista
-        for archivo in lista_archivos_copiar_1:
-            remote_file_path = Path(archivo)
-            local_file_path = Path.cwd() / destino / archivo
-                        
-            if local_file_path.exists():
-                _logger.warning(f"El archivo ya existe en el directorio de descarga, se omite dicha descarga: {local_file_path}")
-                continue
-            try:
-
-                _logger.info(f"Descargando archivo: {archivo}")
-                sftp.get(str(remote_file_path), str(local_file_path))
-                _logger.info(f"{archivo} descargado satisfactoriamente")
-            except Exception as e:
-                _logger.error(f"Error descargando el archivo: {archivo}")
-    except Exception as e:
-        _logger.error(f"Error en descargar_archivos_sftp: {e}") 
-        print(f"Error: {e}")
-    
-    # Cerrar la conexión SFTP
-    _logger.info("Cerrando conexion SFTP debido a terminacion del proceso de descarga")
-    sftp.close()
-    transport.close()
-    
-
-def descomprimir_zip(file_path: Path, output_dir: Path) -> None:
-    """
-    Descomprime un archivo zip y verifica si ya está descomprimido.
+        List[str]: Periodos en orden cronológico.
 
-    Args:
-        file_path (Path): Ruta del archivo zip.
-        output_dir (Path): Directorio de salida.
-
-    Returns:
-        None
+    Raises:
+        ValueError: Si algún periodo no tiene el formato 'YYYYMM' o desde es posterior a hasta.
     """
     try:
-        with zipfile.ZipFile(file_path, 'r') as zip_ref:
-            # Verificar si todos los archivos ya están descomprimidos
-            all_files_exist = all((output_dir / member).exists() for member in zip_ref.namelist())
-            if all_files_exist:
-                _logger.info(f"El archivo ZIP: {file_path} ya estaba descomprimido en esa ubicacion")
-                return  # Salir sin extraer nada
-
-            # Extraer los archivos si no están descomprimidos
-            _logger.info(f"Descomprimiendo archivo ZIP: {file_path}")
-            zip_ref.extractall(str(output_dir))
-        _logger.info(f"Archivo ZIP descomprimido: {file_path}")
-    except Exception as e:
-        _logger.error(f"Error al descomprimir el archivo ZIP {file_path}: {e}")
-
-
-def descomprimir_rar(file_path: Path, output_dir: Path) -> None:
+        # strptime acepta el mes sin cero delante ('20241'), así que se exigen las 6 cifras
+        if not all(len(periodo) == 6 and periodo.isdigit() for periodo in (desde, hasta)):
+            raise ValueError
+        inicio = datetime.strptime(desde, "%Y%m")
+        fin = datetime.strptime(hasta, "%Y%m")
+    except ValueError:
+        raise ValueError(f"Los periodos deben tener el formato YYYYMM: {desde} - {hasta}")
+    if inicio > fin:
+        raise ValueError(f"El periodo inicial {desde} es posterior al final {hasta}")
+
+    periodos = []
+    anho, mes = inicio.year, inicio.month
+    while (anho, mes) <= (fin.year, fin.month):
+        periodos.append(f"{anho}{str(mes).zfill(2)}")
+        mes += 1
+        if mes == 13:
+            anho, mes = anho + 1, 1
+    return periodos
+
+
+def indice_periodos(conteo_archivos: ConteoArchivos) -> Dict[str, List[str]]:
     """
-    Descomprime un archivo rar y verifica si ya está descomprimido.
+    Agrupa los comprimidos de un listado remoto por el periodo 'YYYYMM' de su nombre (ver extraer_fecha).
 
     Args:
-        file_path (Path): Ruta del archivo rar.
-        output_dir (Path): Directorio de salida.
+        conteo_archivos (ConteoArchivos): Listado remoto devuelto por read_from_sftp.
 
     Returns:
-        None
+        Dict[str, List[str]]: Nombres de los archivos de cada periodo.
     """
-    try:
-        with rarfile.RarFile(file_path, 'r') as rar_ref:
-            # Verificar si todos los archivos ya están descomprimidos
-            all_files_exist = all((output_dir / member).exists() for member in rar_ref.getnames())
-            if all_files_exist:
-                _logger.info(f"El archivo RAR: {file_path} ya esta descomprimido")
-                return  # Salir sin extraer nada
-
-            # Extraer los archivos si no están descomprimidos
-            _logger.info(f"Descomprimiendo archivo RAR: {file_path}")
-            rar_ref.extractall(output_dir)
-        _logger.info(f"Archivo RAR descomprimido: {file_path}")
-    except Exception as e:
-        _logger.error(f"Error al descomprimir el archivo RAR {file_path}: {e}")
+    if conteo_archivos.periodos:
+        return conteo_archivos.periodos
+    archivos = conteo_archivos.tar_gz_files + conteo_archivos.zip_files + conteo_archivos.rar_files
+    return construir_conteo(archivos).periodos
 
 
+def descargar_archivos_sftp(conteo_archivos: ConteoArchivos, host: str, port: int, username: str, password: str, lista_archivos_copiar: List[str], destino: str, concurrencia: Optional[int] = None, progreso: Optional[Progreso] = None) -> None:
 
-def descomprimir_tar_gz(file_path: Path, output_dir: Path) -> None:
     """
-    Descomprime un archivo tar.gz y verifica si ya está descomprimido.
+    Descarga archivos desde un servidor SFTP cuyos nombres coincidan con los de una lista dada.
+    Los archivos se descargan en paralelo por varios canales del pool y los grandes se dividen
+    en bloques que se leen a la vez (ver descargas.descargar_archivos_paralelo). Un manifiesto local
+    permite retomar descargas cortadas y omitir los archivos que no cambiaron en el servidor.
 
     Args:
-        file_path (Path): Ruta del archivo tar.gz.
-        output_dir (Path): Directorio de salida.
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        password (str): Contraseña para el acceso SFTP.
+        lista_archivos_copiar (List[str]): Lista de nombres de archivos a descargar. Si está vacía se usan las facturas del mes vencido.
+        destino (str): Directorio destino donde se guardarán los archivos descargados.
+        concurrencia (Optional[int]): Flujos de descarga simultáneos. Por defecto DESCARGA_CONCURRENCIA.
+        progreso (Optional[Progreso]): Donde se reporta el avance si el proceso corre como trabajo.
 
     Returns:
         None
+
+    Raises:
+        IOError: Si algún archivo de la lista no quedó descargado (el manifiesto permite retomarlo).
+        Exception: Cualquier error de conexión o del servidor, para que el trabajo se dé por fallido.
     """
+    _logger.info(f"Entrando en la funcion de descarga")
+    lista_archivos_copiar = lista_archivos_copiar or filtrar_facturas_mes_vencido(conteo_archivos)
     try:
-        with tarfile.open(file_path, 'r:gz') as tar_ref:
-            # Verificar si todos los archivos ya están descomprimidos
-            all_files_exist = all((output_dir / member).exists() for member in tar_ref.getnames())
-            if all_files_exist:
-                _logger.info(f"El archivo TAR.GZ: {file_path} ya esta descomprimido")
-                return  # Salir sin extraer nada
-
-            # Extraer los archivos si no están descomprimidos
-            _logger.info(f"Descomprimiendo archivo TAR.GZ: {file_path}")
-            tar_ref.extractall(output_dir)
-        _logger.info(f"Archivo TAR.GZ descomprimido: {file_path}")
+        # Descargar los archivos que coinciden con los nombres en la lista
+        pool = obtener_pool(host, port, username, password)
+        descargar_archivos_paralelo(pool, lista_archivos_copiar, Path.cwd() / destino, concurrencia=concurrencia, progreso=progreso)
     except Exception as e:
-        _logger.error(f"Error al descomprimir el archivo TAR.GZ {file_path}: {e}")
-            
+        # Los errores de cada bloque ya se cuentan en descargas.py; aquí llegan los de conexión y planificación
+        registrar_error("descarga")
+        _logger.error(f"Error en descargar_archivos_sftp: {e}")
+        raise
+    comprobar_descarga(lista_archivos_copiar, Path.cwd() / destino)
 
-def descomprimir_archivos(directorio: str) -> str:
+
+def descomprimir_archivos(directorio: str, workers: Optional[int] = None, progreso: Optional[Progreso] = None,
+                          nombres: Optional[List[str]] = None) -> str:
     """
-    Descomprime todos los archivos .zip, .rar y .tar.gz en el directorio dado.
+    Descomprime todos los archivos .zip, .rar y .tar.gz (o .tgz) en el directorio dado. El formato se
+    reconoce por los primeros bytes del archivo, no solo por la extensión (ver descompresion.detectar_formato).
+    Los archivos se descomprimen en paralelo en un pool de procesos (ver descompresion.descomprimir_en_paralelo).
 
     Args:
         directorio (str): Ruta del directorio donde se encuentran los archivos comprimidos.
+        workers (Optional[int]): Cantidad de procesos. Por defecto DESCOMPRESION_WORKERS o los núcleos disponibles.
+        progreso (Optional[Progreso]): Donde se reporta el avance si el proceso corre como trabajo.
+        nombres (Optional[List[str]]): Si se indica, solo se descomprimen los archivos con estos nombres.
 
     Returns:
-        None
+        str: Nombre de la carpeta 'YYYYMM' donde se descomprimió.
     """
     dir_path = Path(directorio)
     _logger.info(f"Iniciando descompresion")
@@ -305,26 +245,31 @@ def descomprimir_archivos(directorio: str) -> str:
         raise FileNotFoundError(f"El directorio {directorio} no existe o no es un directorio valido")
     
     output_dir_name = None
+    archivos = []
 
     # Recorrer todos los archivos en el directorio
     for file_path in dir_path.iterdir():
-        if file_path.suffix in ['.zip', '.rar'] or file_path.name.endswith('.tar.gz'):
+        if nombres is not None and file_path.name not in nombres:
+            continue
+        if file_path.is_dir() or file_path.name.startswith('.') or file_path.name.endswith(SUFIJO_PARCIAL):
+            # Carpetas de salida 'YYYYMM', archivos de control (manifiesto de descargas) y descargas a medias
+            continue
+        if detectar_formato(file_path):
             # Tomar los primeros 6 caracteres del nombre del archivo
             output_dir_name = file_path.name[:6]
             output_dir = dir_path / output_dir_name
 
             # Crear el directorio de salida si no existe
             output_dir.mkdir(parents=True, exist_ok=True)
-
-            # Llamar a la función adecuada para descomprimir
-            if file_path.suffix == '.zip':
-                descomprimir_zip(file_path, output_dir)  # Usar output_dir
-            elif file_path.suffix == '.rar':
-                descomprimir_rar(file_path, output_dir)  # Usar output_dir
-            elif file_path.name.endswith('.tar.gz') or file_path.suffix in ['.tar.gz', '.tgz']:
-                descomprimir_tar_gz(file_path, output_dir)  # Usar output_dir
+            archivos.append((file_path, output_dir))
         else:
             _logger.warning(f"Tipo de archivo no soportado: {file_path}")
+
+    # Los PDF apenas se comprimen: lo extraído ocupa aproximadamente lo mismo que los comprimidos
+    avisar_espacio_insuficiente(dir_path, sum(file_path.stat().st_size for file_path, _ in archivos))
+
+    # Llamar a la función adecuada para cada formato, varios archivos a la vez
+    descomprimir_en_paralelo(archivos, workers, progreso)
     
     if output_dir_name:
         return output_dir_name
@@ -332,12 +277,13 @@ def descomprimir_archivos(directorio: str) -> str:
         raise ValueError("No se encontraron archivos comprimidos válidos en el directorio")
             
 
-def eliminar_comprimidos(directorio: str) -> None:
+def eliminar_comprimidos(directorio: str, nombres: Optional[List[str]] = None) -> None:
     """
-    Elimina archivos comprimidos (.zip, .rar, .tar.gz) en el directorio dado.
+    Elimina archivos comprimidos (.zip, .rar, .tar.gz o .tgz) en el directorio dado. Las descargas a medias se conservan.
     
     Args: 
         directorio (str): Ruta del directorio donde se encuentran los archivos comprimidos.
+        nombres (Optional[List[str]]): Si se indica, solo se eliminan los archivos con estos nombres.
          
     Returns:
         None
@@ -354,7 +300,9 @@ def eliminar_comprimidos(directorio: str) -> None:
 
     # Recorrer todos los archivos en el directorio
     for file_path in dir_path.iterdir():
-        if file_path.suffix in ['.zip', '.rar'] or file_path.name.endswith('.tar.gz'):
+        if nombres is not None and file_path.name not in nombres:
+            continue
+        if not file_path.name.endswith(SUFIJO_PARCIAL) and detectar_formato(file_path):
             try:
                 os.remove(file_path)
                 _logger.info(f"Archivo {file_path} eliminado")
@@ -362,16 +310,99 @@ def eliminar_comprimidos(directorio: str) -> None:
                 _logger.error(f"No se puedo eliminar el archivo: {e}")
 
 
-def subir_carpeta_a_sftp(host: str, port: int, username: str, password: str, carpeta_local: str, carpeta_buscar: str) -> None:
+def procesar_secuencial(pool: PoolSFTP, archivos: List[str], destino: Path, informe: InformeEjecucion,
+                        workers: Optional[int] = None, progreso: Optional[Progreso] = None,
+                        registro: Optional[RegistroEjecuciones] = None, catalogo: Optional[CatalogoFacturas] = None) -> str:
+    """
+    Descarga, descomprime y borra los comprimidos de uno en uno, para cuando no cabe todo en disco a la vez.
+    En cada momento solo hay en disco un comprimido además de lo ya extraído. Con registro, cada paso
+    queda anotado al terminar y los comprimidos ya descargados y verificados no se vuelven a descargar.
+
+    Args:
+        pool (PoolSFTP): Pool de conexiones SFTP.
+        archivos (List[str]): Comprimidos remotos a procesar.
+        destino (Path): Directorio de descarga y descompresión.
+        informe (InformeEjecucion): Informe donde se mide cada paso.
+        workers (Optional[int]): Procesos usados para descomprimir.
+        progreso (Optional[Progreso]): Donde se reporta el avance si el proceso corre como trabajo.
+        registro (Optional[RegistroEjecuciones]): Registro donde se anota la etapa de cada comprimido.
+        catalogo (Optional[CatalogoFacturas]): Catálogo donde se anotan los PDF en cuanto se extraen (ver catalogo.py).
+
+    Returns:
+        str: Nombre de la carpeta 'YYYYMM' donde se descomprimió.
+    """
+    carpeta_buscar = None
+    for archivo in archivos:
+        periodo = extraer_fecha(archivo)
+        if registro is None or registro.pendientes(periodo, [archivo], "verificado", destino):
+            with informe.etapa(f"descarga_{archivo}", progreso, "descarga"):
+                descargar_archivos_paralelo(pool, [archivo], destino, progreso=progreso)
+                comprobar_descarga([archivo], destino)
+            if registro is not None and not registro.registrar_descarga(periodo, [archivo], destino):
+                _logger.error(f"{archivo} no coincide con el tamaño del servidor, se deja para la proxima ejecucion")
+                continue
+        with informe.etapa(f"descompresion_{archivo}", progreso, "descompresion"):
+            carpeta_buscar = descomprimir_archivos(destino, workers, progreso, nombres=[archivo])
+        if registro is not None:
+            registro.registrar_extraccion(periodo, [archivo], Path(destino) / carpeta_buscar)
+        if catalogo is not None:
+            catalogo.registrar_carpeta(carpeta_buscar, Path(destino) / carpeta_buscar, [])
+        eliminar_comprimidos(destino, nombres=[archivo])
+    if carpeta_buscar is None:
+        raise ValueError("No se encontraron archivos comprimidos válidos para procesar")
+    return carpeta_buscar
+
+
+def descomprimir_pendientes(registro: RegistroEjecuciones, periodo: str, archivos: List[str], destino: Path,
+                            workers: Optional[int] = None, progreso: Optional[Progreso] = None,
+                            catalogo: Optional[CatalogoFacturas] = None) -> str:
+    """
+    Descomprime los comprimidos del periodo que el registro da por descargados y verificados pero
+    todavía no extraídos, y anota su extracción (y los PDF en el catálogo, si se indica).
+
+    Args:
+        registro (RegistroEjecuciones): Registro de ejecuciones.
+        periodo (str): Periodo 'YYYYMM'.
+        archivos (List[str]): Comprimidos pendientes del periodo.
+        destino (Path): Directorio de descarga y descompresión.
+        workers (Optional[int]): Procesos usados para descomprimir.
+        progreso (Optional[Progreso]): Donde se reporta el avance si el proceso corre como trabajo.
+        catalogo (Optional[CatalogoFacturas]): Catálogo donde se anotan los PDF extraídos (ver catalogo.py).
+
+    Returns:
+        str: Nombre de la carpeta 'YYYYMM' con lo extraído.
+
+    Raises:
+        ValueError: Si no hay ningún comprimido descargado del periodo.
+    """
+    a_extraer = registro.en_etapa(periodo, archivos, "verificado")
+    sin_descargar = registro.pendientes(periodo, archivos, "verificado")
+    if sin_descargar:
+        _logger.warning(f"Comprimidos sin descargar o verificar, se reintentan en la proxima ejecucion: {sin_descargar}")
+    if not a_extraer:
+        if len(sin_descargar) == len(archivos):
+            raise ValueError("No se encontraron archivos comprimidos válidos en el directorio")
+        _logger.info(f"Los comprimidos de {periodo} ya estaban extraidos")
+        return periodo
+    carpeta_buscar = descomprimir_archivos(destino, workers, progreso, nombres=a_extraer)
+    registro.registrar_extraccion(periodo, a_extraer, Path(destino) / carpeta_buscar)
+    if catalogo is not None:
+        catalogo.registrar_carpeta(carpeta_buscar, Path(destino) / carpeta_buscar, [])
+    return carpeta_buscar
+
+
+def subir_carpeta_a_sftp(host: str, port: int, username: str, password: str, carpeta_local: str, carpeta_buscar: str, concurrencia: Optional[int] = None, progreso: Optional[Progreso] = None,
+                         catalogo: Optional[CatalogoFacturas] = None) -> List[Path]:
     """
     Busca una carpeta específica en el directorio local y sube su contenido a un servidor SFTP. 
     
     Esta función realiza los siguientes pasos: 
-    1. Conectarse al servidor SFTP. 
+    1. Tomar una conexión del pool SFTP compartido. 
     2. Buscar la carpeta especificada en el directorio local. 
-    3. Si la carpeta se encuentra, verificar si el directorio remoto existe en el servidor SFTP. 
-    4. Crear el directorio remoto si no existe. 
-    5. Subir los archivos PDF de la carpeta local al directorio remoto en el servidor SFTP. 
+    3. Si la carpeta se encuentra, listar una sola vez el directorio remoto (creándolo si no existe). 
+    4. Comparar localmente nombres y tamaños (y, con SUBIDA_VERIFICACION=hash, el manifiesto de hashes
+       de la carpeta remota) para saber qué PDF faltan o cambiaron (ver subidas.VerificacionSubida). 
+    5. Subir esos PDF en paralelo por varios canales del pool (ver subidas.subir_archivos_paralelo). 
     
     Args: 
         host (str): Dirección del servidor SFTP. 
@@ -380,13 +411,14 @@ def subir_carpeta_a_sftp(host: str, port: int, username: str, password: str, car
         password (str): Contraseña para el acceso SFTP. 
         carpeta_local (str): Ruta del directorio local donde se buscará la carpeta. 
         carpeta_buscar (str): Nombre de la carpeta a buscar y subir. 
+        concurrencia (Optional[int]): Canales subiendo a la vez. Por defecto SUBIDA_CONCURRENCIA.
+        progreso (Optional[Progreso]): Donde se reporta el avance si el proceso corre como trabajo.
+        catalogo (Optional[CatalogoFacturas]): Catálogo donde se anotan los PDF de la carpeta con su ruta remota (ver catalogo.py).
     Returns: 
-        None
+        List[Path]: PDF de la carpeta que quedaron en el sftp (los que ya estaban y los subidos ahora).
     """
-    sftp, transport = cliente_sft(host, port, username, password)
-    
     carpeta_local_path = Path(carpeta_local)
-    
+
     def buscar_carpeta(carpeta_local_path: Path, carpeta_buscar: str):
         """
         Busca una carpeta específica dentro de un directorio dado.
@@ -404,90 +436,89 @@ def subir_carpeta_a_sftp(host: str, port: int, username: str, password: str, car
                 _logger.debug(f"Carpeta encontrada: {item}")
                 return item
         return None
-    
+
     carpeta_encontrada = buscar_carpeta(carpeta_local_path, carpeta_buscar)
-    
-    if carpeta_encontrada:
-        _logger.info(f"Carpeta {carpeta_encontrada} encontrada y lista para subir su contenido al SFTP")
-        try:
-            # Obtén la ruta de inicio del usuario
-            home_directory = sftp.normalize(".")
-            _logger.info(f"La ruta de inicio del usuario SFTP es: {home_directory}")
-            
-            # Ajusta la ruta remota
-            remote_directory_path = f"{home_directory.rstrip('/')}/{carpeta_encontrada.name}"
-
-            # Verificar si el directorio remoto existe
-            _logger.info(f"Verificando si el directorio remoto {remote_directory_path} existe.")
-            sftp.stat(remote_directory_path)
-            _logger.info(f"Directorio remoto {remote_directory_path} ya existe.")
-        except FileNotFoundError:
-            # Si no existe, intenta crearlo
-            _logger.info(f"Directorio remoto {remote_directory_path} no existe. Intentando crearlo...")
-            try:
-                sftp.mkdir(remote_directory_path)
-                _logger.info(f"Directorio remoto creado exitosamente: {remote_directory_path}")
-            except Exception as e:
-                _logger.error(f"Error creando directorio remoto {remote_directory_path}: {e}")
-                raise
+    if not carpeta_encontrada:
+        _logger.warning(f"No se encontró la carpeta {carpeta_buscar} en la carpeta {carpeta_local}")
+        return []
 
-            except IOError as e:
-                # Maneja cualquier otro error de entrada/salida
-                _logger.error(f"Error al verificar o crear el directorio remoto {remote_directory_path}: {e}")
-                raise
-        except Exception as e:
-            # Maneja errores inesperados
-            _logger.error(f"Error inesperado al manejar el directorio remoto {remote_directory_path}: {e}")
-            raise
+    _logger.info(f"Carpeta {carpeta_encontrada} encontrada y lista para subir su contenido al SFTP")
+    pool = obtener_pool(host, port, username, password)
+    with pool.sesion() as sftp:
+        # Obtén la ruta de inicio del usuario
+        home_directory = sftp.normalize(".")
+        _logger.info(f"La ruta de inicio del usuario SFTP es: {home_directory}")
 
+        # Ajusta la ruta remota
+        remote_directory_path = f"{home_directory.rstrip('/')}/{carpeta_encontrada.name}"
         try:
-            cantidad_de_copiados = 0
-            cantidad_de_verificados = 0
-        # Iterar sobre todos los archivos PDF en la carpeta encontrada
-            for pdf_file in carpeta_encontrada.glob('*.pdf'):
-                remote_file_path = f"{remote_directory_path}/{pdf_file.name}"                
-                sftp.stat(remote_directory_path).st_mode 
-                
-                # Subir el archivo PDF al SFTP
-                
-                try:
-                    remote_file_stat = sftp.stat(remote_file_path)
-                    remote_file_size = remote_file_stat.st_size
-                    local_file_size = pdf_file.stat().st_size
-                    cantidad_de_verificados += 1
-                    if remote_file_size == local_file_size:
-                        print(f"Archivo {remote_file_path} ya existe y tiene el mismo tamaño, no se hace nada y se revisa el siguiente")
-                        print("")
-                    else:
-                        sftp.put(str(pdf_file), remote_file_path)
-                        print(f"Archivo {pdf_file} subido a {remote_file_path}")
-                        cantidad_de_copiados += 1
-                except FileNotFoundError:
-                    sftp.put(str(pdf_file), remote_file_path)
-                    print(f"Archivo {pdf_file} subido a {remote_file_path}")
-                    cantidad_de_verificados += 1
-                    cantidad_de_copiados += 1
-            sftp.close()
-            transport.close()
-            
-            if cantidad_de_copiados == cantidad_de_verificados:
-                _logger.info(f"Carpeta subida exitosamente al sftp")
-            else:
-                _logger.info(f"Ya la carpeta con las facturas se encontraban subidas al sftp")
-            
-            _logger.info(f"Cantidad de archivos verificados: {cantidad_de_verificados}")
-            _logger.info(f"Cantidad de archivos subidos al sftp: {cantidad_de_copiados}")
-        except IOError as e:
-            _logger.error(f"Error al subir la carpeta: {e}")
+            indice = indice_remoto(sftp, remote_directory_path)
         except Exception as e:
-            _logger.error(f"Error inesperado al subir la carpeta: {e}")
-    else:
-        _logger.warning(f"No se encontró la carpeta {carpeta_buscar} en la carpeta {carpeta_local}")
-        sftp.close()
-        transport.close()
+            _logger.error(f"Error al verificar o crear el directorio remoto {remote_directory_path}: {e}")
+            raise
+
+    en_servidor: List[Path] = []
+    try:
+        archivos_pdf = list(carpeta_encontrada.glob('*.pdf'))
+        verificacion = VerificacionSubida(carpeta_encontrada, remote_directory_path)
+        with pool.sesion() as sftp:
+            pendientes = verificacion.pendientes(sftp, archivos_pdf, indice)
+        _logger.info(f"{len(archivos_pdf) - len(pendientes)} archivos ya estaban en el sftp (verificacion por {verificacion.modo}), {len(pendientes)} por subir")
+        por_subir = set(pendientes)
+        en_servidor = [archivo for archivo in archivos_pdf if archivo not in por_subir]
+        subidos = subir_archivos_paralelo(pool, pendientes, remote_directory_path, concurrencia=concurrencia, progreso=progreso)
+        en_servidor.extend(subidos)
+        with pool.sesion() as sftp:
+            verificacion.registrar(sftp, en_servidor, indice)
+        if catalogo is not None:
+            catalogo.registrar_carpeta(carpeta_encontrada.name, carpeta_encontrada, en_servidor, remote_directory_path)
+
+        if len(subidos) == len(archivos_pdf):
+            _logger.info(f"Carpeta subida exitosamente al sftp")
+        elif len(subidos) == len(pendientes):
+            _logger.info(f"Ya la carpeta con las facturas se encontraban subidas al sftp")
+        else:
+            _logger.warning(f"No se pudieron subir {len(pendientes) - len(subidos)} archivos al sftp")
+
+        _logger.info(f"Cantidad de archivos verificados: {len(archivos_pdf)}")
+        _logger.info(f"Cantidad de archivos subidos al sftp: {len(subidos)}")
+    except IOError as e:
+        _logger.error(f"Error al subir la carpeta: {e}")
+    except Exception as e:
+        _logger.error(f"Error inesperado al subir la carpeta: {e}")
+    return en_servidor
+
 
+def notificar_inicio() -> None:
+    """
+    Encola el SMS de aviso de comienzo del procesamiento. No espera al servidor de SMS (ver sms.DespachadorSMS).
 
-def ejecutar_descompactar_facturas(host:str , port: int , username:str, password) -> None:
+    Returns:
+        None
+    """
+    notificar("Comenzando procesamiento de facturas de Cubacel Online")
+
+
+@contextmanager
+def notificar_resultado(periodo: str):
+    """
+    Encola un SMS al terminar el bloque, indicando si el procesamiento del periodo terminó o falló.
+
+    Args:
+        periodo (str): Periodo (o rango de periodos) procesado.
+    """
+    try:
+        yield
+    except Exception as e:
+        notificar(f"Procesamiento de facturas de Cubacel Online {periodo} fallido: {e}")
+        raise
+    notificar(f"Procesamiento de facturas de Cubacel Online {periodo} terminado")
+
+
+def ejecutar_descompactar_facturas(host:str , port: int , username:str, password, modo_streaming: Optional[bool] = None, workers: Optional[int] = None, progreso: Optional[Progreso] = None,
+                                   directorio_trabajo: Optional[Path] = None, descargar: Callable[..., Any] = descargar_archivos_sftp,
+                                   subir: Callable[..., List[Path]] = subir_carpeta_a_sftp,
+                                   listar: Callable[..., ConteoArchivos] = read_from_sftp) -> None:
     """
     Realiza el proceso de descompactación y subida de facturas a un servidor SFTP. 
     Este proceso incluye: 
@@ -497,42 +528,297 @@ def ejecutar_descompactar_facturas(host:str , port: int , username:str, password
     4. Descargar archivos filtrados desde el servidor SFTP. 
     5. Descomprimir los archivos descargados. 
     6. Subir la carpeta descomprimida al servidor SFTP.
+
+    En modo streaming los pasos 4 a 6 se sustituyen por streaming.procesar_archivos_streaming, que lee
+    los comprimidos directamente del servidor y sube cada PDF sin guardarlo en disco. Los archivos que
+    no se pueden leer en flujo (.rar) siguen el camino normal.
+
+    Cada paso queda anotado por comprimido en el registro de ejecuciones (ver registro_ejecuciones.py):
+    si el proceso se corta, la siguiente ejecución retoma cada comprimido en su primera etapa incompleta.
     
     Args: 
         host (str): Dirección del servidor SFTP. 
         port (int): Puerto del servidor SFTP. 
         username (str): Nombre de usuario para el acceso SFTP. 
         password (str): Contraseña para el acceso SFTP. 
+        modo_streaming (Optional[bool]): Activa el modo streaming. Por defecto se toma de MODO_STREAMING en el .env.
+        workers (Optional[int]): Procesos usados para descomprimir. Por defecto DESCOMPRESION_WORKERS.
+        progreso (Optional[Progreso]): Donde se reporta la etapa y el avance si el proceso corre como trabajo (ver trabajos.py).
+        directorio_trabajo (Optional[Path]): Directorio local de la cuenta (descargas, registro e informes) si se
+            procesan varias cuentas (ver cuentas.py). Por defecto, el directorio actual.
+        descargar (Callable[..., Any]): Descarga de los comprimidos, con la firma de descargar_archivos_sftp.
+        subir (Callable[..., List[Path]]): Subida de una carpeta, con la firma de subir_carpeta_a_sftp. La API
+            pasa versiones que corren en su bucle de eventos (ver sftp_async.py).
+        listar (Callable[..., ConteoArchivos]): Listado del directorio remoto, con la firma de read_from_sftp.
     Returns: 
         None
     """
     # Llamar a la configuración global
-    clear_console()
+    if directorio_trabajo is None and progreso is None:
+        # Solo desde la consola: ni con varias cuentas a la vez ni como trabajo de la API
+        clear_console()
     fecha_mes_vencido_log = fecha_mes_vencido()
     configurar_logging(fecha_mes_vencido_log)
     
 
     _logger.info("Configuración de logging completada.")
-    auth_url = os.getenv("AUTH_URL")
-    username_sms = os.getenv("USERNAME_SMS")
-    password_sms = os.getenv("PASSWORD_SMS")
-    sms_url = os.getenv("SMS_URL")
-    token = obtener_token_servidor_sms(auth_url, username_sms, password_sms)
-    mensaje_sms = "Comenzando procesamiento de facturas de Cubacel Online"
-    destinos = ["51368261","52888880"]
-    if token:
-        envio_sms(sms_url, token, mensaje_sms, destinos)
-    conteo_archivos = read_from_sftp(host, port, username, password)
-    print()
-    _logger.info(f"Lista de archivos .tar.gz encontrados: {conteo_archivos.tar_gz_files}") 
-    _logger.info(f"Lista de archivos .zip encontrados: {conteo_archivos.zip_files}") 
-    _logger.info(f"Lista de archivos .rar encontrados: {conteo_archivos.rar_files}")
-    
-    lista_archivos_copiar = lista_archivos_copiar_1
-    destino_descarga = "archivos_descargados"
-    direccion_destino_descarga = Path.cwd() / destino_descarga
-    direccion_destino_descarga.mkdir(parents=True, exist_ok=True)
-    descargar_archivos_sftp(conteo_archivos, host, port, username, password, lista_archivos_copiar, direccion_destino_descarga)
-    carpeta_buscar = descomprimir_archivos(direccion_destino_descarga)
-    subir_carpeta_a_sftp(host, port, username, password, destino_descarga, carpeta_buscar) 
-    # eliminar_comprimidos(direccion_destino_descarga)
\ No newline at end of file
+    # El informe mide cada etapa y al terminar se guarda en logs/ como JSON (ver metricas.py)
+    with notificar_resultado(fecha_mes_vencido_log), \
+            InformeEjecucion(fecha_mes_vencido_log, Path(directorio_trabajo or ".") / "logs") as informe:
+        with informe.etapa("autenticacion_sms", progreso):
+            notificar_inicio()
+        with informe.etapa("listado", progreso):
+            conteo_archivos = listar(host, port, username, password)
+        print()
+        # Solo los totales en INFO: el listado completo puede tener miles de nombres
+        _logger.info(f"Comprimidos encontrados: {len(conteo_archivos.tar_gz_files)} .tar.gz, "
+                     f"{len(conteo_archivos.zip_files)} .zip, {len(conteo_archivos.rar_files)} .rar")
+        _logger.debug("Lista de archivos .tar.gz encontrados: %s", conteo_archivos.tar_gz_files)
+        _logger.debug("Lista de archivos .zip encontrados: %s", conteo_archivos.zip_files)
+        _logger.debug("Lista de archivos .rar encontrados: %s", conteo_archivos.rar_files)
+        
+        lista_archivos_copiar = filtrar_facturas_mes_vencido(conteo_archivos)
+        procesar_periodo(host, port, username, password, fecha_mes_vencido_log, lista_archivos_copiar, conteo_archivos,
+                         informe, modo_streaming, workers, progreso, directorio_trabajo, descargar, subir)
+
+
+def procesar_periodo(host: str, port: int, username: str, password: str, periodo: str, archivos: List[str],
+                     conteo_archivos: ConteoArchivos, informe: InformeEjecucion, modo_streaming: Optional[bool] = None,
+                     workers: Optional[int] = None, progreso: Optional[Progreso] = None,
+                     directorio_trabajo: Optional[Path] = None, descargar: Callable[..., Any] = descargar_archivos_sftp,
+                     subir: Callable[..., List[Path]] = subir_carpeta_a_sftp) -> None:
+    """
+    Lleva los comprimidos de un periodo por planificación, descarga, descompresión y subida. Cada
+    comprimido retoma en la etapa donde lo dejó el registro de ejecuciones y los ya subidos se omiten.
+
+    Es el único camino del proceso: la versión de la API (sftp_async.py) lo corre en un hilo y solo
+    cambia 'descargar' y 'subir' por las transferencias asyncio.
+
+    Args:
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        password (str): Contraseña para el acceso SFTP.
+        periodo (str): Periodo 'YYYYMM' de los comprimidos.
+        archivos (List[str]): Comprimidos remotos del periodo a procesar.
+        conteo_archivos (ConteoArchivos): Listado remoto, con el tamaño y la fecha de cada comprimido.
+        informe (InformeEjecucion): Informe donde se mide cada etapa.
+        modo_streaming (Optional[bool]): Activa el modo streaming. Por defecto se toma de MODO_STREAMING en el .env.
+        workers (Optional[int]): Procesos usados para descomprimir.
+        progreso (Optional[Progreso]): Donde se reporta la etapa y el avance si el proceso corre como trabajo.
+        directorio_trabajo (Optional[Path]): Directorio local de la cuenta. Por defecto, el directorio actual.
+        descargar (Callable[..., Any]): Descarga de los comprimidos, con la firma de descargar_archivos_sftp.
+        subir (Callable[..., List[Path]]): Subida de una carpeta, con la firma de subir_carpeta_a_sftp.
+
+    Returns:
+        None
+    """
+    # Lo ya subido en una ejecución anterior se omite sin consultar al servidor (ver registro_ejecuciones.py)
+    registro = obtener_registro(ruta_registro(directorio_trabajo))
+    archivos = registro.iniciar_periodo(periodo, archivos, conteo_archivos.atributos)
+    if not archivos:
+        _logger.info(f"Las facturas de {periodo} ya se procesaron en una ejecucion anterior")
+        return
+
+    direccion_destino_descarga = Path(directorio_trabajo or Path.cwd()) / "archivos_descargados"
+    destino_descarga = str(direccion_destino_descarga)
+    pool = obtener_pool(host, port, username, password)
+    catalogo = obtener_catalogo(ruta_catalogo(directorio_trabajo))
+    # Antes de descargar nada se comprueba que lo descargado y lo extraído quepan en disco (ver planificacion.py)
+    with informe.etapa("planificacion", progreso):
+        # Lo ya extraído no vuelve a ocupar disco y lo ya descargado y verificado no se descarga otra vez
+        a_extraer = registro.pendientes(periodo, archivos, "extraido")
+        plan = planificar_espacio(pool, a_extraer, direccion_destino_descarga,
+                                  tamanhos_remotos={a: t[0] for a, t in conteo_archivos.atributos.items()},
+                                  a_descargar=registro.pendientes(periodo, a_extraer, "verificado", direccion_destino_descarga))
+
+    if modo_streaming is None:
+        modo_streaming = os.getenv("MODO_STREAMING", "").lower() in ("1", "true", "si")
+    modo_streaming = modo_streaming or plan.estrategia == "streaming"
+    if modo_streaming:
+        with informe.etapa("streaming", progreso):
+            restantes = procesar_archivos_streaming(pool, archivos, progreso=progreso, catalogo=catalogo)
+        registro.avanzar(periodo, [a for a in archivos if a not in restantes], "subido")
+        archivos = restantes
+        if not archivos:
+            _logger.info("Todos los archivos se procesaron en modo streaming")
+            return
+
+    if plan.estrategia != "paralelo":
+        # Sin espacio para todo a la vez: cada comprimido se borra en cuanto se extrae
+        a_extraer = registro.pendientes(periodo, archivos, "extraido")
+        carpeta_buscar = (procesar_secuencial(pool, a_extraer, direccion_destino_descarga, informe, workers, progreso, registro,
+                                              catalogo) if a_extraer else periodo)
+    else:
+        with informe.etapa("descarga", progreso):
+            a_descargar = registro.pendientes(periodo, archivos, "verificado", direccion_destino_descarga)
+            if a_descargar:
+                descargar(conteo_archivos, host, port, username, password, a_descargar, direccion_destino_descarga, progreso=progreso)
+            registro.registrar_descarga(periodo, a_descargar, direccion_destino_descarga)
+        with informe.etapa("descompresion", progreso):
+            carpeta_buscar = descomprimir_pendientes(registro, periodo, archivos,
+                                                     direccion_destino_descarga, workers, progreso, catalogo)
+    with informe.etapa("subida", progreso):
+        en_servidor = subir(host, port, username, password, destino_descarga, carpeta_buscar, progreso=progreso,
+                            catalogo=catalogo)
+        registro.registrar_subida(periodo, [pdf.name for pdf in en_servidor])
+        # eliminar_comprimidos(direccion_destino_descarga)
+
+
+def ejecutar_archivos_nuevos(host: str, port: int, username: str, password: str, periodo: str, archivos: List[str],
+                             conteo_archivos: ConteoArchivos, modo_streaming: Optional[bool] = None,
+                             workers: Optional[int] = None, progreso: Optional[Progreso] = None,
+                             directorio_trabajo: Optional[Path] = None) -> None:
+    """
+    Procesa solo los comprimidos indicados de un periodo, sin volver a listar el servidor. Es lo que
+    lanza el vigilante remoto (ver vigilancia_remota.py) en cuanto un comprimido nuevo termina de llegar.
+
+    Args:
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        password (str): Contraseña para el acceso SFTP.
+        periodo (str): Periodo 'YYYYMM' de los comprimidos.
+        archivos (List[str]): Comprimidos a procesar.
+        conteo_archivos (ConteoArchivos): Listado remoto del que salen el tamaño y la fecha de cada comprimido.
+        modo_streaming (Optional[bool]): Activa el modo streaming. Por defecto se toma de MODO_STREAMING en el .env.
+        workers (Optional[int]): Procesos usados para descomprimir.
+        progreso (Optional[Progreso]): Donde se reporta la etapa y el avance si el proceso corre como trabajo.
+        directorio_trabajo (Optional[Path]): Directorio local de la cuenta (ver cuentas.py). Por defecto, el directorio actual.
+
+    Returns:
+        None
+    """
+    configurar_logging(periodo)
+    _logger.info(f"Procesando {len(archivos)} comprimidos nuevos de {periodo}")
+    _logger.debug("Comprimidos nuevos: %s", archivos)
+    with notificar_resultado(periodo), InformeEjecucion(periodo, Path(directorio_trabajo or ".") / "logs") as informe:
+        procesar_periodo(host, port, username, password, periodo, archivos, conteo_archivos,
+                         informe, modo_streaming, workers, progreso, directorio_trabajo)
+
+
+def ejecutar_backfill(host: str, port: int, username: str, password: str, desde: str, hasta: str,
+                      modo_streaming: Optional[bool] = None, workers: Optional[int] = None, progreso: Optional[Progreso] = None,
+                      directorio_trabajo: Optional[Path] = None) -> List[str]:
+    """
+    Procesa de una vez todos los periodos de un rango (por ejemplo para ponerse al día tras una caída).
+
+    El directorio remoto se lista una sola vez y los comprimidos se agrupan por periodo con
+    indice_periodos. Los periodos se procesan en cadena compartiendo las conexiones del pool:
+    mientras un periodo se descomprime y se sube, ya se está descargando el siguiente. Cada periodo
+    se descomprime en su carpeta 'YYYYMM', igual que en el proceso del mes vencido. Como en ese
+    proceso, el registro de ejecuciones hace que relanzar un backfill cortado retome cada periodo
+    donde quedó y omita los comprimidos ya subidos.
+
+    Args:
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        password (str): Contraseña para el acceso SFTP.
+        desde (str): Primer periodo 'YYYYMM' a procesar.
+        hasta (str): Último periodo 'YYYYMM' a procesar.
+        modo_streaming (Optional[bool]): Activa el modo streaming. Por defecto se toma de MODO_STREAMING en el .env.
+        workers (Optional[int]): Procesos usados para descomprimir. Por defecto DESCOMPRESION_WORKERS.
+        progreso (Optional[Progreso]): Donde se reporta la etapa y el avance si el proceso corre como trabajo.
+        directorio_trabajo (Optional[Path]): Directorio local de la cuenta. Por defecto, el directorio actual.
+
+    Returns:
+        List[str]: Periodos procesados satisfactoriamente.
+
+    Raises:
+        RuntimeError: Si algún periodo no se pudo procesar (los demás se procesan igual).
+    """
+    periodos = rango_periodos(desde, hasta)
+    configurar_logging(f"{desde}_{hasta}")
+    _logger.info(f"Iniciando backfill de los periodos {desde} a {hasta}")
+    notificar(f"Comenzando procesamiento de facturas de Cubacel Online de {desde} a {hasta}")
+
+    with InformeEjecucion(f"{desde}_{hasta}", Path(directorio_trabajo or ".") / "logs") as informe:
+        with informe.etapa("listado", progreso):
+            conteo_archivos = read_from_sftp(host, port, username, password)
+            indice = indice_periodos(conteo_archivos)
+        sin_archivos = [periodo for periodo in periodos if periodo not in indice]
+        if sin_archivos:
+            _logger.warning(f"No hay archivos en el sftp para los periodos: {sin_archivos}")
+        # Los comprimidos ya subidos en ejecuciones anteriores se omiten (ver registro_ejecuciones.py)
+        registro = obtener_registro(ruta_registro(directorio_trabajo))
+        pendientes = {periodo: registro.iniciar_periodo(periodo, indice[periodo], conteo_archivos.atributos)
+                      for periodo in periodos if periodo in indice}
+
+        direccion_destino_descarga = Path(directorio_trabajo or Path.cwd()) / "archivos_descargados"
+        destino_descarga = str(direccion_destino_descarga)
+        pool = obtener_pool(host, port, username, password)
+        catalogo = obtener_catalogo(ruta_catalogo(directorio_trabajo))
+        # En el backfill los comprimidos de todos los periodos se quedan en disco: se planifica sobre el total
+        with informe.etapa("planificacion", progreso):
+            sin_extraer = {periodo: registro.pendientes(periodo, archivos, "extraido") for periodo, archivos in pendientes.items()}
+            plan = planificar_espacio(pool, [a for archivos in sin_extraer.values() for a in archivos], direccion_destino_descarga,
+                                      tamanhos_remotos={a: t[0] for a, t in conteo_archivos.atributos.items()},
+                                      a_descargar=[a for periodo, archivos in sin_extraer.items()
+                                                   for a in registro.pendientes(periodo, archivos, "verificado", direccion_destino_descarga)])
+        if modo_streaming is None:
+            modo_streaming = os.getenv("MODO_STREAMING", "").lower() in ("1", "true", "si")
+        modo_streaming = modo_streaming or plan.estrategia == "streaming"
+        if modo_streaming:
+            with informe.etapa("streaming", progreso):
+                restantes = set(procesar_archivos_streaming(pool, [a for archivos in pendientes.values() for a in archivos],
+                                                            progreso=progreso, catalogo=catalogo))
+            for periodo, archivos in pendientes.items():
+                registro.avanzar(periodo, [a for a in archivos if a not in restantes], "subido")
+            pendientes = {periodo: [a for a in archivos if a in restantes] for periodo, archivos in pendientes.items()}
+        procesados = [periodo for periodo, archivos in pendientes.items() if not archivos]
+        pendientes = {periodo: archivos for periodo, archivos in pendientes.items() if archivos}
+
+        def subir(periodo: str, carpeta_buscar: str) -> None:
+            with informe.etapa(f"subida_{periodo}", progreso, "subida"):
+                en_servidor = subir_carpeta_a_sftp(host, port, username, password, destino_descarga, carpeta_buscar, progreso=progreso,
+                                                   catalogo=catalogo)
+                registro.registrar_subida(periodo, [pdf.name for pdf in en_servidor])
+
+        def descomprimir_y_subir(periodo: str, archivos: List[str]) -> None:
+            with informe.etapa(f"descompresion_{periodo}", progreso, "descompresion"):
+                carpeta_buscar = descomprimir_pendientes(registro, periodo, archivos, direccion_destino_descarga, workers, progreso,
+                                                         catalogo)
+            subir(periodo, carpeta_buscar)
+
+        # Un solo hilo para la segunda mitad de la cadena: se solapa con la descarga del periodo siguiente
+        futuros = {}
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="backfill") as etapa_siguiente:
+            for periodo, archivos in pendientes.items():
+                if plan.estrategia != "paralelo":
+                    # Sin espacio para solapar periodos: uno tras otro, borrando cada comprimido en cuanto se extrae
+                    try:
+                        a_extraer = registro.pendientes(periodo, archivos, "extraido")
+                        carpeta_buscar = (procesar_secuencial(pool, a_extraer, direccion_destino_descarga, informe, workers,
+                                                              progreso, registro, catalogo) if a_extraer else periodo)
+                        subir(periodo, carpeta_buscar)
+                        procesados.append(periodo)
+                    except Exception as e:
+                        _logger.error(f"Error procesando el periodo {periodo}: {e}")
+                    continue
+                try:
+                    with informe.etapa(f"descarga_{periodo}", progreso, "descarga"):
+                        a_descargar = registro.pendientes(periodo, archivos, "verificado", direccion_destino_descarga)
+                        if a_descargar:
+                            descargar_archivos_paralelo(pool, a_descargar, direccion_destino_descarga, progreso=progreso)
+                            comprobar_descarga(a_descargar, direccion_destino_descarga)
+                        registro.registrar_descarga(periodo, a_descargar, direccion_destino_descarga)
+                except Exception as e:
+                    _logger.error(f"Error descargando el periodo {periodo}: {e}")
+                    continue
+                futuros[periodo] = etapa_siguiente.submit(propagar_contexto(descomprimir_y_subir), periodo, archivos)
+
+        for periodo, futuro in futuros.items():
+            try:
+                futuro.result()
+                procesados.append(periodo)
+            except Exception as e:
+                _logger.error(f"Error procesando el periodo {periodo}: {e}")
+        fallidos = [periodo for periodo in pendientes if periodo not in procesados]
+        _logger.info(f"Backfill terminado: {len(procesados)}/{len(procesados) + len(fallidos)} periodos procesados")
+        if fallidos:
+            notificar(f"Procesamiento de facturas de Cubacel Online {desde}-{hasta}: fallaron los periodos {', '.join(fallidos)}")
+            # El informe se guarda como fallido al salir del with
+            raise RuntimeError(f"No se pudieron procesar los periodos: {fallidos}")
+        notificar(f"Procesamiento de facturas de Cubacel Online {desde}-{hasta} terminado: {len(procesados)} periodos")
+        return procesados
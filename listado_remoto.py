@@ -0,0 +1,209 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+import paramiko
+from dotenv import load_dotenv
+from schemas.schemas import ConteoArchivos
+
+load_dotenv()
+
+_logger = logging.getLogger(__name__)
+
+# Configuración del listado remoto (se puede ajustar desde el archivo .env)
+DIRECTORIO_CACHE = Path(os.getenv("LISTADO_CACHE_DIR", ".cache_sftp"))
+# Segundos tras los cuales se vuelve a listar aunque el directorio no haya cambiado
+TTL_LISTADO = int(os.getenv("LISTADO_CACHE_TTL", "3600"))
+
+# Atributo de ConteoArchivos que corresponde a cada extensión de comprimido
+TIPOS_COMPRIMIDO = {".tar.gz": "tar_gz_files", ".tgz": "tar_gz_files", ".zip": "zip_files", ".rar": "rar_files"}
+
+_lock = threading.Lock()
+
+
+def extraer_fecha(nombre:str) -> str:
+    """
+    Extrae y devuelve el año y mes desde el nombre de un archivo.
+    Args:
+        nombre (str): El nombre del archivo desde el cual se extraerá la fecha.
+    Returns:
+        str: Una cadena representando el año y el mes en formato 'YYYYMM'.
+    """
+    fecha_str = nombre[:6]
+    return fecha_str
+
+
+def tipo_comprimido(nombre: str) -> Optional[str]:
+    """
+    Devuelve el atributo de ConteoArchivos al que pertenece un archivo, o None si no es un comprimido soportado.
+    """
+    for extension, atributo in TIPOS_COMPRIMIDO.items():
+        if nombre.endswith(extension):
+            return atributo
+    return None
+
+
+def construir_conteo(nombres: List[str], entradas: Optional[Dict[str, dict]] = None) -> ConteoArchivos:
+    """
+    Clasifica los nombres de un listado remoto por tipo de comprimido y por periodo en una sola pasada.
+
+    Args:
+        nombres (List[str]): Nombres de los archivos del directorio remoto.
+        entradas (Optional[Dict[str, dict]]): Tamaño y fecha de cada archivo según el listado, si se conocen.
+
+    Returns:
+        ConteoArchivos: Listas por tipo y el índice 'YYYYMM' -> archivos en periodos.
+    """
+    por_tipo: Dict[str, List[str]] = {atributo: [] for atributo in TIPOS_COMPRIMIDO.values()}
+    periodos: Dict[str, List[str]] = {}
+    for nombre in nombres:
+        atributo = tipo_comprimido(nombre)
+        if atributo is None:
+            continue
+        por_tipo[atributo].append(nombre)
+        periodos.setdefault(extraer_fecha(nombre), []).append(nombre)
+    atributos = {nombre: [entrada["tamanho"], int(entrada["mtime"] or 0)]
+                 for nombre, entrada in (entradas or {}).items() if tipo_comprimido(nombre)}
+    return ConteoArchivos(periodos=periodos, atributos=atributos, **por_tipo)
+
+
+def nombre_snapshot(host: str, port: int, username: str, directorio: str = ".") -> str:
+    """
+    Devuelve el nombre del archivo del snapshot de un directorio remoto. El directorio de inicio del
+    usuario ('.') conserva el nombre de siempre; los demás llevan un hash corto de su ruta.
+    """
+    if directorio == ".":
+        return f"listado_{host}_{port}_{username}.json"
+    return f"listado_{host}_{port}_{username}_{hashlib.sha1(directorio.encode()).hexdigest()[:12]}.json"
+
+
+class SnapshotRemoto:
+    """
+    Copia local del listado del directorio remoto (nombre, tamaño y fecha de modificación de cada
+    archivo), guardada como JSON por servidor, usuario y directorio remoto: las cuentas que comparten
+    servidor y usuario con directorios distintos (ver cuentas.py) tienen cada una su snapshot.
+
+    SFTP no permite pedir solo los cambios de un directorio, así que la actualización es incremental
+    a nivel de directorio: si la fecha de modificación del directorio remoto no cambió desde el último
+    listado (y este no ha caducado) se usa la copia local sin volver a listar. Al listar se registran
+    los archivos nuevos, cambiados y eliminados respecto a la copia anterior.
+
+    Attributes:
+        ruta (Path): Ruta del archivo JSON del snapshot.
+        directorio (str): Directorio remoto que se lista.
+        entradas (Dict[str, dict]): Tamaño y fecha de modificación de cada archivo, por nombre.
+        mtime_directorio (Optional[int]): Fecha de modificación del directorio en el último listado.
+        listado (float): Momento (epoch) del último listado completo.
+    """
+
+    def __init__(self, host: str, port: int, username: str, directorio: str = ".", cache: Optional[Path] = None) -> None:
+        self.directorio = directorio
+        self.ruta = Path(cache or DIRECTORIO_CACHE) / nombre_snapshot(host, port, username, directorio)
+        try:
+            datos = json.loads(self.ruta.read_text())
+        except FileNotFoundError:
+            datos = {}
+        except ValueError as e:
+            _logger.warning(f"Snapshot del listado remoto ilegible, se ignora: {e}")
+            datos = {}
+        if datos.get("directorio", directorio) != directorio:
+            datos = {}
+        self.entradas: Dict[str, dict] = datos.get("entradas", {})
+        self.mtime_directorio: Optional[int] = datos.get("mtime_directorio")
+        self.listado: float = datos.get("listado", 0.0)
+
+    def vigente(self, mtime_directorio: int) -> bool:
+        """
+        Indica si la copia local sigue valiendo para un directorio con esa fecha de modificación.
+        """
+        # La fecha del directorio tiene resolución de segundos: si el último cambio cayó en el mismo
+        # segundo que el listado pudo haber cambios posteriores que no la mueven
+        return (self.mtime_directorio == mtime_directorio
+                and self.listado - mtime_directorio > 1
+                and time.time() - self.listado < TTL_LISTADO)
+
+    def actualizar(self, sftp: paramiko.SFTPClient) -> bool:
+        """
+        Lista el directorio remoto con listdir_attr si cambió desde el último listado.
+
+        Args:
+            sftp (paramiko.SFTPClient): Cliente SFTP.
+
+        Returns:
+            bool: True si se volvió a listar, False si se usó la copia local.
+        """
+        mtime_directorio = sftp.stat(self.directorio).st_mtime
+        if self.vigente(mtime_directorio):
+            # En DEBUG: el vigilante remoto (vigilancia_remota.py) pasa por aquí en cada sondeo
+            _logger.debug(f"Directorio remoto sin cambios, se usa el listado local ({len(self.entradas)} archivos)")
+            return False
+
+        inicio = time.time()
+        entradas = {atributos.filename: {"tamanho": atributos.st_size, "mtime": atributos.st_mtime}
+                    for atributos in sftp.listdir_attr(self.directorio)}
+        nuevos = entradas.keys() - self.entradas.keys()
+        eliminados = self.entradas.keys() - entradas.keys()
+        cambiados = [nombre for nombre in entradas.keys() & self.entradas.keys() if entradas[nombre] != self.entradas[nombre]]
+        _logger.info(f"Listado remoto actualizado: {len(entradas)} archivos ({len(nuevos)} nuevos, "
+                     f"{len(cambiados)} cambiados, {len(eliminados)} eliminados)")
+
+        self.entradas = entradas
+        self.mtime_directorio = mtime_directorio
+        self.listado = inicio
+        return True
+
+    def guardar(self) -> None:
+        """
+        Escribe el snapshot en disco de forma atómica.
+        """
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        temporal = self.ruta.with_suffix(".tmp")
+        temporal.write_text(json.dumps({"directorio": self.directorio, "mtime_directorio": self.mtime_directorio,
+                                        "listado": self.listado, "entradas": self.entradas}))
+        temporal.replace(self.ruta)
+
+    def conteo(self) -> ConteoArchivos:
+        return construir_conteo(list(self.entradas), self.entradas)
+
+
+def refrescar_snapshot(sftp: paramiko.SFTPClient, host: str, port: int, username: str) -> SnapshotRemoto:
+    """
+    Carga el snapshot del directorio de trabajo del canal (el de inicio del usuario, o el directorio
+    remoto de la cuenta si el pool lo fijó con chdir), lo refresca si el directorio remoto cambió y lo
+    guarda. Un solo stat del directorio si no hubo cambios.
+
+    Args:
+        sftp (paramiko.SFTPClient): Cliente SFTP.
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+
+    Returns:
+        SnapshotRemoto: Snapshot al día.
+    """
+    with _lock:
+        snapshot = SnapshotRemoto(host, port, username, sftp.getcwd() or ".")
+        if snapshot.actualizar(sftp):
+            snapshot.guardar()
+    return snapshot
+
+
+def listar_con_snapshot(sftp: paramiko.SFTPClient, host: str, port: int, username: str) -> ConteoArchivos:
+    """
+    Devuelve el listado del directorio de trabajo del canal usando el snapshot local, que se
+    refresca solo si el directorio remoto cambió.
+
+    Args:
+        sftp (paramiko.SFTPClient): Cliente SFTP.
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+
+    Returns:
+        ConteoArchivos: Comprimidos por tipo y por periodo.
+    """
+    return refrescar_snapshot(sftp, host, port, username).conteo()
@@ -1,36 +1,226 @@
 from pathlib import Path
+import atexit
 import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import threading
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuración del logging (se puede ajustar desde el archivo .env)
+NIVEL_ARCHIVO = os.getenv("LOG_NIVEL_ARCHIVO", "DEBUG").upper()
+NIVEL_CONSOLA = os.getenv("LOG_NIVEL_CONSOLA", "INFO").upper()
+# Rotación del archivo de log: 'tamanho' (al llegar a LOG_TAMANHO_MAX_MB) o 'diaria' (a medianoche)
+ROTACION = os.getenv("LOG_ROTACION", "tamanho").lower()
+TAMANHO_MAX_LOG = int(os.getenv("LOG_TAMANHO_MAX_MB", "10")) * 1024 * 1024
+COPIAS_LOG = int(os.getenv("LOG_COPIAS", "5"))
+# Mensajes por archivo que se escriben completos en cada etapa antes de empezar a muestrear
+MUESTRA_POR_ETAPA = int(os.getenv("LOG_MUESTRA_POR_ETAPA", "10"))
+# Pasada la muestra, se escribe uno de cada LOG_MUESTREO_CADA mensajes por archivo
+MUESTREO_CADA = int(os.getenv("LOG_MUESTREO_CADA", "100"))
+
+FORMATO = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_manejador_cola: Optional[logging.handlers.QueueHandler] = None
+_consola: Optional[logging.Handler] = None
+# Cola y listener de los registros que llegan de los procesos hijos (pool de descompresión)
+_cola_procesos: Any = None
+_listener_procesos: Optional[logging.handlers.QueueListener] = None
+
+
+def por_archivo(etapa: str) -> Dict[str, str]:
+    """
+    Marca un mensaje como mensaje por archivo de una etapa, para que se muestree (ver FiltroMuestreo).
+
+    Uso: _logger.info("Archivo %s subido", archivo, extra=por_archivo("subida"))
+    """
+    return {"etapa_muestreo": etapa}
+
+
+class FiltroMuestreo(logging.Filter):
+    """
+    Deja pasar completos los primeros mensajes por archivo de cada etapa y después solo uno de cada
+    MUESTREO_CADA, contando los omitidos para resumirlos al cerrar la etapa (ver resumir_muestreo).
+    Los avisos y errores y los mensajes que no son por archivo pasan siempre.
+
+    Se aplica antes de encolar: un mensaje omitido no se llega a formatear.
+    """
+
+    def __init__(self, muestra: int = MUESTRA_POR_ETAPA, cada: int = MUESTREO_CADA) -> None:
+        super().__init__()
+        self.muestra = muestra
+        self.cada = max(1, cada)
+        self._vistos: Dict[str, int] = {}
+        self._omitidos: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        etapa = getattr(record, "etapa_muestreo", None)
+        if etapa is None or record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            vistos = self._vistos.get(etapa, 0) + 1
+            self._vistos[etapa] = vistos
+            if vistos <= self.muestra or (vistos - self.muestra) % self.cada == 0:
+                return True
+            self._omitidos[etapa] = self._omitidos.get(etapa, 0) + 1
+            return False
+
+    def reiniciar(self, etapa: str) -> Tuple[int, int]:
+        """
+        Devuelve (mensajes vistos, omitidos) de la etapa y pone sus contadores a cero.
+        """
+        with self._lock:
+            return self._vistos.pop(etapa, 0), self._omitidos.pop(etapa, 0)
+
+
+class _ArchivoPorPeriodo(logging.Handler):
+    """
+    Manejador de archivo intercambiable: el listener tiene siempre los mismos manejadores y al
+    configurar otro periodo solo cambia el archivo al que escribe este.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.destino: Optional[logging.Handler] = None
+        self.ruta: Optional[Path] = None
+
+    def cambiar(self, ruta: Path) -> None:
+        with self.lock:
+            if ruta == self.ruta:
+                return
+            if ROTACION == "diaria":
+                nuevo = logging.handlers.TimedRotatingFileHandler(ruta, when="midnight", backupCount=COPIAS_LOG, encoding="utf-8")
+            else:
+                nuevo = logging.handlers.RotatingFileHandler(ruta, maxBytes=TAMANHO_MAX_LOG, backupCount=COPIAS_LOG, encoding="utf-8")
+            nuevo.setFormatter(self.formatter)
+            anterior, self.destino, self.ruta = self.destino, nuevo, ruta
+        if anterior is not None:
+            anterior.close()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.destino is not None:
+            self.destino.emit(record)
+
+    def close(self) -> None:
+        if self.destino is not None:
+            self.destino.close()
+        super().close()
+
+
+_archivo = _ArchivoPorPeriodo()
+_muestreo = FiltroMuestreo()
+
 
 # Configuración global de logging
 def configurar_logging(fecha:str):
     """
     Configura el sistema de logging para que todos los loggers escriban en el mismo archivo y consola.
+
+    Se puede llamar en cada ejecución: la primera vez instala en el logger raíz un QueueHandler (los
+    hilos del proceso solo encolan) y arranca un hilo que escribe en consola y en el archivo del
+    periodo, con rotación. Las llamadas siguientes solo cambian el archivo si el periodo es otro, así
+    que en el proceso de la API cada línea se escribe una sola vez por muchos trabajos que se lancen.
+
+    Args:
+        fecha (str): Periodo (o rango) que da nombre al archivo de log.
     """
+    global _listener, _manejador_cola, _consola
     # Directorio y archivo de log
     dir_log = Path("logs")
     dir_log.mkdir(exist_ok=True)  # Asegura que el directorio exista
     log_file = dir_log / f"{fecha}_log_facturas_cubacel_online.log"
 
-    # Configuración del logger raíz
+    with _lock:
+        if _listener is None:
+            formato = logging.Formatter(FORMATO)
+
+            # Manejador para archivo
+            _archivo.setLevel(NIVEL_ARCHIVO)
+            _archivo.setFormatter(formato)
+
+            # Manejador para consola
+            _consola = logging.StreamHandler()
+            _consola.setLevel(NIVEL_CONSOLA)
+            _consola.setFormatter(formato)
+
+            # Los loggers solo encolan; el listener escribe desde su propio hilo
+            cola: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+            _manejador_cola = logging.handlers.QueueHandler(cola)
+            _manejador_cola.addFilter(_muestreo)
+            _listener = logging.handlers.QueueListener(cola, _archivo, _consola, respect_handler_level=True)
+            _listener.start()
+            atexit.register(detener_logging)
+
+            # Configuración del logger raíz
+            logger_raiz = logging.getLogger()
+            logger_raiz.setLevel(min(logging.getLevelName(NIVEL_ARCHIVO), logging.getLevelName(NIVEL_CONSOLA)))
+            logger_raiz.addHandler(_manejador_cola)
+
+            paramiko_logger = logging.getLogger("paramiko")
+            paramiko_logger.setLevel(logging.WARNING)  # o el nivel que desees para Paramiko.
+        _archivo.cambiar(log_file)
+
+
+def resumir_muestreo(etapa: str) -> None:
+    """
+    Escribe cuántos mensajes por archivo de la etapa se omitieron por el muestreo y reinicia sus contadores.
+    """
+    vistos, omitidos = _muestreo.reiniciar(etapa)
+    if omitidos:
+        logging.getLogger(__name__).info(f"{etapa}: {vistos} mensajes por archivo, {omitidos} omitidos por el muestreo "
+                                         f"(LOG_MUESTRA_POR_ETAPA={MUESTRA_POR_ETAPA}, LOG_MUESTREO_CADA={MUESTREO_CADA})")
+
+
+def cola_para_procesos() -> Any:
+    """
+    Devuelve la cola por la que los procesos hijos envían sus registros al proceso principal, o None
+    si el logging no está configurado. Se pasa a inicializar_proceso como initializer del pool.
+    """
+    global _cola_procesos, _listener_procesos
+    with _lock:
+        if _listener is None:
+            return None
+        if _cola_procesos is None:
+            _cola_procesos = multiprocessing.Queue(-1)
+            _listener_procesos = logging.handlers.QueueListener(_cola_procesos, _archivo, _consola, respect_handler_level=True)
+            _listener_procesos.start()
+        return _cola_procesos
+
+
+def inicializar_proceso(cola: Any) -> None:
+    """
+    Initializer de los pools de procesos: el hijo no hereda los manejadores del padre (su cola en
+    memoria no la lee nadie en el hijo) y envía sus registros por la cola de cola_para_procesos.
+
+    Args:
+        cola: Cola devuelta por cola_para_procesos, o None para no registrar nada desde el hijo.
+    """
     logger_raiz = logging.getLogger()
-    logger_raiz.setLevel(logging.DEBUG)  # Nivel global de logging
-
-    # Formato del log
-    formato = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-
-    # Manejador para archivo
-    manejador_archivo = logging.FileHandler(log_file)
-    manejador_archivo.setLevel(logging.DEBUG)
-    manejador_archivo.setFormatter(formato)
-
-    # Manejador para consola
-    manejador_consola = logging.StreamHandler()
-    manejador_consola.setLevel(logging.DEBUG)
-    manejador_consola.setFormatter(formato)
-
-    # Añadir manejadores al logger raíz
-    logger_raiz.addHandler(manejador_archivo)
-    logger_raiz.addHandler(manejador_consola)
-    
-    paramiko_logger = logging.getLogger("paramiko")
-    paramiko_logger.setLevel(logging.WARNING)  # o el nivel que desees para Paramiko
\ No newline at end of file
+    for manejador in list(logger_raiz.handlers):
+        logger_raiz.removeHandler(manejador)
+    if cola is not None:
+        logger_raiz.addHandler(logging.handlers.QueueHandler(cola))
+        logger_raiz.setLevel(min(logging.getLevelName(NIVEL_ARCHIVO), logging.getLevelName(NIVEL_CONSOLA)))
+    logging.getLogger("paramiko").setLevel(logging.WARNING)
+
+
+def detener_logging() -> None:
+    """
+    Vacía las colas y detiene los hilos de escritura (se llama sola al salir del proceso).
+    """
+    global _listener, _manejador_cola, _cola_procesos, _listener_procesos
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        if _listener_procesos is not None:
+            _listener_procesos.stop()
+        logging.getLogger().removeHandler(_manejador_cola)
+        _listener, _manejador_cola, _cola_procesos, _listener_procesos = None, None, None, None
@@ -1,10 +1,32 @@
 import uvicorn
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
 import os
+import threading
+from typing import List, Optional
 from dotenv import load_dotenv
-from functions import ejecutar_descompactar_facturas
+from functions import ejecutar_archivos_nuevos, ejecutar_backfill, fecha_mes_vencido, rango_periodos
+from sftp_async import ejecutar_descompactar_facturas_async
+from pool_sftp import cerrar_pools
+from sms import cerrar_despachador
+from schemas.schemas import ConteoArchivos, CuentaSFTP, EstadoTrabajo, Factura
+from trabajos import GestorTrabajos
+from metricas import METRICAS
+from vigilancia_remota import VigilanteRemoto
+from cuentas import cargar_cuentas, directorio_trabajo, iniciar_cuentas, procesar_archivos_nuevos, vigilante_cuenta
+from catalogo import CatalogoFacturas, obtener_catalogo, ruta_catalogo
 
-app = FastAPI()
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    # Los vigilantes arrancan con el servidor; al apagarlo se detienen y se cierran las conexiones
+    iniciar_vigilancia()
+    try:
+        yield
+    finally:
+        cerrar_conexiones_sftp()
+
+app = FastAPI(lifespan=ciclo_de_vida)
 
 load_dotenv()
 
@@ -22,9 +44,122 @@ try:
 except ValueError:
     raise ValueError("El puerto (PORT) debe ser un número válido.")
 
+# Los procesamientos corren en segundo plano para no bloquear el servidor
+gestor_trabajos = GestorTrabajos()
+
+# Con VIGILANCIA_ACTIVA el servidor procesa cada comprimido nuevo de la cuenta del .env en cuanto termina de llegar
+# (ver vigilancia_remota.py); con VIGILANCIA_CUENTAS, también los de cada cuenta de CUENTAS_ARCHIVO
+VIGILANCIA_ACTIVA = os.getenv("VIGILANCIA_ACTIVA", "").lower() in ("1", "true", "si")
+VIGILANCIA_CUENTAS = os.getenv("VIGILANCIA_CUENTAS", "").lower() in ("1", "true", "si")
+vigilantes: List[VigilanteRemoto] = []
+
+def iniciar_vigilante(cuenta: Optional[CuentaSFTP] = None) -> VigilanteRemoto:
+    # Cada procesamiento se lanza como trabajo para verlo en /jobs y no duplicar uno en curso del mismo
+    # periodo y cuenta; el vigilante espera a que termine antes del siguiente sondeo
+    def procesar_como_trabajo(periodo: str, archivos: List[str], conteo_archivos: ConteoArchivos) -> None:
+        if cuenta is None:
+            trabajo = gestor_trabajos.iniciar([periodo], ejecutar_archivos_nuevos, host, port, username, password,
+                                              periodo, archivos, conteo_archivos)
+        else:
+            trabajo = gestor_trabajos.iniciar([periodo], procesar_archivos_nuevos, cuenta, periodo, archivos,
+                                              conteo_archivos, cuenta=cuenta.nombre)
+        while trabajo.estado in ("en_cola", "en_curso") and not vigilante.esperar(2):
+            pass
+
+    if cuenta is None:
+        vigilante = VigilanteRemoto(host, port, username, password, procesar=procesar_como_trabajo)
+    else:
+        vigilante = vigilante_cuenta(cuenta, procesar=procesar_como_trabajo)
+    nombre = "vigilancia_remota" if cuenta is None else f"vigilancia_remota_{cuenta.nombre}"
+    threading.Thread(target=vigilante.ejecutar, name=nombre, daemon=True).start()
+    return vigilante
+
+def iniciar_vigilancia() -> None:
+    if VIGILANCIA_ACTIVA:
+        vigilantes.append(iniciar_vigilante())
+    if VIGILANCIA_CUENTAS:
+        vigilantes.extend(iniciar_vigilante(cuenta) for cuenta in cargar_cuentas())
+
+@app.post("/descompactar_facturas")
 @app.get("/descompactar_facturas")
-async def descompactar_facturas(host:str = host, port: int = int(port), username:str = username, password:str = password) -> None:
-    ejecutar_descompactar_facturas(host, port, username, password)
+async def descompactar_facturas(host:str = host, port: int = int(port), username:str = username, password:str = password) -> EstadoTrabajo:
+    # Devuelve enseguida el trabajo; si ya hay uno activo para el mes vencido se devuelve ese.
+    # El proceso corre como tarea del propio bucle de eventos (las transferencias SFTP son asyncio)
+    return gestor_trabajos.iniciar([fecha_mes_vencido()], ejecutar_descompactar_facturas_async, host, port, username, password)
+
+@app.post("/backfill")
+async def backfill(desde: str, hasta: str) -> EstadoTrabajo:
+    # Procesa un rango de periodos en un solo trabajo; si alguno ya se está procesando se devuelve ese trabajo
+    try:
+        periodos = rango_periodos(desde, hasta)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return gestor_trabajos.iniciar(periodos, ejecutar_backfill, host, port, username, password, desde, hasta)
+
+@app.post("/cuentas/descompactar_facturas")
+async def descompactar_facturas_cuentas() -> List[EstadoTrabajo]:
+    # Un trabajo por cuenta del archivo CUENTAS_ARCHIVO; cuántas corren a la vez lo fija TRABAJOS_WORKERS
+    try:
+        cuentas = cargar_cuentas()
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return iniciar_cuentas(gestor_trabajos, cuentas)
+
+def catalogo_de(cuenta_sftp: Optional[str]) -> CatalogoFacturas:
+    # Sin cuenta, el catálogo del proceso de siempre; con cuenta, el de su directorio de trabajo (ver cuentas.py)
+    if cuenta_sftp is None:
+        return obtener_catalogo()
+    try:
+        cuenta = next(cuenta for cuenta in cargar_cuentas() if cuenta.nombre == cuenta_sftp)
+    except (ValueError, FileNotFoundError, StopIteration):
+        raise HTTPException(status_code=404, detail=f"No existe la cuenta {cuenta_sftp}")
+    return obtener_catalogo(ruta_catalogo(directorio_trabajo(cuenta)))
+
+@app.get("/facturas")
+async def buscar_facturas(periodo: Optional[str] = None, telefono: Optional[str] = None, cuenta: Optional[str] = None,
+                          archivo: Optional[str] = None, cuenta_sftp: Optional[str] = None, limite: int = 100) -> List[Factura]:
+    # Búsqueda por índice en el catálogo (ver catalogo.py), sin recorrer las carpetas de facturas
+    return catalogo_de(cuenta_sftp).buscar(periodo, telefono, cuenta, archivo, limite)
+
+@app.get("/facturas/{periodo}/{archivo}")
+async def descargar_factura(periodo: str, archivo: str, cuenta_sftp: Optional[str] = None) -> FileResponse:
+    # FileResponse atiende la cabecera Range (206 con el trozo pedido): los visores de PDF piden solo
+    # las páginas que muestran y una descarga cortada se reanuda
+    ruta = catalogo_de(cuenta_sftp).ruta_local(periodo, archivo)
+    if ruta is None:
+        raise HTTPException(status_code=404, detail=f"La factura {archivo} de {periodo} no está en el catálogo o no pasó por disco")
+    if not ruta.is_file():
+        raise HTTPException(status_code=404, detail=f"La factura {archivo} de {periodo} ya no está en disco")
+    return FileResponse(ruta, media_type="application/pdf", filename=archivo, content_disposition_type="inline")
+
+@app.get("/jobs")
+async def listar_trabajos() -> List[EstadoTrabajo]:
+    return gestor_trabajos.listar()
+
+@app.get("/jobs/{id_trabajo}")
+async def estado_trabajo(id_trabajo: str) -> EstadoTrabajo:
+    trabajo = gestor_trabajos.obtener(id_trabajo)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail=f"No existe el trabajo {id_trabajo}")
+    return trabajo
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metricas() -> str:
+    # Tiempos, bytes, archivos, latencias, reintentos y errores por etapa en formato Prometheus
+    return METRICAS.exponer()
+
+@app.get("/metrics/informe")
+async def ultimo_informe() -> Optional[dict]:
+    # Informe JSON de la última ejecución terminada (también se guarda en logs/)
+    return METRICAS.ultimo_informe
+
+def cerrar_conexiones_sftp() -> None:
+    # Los transportes SFTP se reutilizan entre peticiones, se cierran al apagar el servidor
+    for vigilante in vigilantes:
+        vigilante.detener()
+    gestor_trabajos.cerrar()
+    cerrar_pools()
+    cerrar_despachador(timeout=10)
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,317 @@
+import asyncio
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from log_configuration import resumir_muestreo
+
+_logger = logging.getLogger(__name__)
+
+# Límites (en segundos) de los buckets del histograma de latencias
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Descripción de cada métrica para la exposición en formato Prometheus
+AYUDA = {
+    "facturas_etapa_segundos_total": ("counter", "Tiempo acumulado en cada etapa del proceso"),
+    "facturas_etapa_ultima_duracion_segundos": ("gauge", "Duración de la última ejecución de cada etapa"),
+    "facturas_bytes_total": ("counter", "Bytes procesados por etapa"),
+    "facturas_archivos_total": ("counter", "Archivos procesados por etapa"),
+    "facturas_reintentos_total": ("counter", "Reintentos por etapa"),
+    "facturas_errores_total": ("counter", "Errores por etapa"),
+    "facturas_ejecuciones_total": ("counter", "Ejecuciones del proceso por estado final"),
+    "facturas_latencia_segundos": ("histogram", "Latencia por archivo (por bloque en las descargas) en cada etapa"),
+}
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+
+class Histograma:
+    """
+    Histograma acumulativo con buckets fijos, como los de Prometheus.
+
+    Attributes:
+        buckets (Tuple[float, ...]): Límites superiores de los buckets.
+        conteos (List[int]): Observaciones en cada bucket (sin acumular).
+        suma (float): Suma de todas las observaciones.
+        total (int): Cantidad de observaciones.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS_LATENCIA) -> None:
+        self.buckets = buckets
+        self.conteos = [0] * len(buckets)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float) -> None:
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+        self.suma += valor
+        self.total += 1
+
+
+class Metricas:
+    """
+    Registro en memoria de las métricas del proceso, compartido por todas las etapas y ejecuciones.
+
+    Es seguro usarlo desde varios hilos. exponer() devuelve el texto en formato Prometheus que sirve
+    la ruta /metrics de la API.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._valores: Dict[Tuple[str, Etiquetas], float] = {}
+        self._histogramas: Dict[Tuple[str, Etiquetas], Histograma] = {}
+        self.ultimo_informe: Optional[dict] = None
+
+    def sumar(self, nombre: str, valor: float = 1, **etiquetas: str) -> None:
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def fijar(self, nombre: str, valor: float, **etiquetas: str) -> None:
+        with self._lock:
+            self._valores[(nombre, tuple(sorted(etiquetas.items())))] = valor
+
+    def observar(self, nombre: str, valor: float, **etiquetas: str) -> None:
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            if clave not in self._histogramas:
+                self._histogramas[clave] = Histograma()
+            self._histogramas[clave].observar(valor)
+
+    def histograma(self, nombre: str, **etiquetas: str) -> Tuple[float, int]:
+        """
+        Devuelve la suma y la cantidad de observaciones de un histograma.
+        """
+        with self._lock:
+            histograma = self._histogramas.get((nombre, tuple(sorted(etiquetas.items()))))
+            return (histograma.suma, histograma.total) if histograma else (0.0, 0)
+
+    def valor(self, nombre: str, **etiquetas: str) -> float:
+        with self._lock:
+            return self._valores.get((nombre, tuple(sorted(etiquetas.items()))), 0)
+
+    def exponer(self) -> str:
+        """
+        Devuelve todas las métricas en el formato de texto de Prometheus.
+        """
+        lineas: List[str] = []
+        with self._lock:
+            nombres = sorted({nombre for nombre, _ in self._valores} | {nombre for nombre, _ in self._histogramas})
+            for nombre in nombres:
+                tipo, ayuda = AYUDA.get(nombre, ("untyped", nombre))
+                lineas.append(f"# HELP {nombre} {ayuda}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+                for (n, etiquetas), valor in sorted(self._valores.items()):
+                    if n == nombre:
+                        lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+                for (n, etiquetas), histograma in sorted(self._histogramas.items(), key=lambda item: item[0]):
+                    if n != nombre:
+                        continue
+                    acumulado = 0
+                    for limite, conteo in zip(histograma.buckets, histograma.conteos):
+                        acumulado += conteo
+                        lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', str(limite)),))} {acumulado}")
+                    lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', '+Inf'),))} {histograma.total}")
+                    lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {histograma.suma}")
+                    lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {histograma.total}")
+        return "\n".join(lineas) + "\n"
+
+
+def _etiquetas(etiquetas: Etiquetas) -> str:
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{clave}="{valor}"' for clave, valor in etiquetas) + "}"
+
+
+# Registro global del proceso
+METRICAS = Metricas()
+
+# Informe de la ejecución en curso en este hilo o tarea asyncio (ver InformeEjecucion y propagar_contexto)
+_informe_actual: ContextVar[Optional["InformeEjecucion"]] = ContextVar("informe_actual", default=None)
+
+
+def propagar_contexto(funcion: Callable) -> Callable:
+    """
+    Envuelve una función que va a correr en otro hilo (un pool de descargas, los hilos de subida...)
+    para que vea el contexto de quien la lanza: lo que registre se suma al informe de la ejecución y
+    sus sesiones SFTP usan el pool de la cuenta en curso (ver pool_sftp.usar_pool). Si es una
+    corrutina que se va a programar en un bucle de eventos de otro hilo, se envuelve igual.
+    """
+    contexto = copy_context()
+
+    if asyncio.iscoroutinefunction(funcion):
+        @functools.wraps(funcion)
+        async def envuelta_async(*args, **kwargs):
+            tokens = [(variable, variable.set(valor)) for variable, valor in contexto.items()]
+            try:
+                return await funcion(*args, **kwargs)
+            finally:
+                for variable, token in reversed(tokens):
+                    variable.reset(token)
+        return envuelta_async
+
+    @functools.wraps(funcion)
+    def envuelta(*args, **kwargs):
+        # Una copia por llamada: un mismo contexto no puede estar activo en dos hilos a la vez
+        return contexto.copy().run(funcion, *args, **kwargs)
+    return envuelta
+
+
+def _sumar_al_informe(etapa: str, latencia: Optional[float] = None, **valores: float) -> None:
+    informe = _informe_actual.get()
+    if informe is not None:
+        informe.sumar(etapa, latencia, **valores)
+
+
+def registrar_archivo(etapa: str, bytes_procesados: int, segundos: float) -> None:
+    """
+    Anota un archivo (o bloque) procesado en una etapa: suma bytes y archivos y observa su latencia.
+    """
+    METRICAS.sumar("facturas_bytes_total", bytes_procesados, etapa=etapa)
+    METRICAS.sumar("facturas_archivos_total", 1, etapa=etapa)
+    METRICAS.observar("facturas_latencia_segundos", segundos, etapa=etapa)
+    _sumar_al_informe(etapa, segundos, bytes=bytes_procesados, archivos=1)
+
+
+def registrar_bytes(etapa: str, bytes_procesados: int, segundos: float) -> None:
+    """
+    Anota bytes procesados en una etapa sin contar un archivo nuevo (por ejemplo un bloque de descarga).
+    """
+    METRICAS.sumar("facturas_bytes_total", bytes_procesados, etapa=etapa)
+    METRICAS.observar("facturas_latencia_segundos", segundos, etapa=etapa)
+    _sumar_al_informe(etapa, segundos, bytes=bytes_procesados)
+
+
+def contar_archivo(etapa: str) -> None:
+    METRICAS.sumar("facturas_archivos_total", 1, etapa=etapa)
+    _sumar_al_informe(etapa, archivos=1)
+
+
+def registrar_reintento(etapa: str) -> None:
+    METRICAS.sumar("facturas_reintentos_total", 1, etapa=etapa)
+    _sumar_al_informe(etapa, reintentos=1)
+
+
+def registrar_error(etapa: str) -> None:
+    METRICAS.sumar("facturas_errores_total", 1, etapa=etapa)
+    _sumar_al_informe(etapa, errores=1)
+
+
+class InformeEjecucion:
+    """
+    Informe de una ejecución del proceso: duración de cada etapa y bytes, archivos, reintentos y
+    errores de cada una. Al terminar se guarda como JSON en logs/ junto al log de texto y queda
+    disponible en METRICAS.ultimo_informe.
+
+    Mientras la ejecución corre dentro de 'with InformeEjecucion(...)', registrar_archivo,
+    registrar_reintento y registrar_error suman también en los totales propios del informe, así que
+    dos ejecuciones que se solapan (trabajos de la API, el vigilante, varias cuentas) no se cuentan
+    lo de la otra. Lo que corre en otros hilos se atribuye al informe si se lanza con propagar_contexto.
+
+    Attributes:
+        periodo (str): Periodo (o rango de periodos) que procesa la ejecución.
+        etapas (List[dict]): Nombre, tipo y duración de cada etapa en orden de inicio.
+    """
+
+    CONTADORES = ("bytes", "archivos", "reintentos", "errores")
+    TIPOS_ETAPA = ("autenticacion_sms", "listado", "planificacion", "streaming", "descarga", "descompresion", "subida", "conexion", "sms")
+
+    def __init__(self, periodo: str, directorio: Path = Path("logs")) -> None:
+        self.periodo = periodo
+        self.directorio = Path(directorio)
+        self.etapas: List[dict] = []
+        self._inicio = time.monotonic()
+        self._fecha_inicio = datetime.now()
+        self._lock = threading.Lock()
+        self._totales: Dict[str, Dict[str, float]] = {}
+        self._token = None
+
+    def sumar(self, etapa: str, latencia: Optional[float] = None, **valores: float) -> None:
+        """
+        Suma contadores (bytes, archivos, reintentos, errores) y una latencia a una etapa de esta ejecución.
+        """
+        with self._lock:
+            total = self._totales.setdefault(etapa, {**dict.fromkeys(self.CONTADORES, 0), "latencia_suma": 0.0, "latencias": 0})
+            for campo, valor in valores.items():
+                total[campo] += valor
+            if latencia is not None:
+                total["latencia_suma"] += latencia
+                total["latencias"] += 1
+
+    @contextmanager
+    def etapa(self, nombre: str, progreso=None, tipo: Optional[str] = None) -> Iterator[None]:
+        """
+        Mide una etapa. Si se pasa progreso también se reporta la etapa al trabajo en curso.
+
+        Args:
+            nombre (str): Nombre de la etapa en el informe (por ejemplo 'descarga_202401').
+            progreso (Optional[Progreso]): Progreso del trabajo, si el proceso corre como trabajo.
+            tipo (Optional[str]): Etapa de las métricas a la que pertenece. Por defecto el propio nombre.
+        """
+        tipo = tipo or nombre
+        if progreso:
+            progreso.etapa(nombre)
+        inicio = time.monotonic()
+        try:
+            yield
+        finally:
+            duracion = time.monotonic() - inicio
+            self.etapas.append({"nombre": nombre, "tipo": tipo, "duracion_s": round(duracion, 3)})
+            METRICAS.sumar("facturas_etapa_segundos_total", duracion, etapa=tipo)
+            METRICAS.fijar("facturas_etapa_ultima_duracion_segundos", duracion, etapa=tipo)
+            resumir_muestreo(tipo)
+
+    def __enter__(self) -> "InformeEjecucion":
+        self._token = _informe_actual.set(self)
+        return self
+
+    def __exit__(self, tipo_excepcion, excepcion, traza) -> None:
+        _informe_actual.reset(self._token)
+        self.guardar(error=excepcion)
+
+    def resumen(self, error: Optional[BaseException] = None) -> dict:
+        with self._lock:
+            acumulados = {tipo: dict(total) for tipo, total in self._totales.items()}
+        totales = {}
+        for tipo in self.TIPOS_ETAPA:
+            duracion = sum(etapa["duracion_s"] for etapa in self.etapas if etapa["tipo"] == tipo)
+            acumulado = acumulados.get(tipo)
+            if not duracion and acumulado is None:
+                continue
+            total = {campo: acumulado[campo] if acumulado else 0 for campo in self.CONTADORES}
+            total["duracion_s"] = round(duracion, 3)
+            total["mb_s"] = round(total["bytes"] / 1024 / 1024 / duracion, 3) if duracion else None
+            total["latencia_media_s"] = (round(acumulado["latencia_suma"] / acumulado["latencias"], 4)
+                                         if acumulado and acumulado["latencias"] else None)
+            totales[tipo] = total
+        return {"periodo": self.periodo, "inicio": self._fecha_inicio.isoformat(),
+                "duracion_s": round(time.monotonic() - self._inicio, 3),
+                "estado": "fallido" if error else "terminado", "error": str(error) if error else None,
+                "etapas": self.etapas, "totales": totales}
+
+    def guardar(self, error: Optional[BaseException] = None) -> Path:
+        """
+        Escribe el informe como JSON en el directorio de logs y lo publica en METRICAS.ultimo_informe.
+
+        Returns:
+            Path: Ruta del informe escrito.
+        """
+        informe = self.resumen(error)
+        METRICAS.sumar("facturas_ejecuciones_total", 1, estado=informe["estado"])
+        METRICAS.ultimo_informe = informe
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        ruta = self.directorio / f"{self.periodo}_informe_{self._fecha_inicio.strftime('%Y%m%d%H%M%S')}.json"
+        ruta.write_text(json.dumps(informe, indent=1))
+        lentas = sorted(self.etapas, key=lambda etapa: etapa["duracion_s"], reverse=True)
+        if lentas:
+            _logger.info(f"Informe de la ejecucion en {ruta}; etapa mas lenta: {lentas[0]['nombre']} ({lentas[0]['duracion_s']:.1f} s)")
+        return ruta
@@ -0,0 +1,156 @@
+import logging
+import os
+import struct
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import paramiko
+import rarfile
+from dotenv import load_dotenv
+from schemas.schemas import PlanEspacio
+from pool_sftp import PoolSFTP
+from streaming import ArchivoRemotoConVentana
+from descargas import SUFIJO_PARCIAL
+from alarmas_sms import uso_disco, MARGEN_ESPACIO
+from descompresion import FILTRO_MIEMBROS, formato_por_nombre
+
+load_dotenv()
+
+_logger = logging.getLogger(__name__)
+
+# Ventana de lectura para los índices de los comprimidos: el directorio central de un zip está al final
+VENTANA_INDICE = 256 * 1024
+
+ESTRATEGIAS = ("paralelo", "secuencial", "streaming")
+# Estrategia fija en lugar de elegirla según el espacio libre (se puede ajustar desde el archivo .env)
+ESTRATEGIA_ESPACIO = os.getenv("ESTRATEGIA_ESPACIO", "auto").lower()
+
+
+def tamanho_descomprimido_remoto(sftp: paramiko.SFTPClient, archivo: str, tamanho: int) -> Tuple[int, str]:
+    """
+    Calcula cuánto ocupará un comprimido remoto al extraerlo, leyendo solo sus índices.
+
+    - .zip: suma de file_size del directorio central (se leen solo los últimos KB del archivo).
+    - .tar.gz: campo ISIZE de los últimos 4 bytes del gzip (tamaño del tar módulo 2^32). Incluye
+      los miembros que no se van a extraer: es una cota superior.
+    - .rar: suma de los tamaños de las cabeceras de cada miembro.
+    En zip y rar solo se suman los miembros que cumplen FILTRO_MIEMBROS.
+    Si no se puede leer el índice se estima igual al tamaño comprimido (los PDF apenas se comprimen).
+
+    Args:
+        sftp (paramiko.SFTPClient): Cliente SFTP.
+        archivo (str): Nombre del archivo remoto.
+        tamanho (int): Tamaño del archivo remoto en bytes.
+
+    Returns:
+        Tuple[int, str]: Bytes descomprimidos y de dónde salió el dato.
+    """
+    try:
+        formato = formato_por_nombre(archivo)
+        with sftp.open(archivo, 'rb') as remoto:
+            if formato == 'zip':
+                with zipfile.ZipFile(ArchivoRemotoConVentana(remoto, tamanho, VENTANA_INDICE)) as zip_ref:
+                    return sum(info.file_size for info in zip_ref.infolist() if FILTRO_MIEMBROS(info.filename)), "directorio central"
+            if formato == 'tar.gz':
+                remoto.seek(tamanho - 4)
+                isize = struct.unpack("<I", remoto.read(4))[0]
+                # ISIZE guarda el tamaño módulo 4 GB: se suma el múltiplo de 4 GB que haga falta para no quedar por debajo del comprimido
+                while isize < tamanho * 0.9:
+                    isize += 2 ** 32
+                return isize, "ISIZE del gzip"
+            if formato == 'rar':
+                with rarfile.RarFile(ArchivoRemotoConVentana(remoto, tamanho, VENTANA_INDICE)) as rar_ref:
+                    return sum(info.file_size for info in rar_ref.infolist() if FILTRO_MIEMBROS(info.filename)), "cabeceras del rar"
+    except Exception as e:
+        _logger.warning(f"No se pudo leer el indice de {archivo} ({e}), se estima igual al tamaño comprimido")
+    return tamanho, "estimado"
+
+
+def planificar_espacio(pool: PoolSFTP, archivos: List[str], destino: Path, margen: float = MARGEN_ESPACIO,
+                       forzar: Optional[str] = None, tamanhos_remotos: Optional[Dict[str, int]] = None,
+                       a_descargar: Optional[Iterable[str]] = None) -> PlanEspacio:
+    """
+    Compara el espacio que necesita el proceso con el libre en el disco de trabajo y elige estrategia.
+
+    - paralelo: se descargan todos los comprimidos y se descomprimen a la vez (lo más rápido).
+      Necesita lo que falta por descargar más todo lo extraído.
+    - secuencial: cada comprimido se descarga, se extrae y se borra antes del siguiente. Necesita todo
+      lo extraído más el comprimido más grande.
+    - streaming: los .zip y .tar.gz se suben sin pasar por disco; solo los .rar siguen el camino secuencial.
+
+    Solo cuenta lo que todavía va a ocupar disco: 'archivos' deben ser los comprimidos aún sin extraer
+    (lo ya extraído ya está en el disco) y la descarga se suma solo para los de 'a_descargar'.
+
+    Args:
+        pool (PoolSFTP): Pool de conexiones SFTP.
+        archivos (List[str]): Comprimidos remotos que faltan por extraer.
+        destino (Path): Directorio de descarga y descompresión.
+        margen (float): Bytes libres que deben quedar siempre.
+        forzar (Optional[str]): Estrategia a usar sin tener en cuenta el espacio. Por defecto ESTRATEGIA_ESPACIO
+            ('auto' elige según el espacio).
+        tamanhos_remotos (Optional[Dict[str, int]]): Tamaño de cada comprimido según el listado remoto; los que
+            estén aquí no se vuelven a consultar al servidor.
+        a_descargar (Optional[Iterable[str]]): Los de 'archivos' que todavía hay que descargar. Por defecto, todos.
+
+    Returns:
+        PlanEspacio: Estrategia elegida y los números que la justifican.
+
+    Raises:
+        OSError: Si no hay espacio suficiente con ninguna estrategia.
+        ValueError: Si la estrategia forzada no existe.
+    """
+    forzar = forzar or (ESTRATEGIA_ESPACIO if ESTRATEGIA_ESPACIO != "auto" else None)
+    if forzar and forzar not in ESTRATEGIAS:
+        raise ValueError(f"Estrategia desconocida: {forzar}. Debe ser una de {', '.join(ESTRATEGIAS)} o 'auto'")
+    destino = Path(destino)
+    destino.mkdir(parents=True, exist_ok=True)
+    tamanhos: Dict[str, List[int]] = {}
+    if archivos:
+        with pool.sesion() as sftp:
+            for archivo in archivos:
+                comprimido = (tamanhos_remotos or {}).get(archivo)
+                if comprimido is None:
+                    comprimido = sftp.stat(archivo).st_size
+                descomprimido, origen = tamanho_descomprimido_remoto(sftp, archivo, comprimido)
+                tamanhos[archivo] = [comprimido, descomprimido]
+                _logger.info(f"{archivo}: {comprimido / 1024 / 1024:.1f} MB comprimido, "
+                             f"{descomprimido / 1024 / 1024:.1f} MB descomprimido ({origen})")
+
+    # Los comprimidos ya descargados (o con su '.parte' ya reservado) no necesitan espacio nuevo
+    a_descargar = set(tamanhos if a_descargar is None else a_descargar)
+    descargas = {archivo: t for archivo, t in tamanhos.items()
+                 if archivo in a_descargar and not (destino / archivo).exists()
+                 and not (destino / (archivo + SUFIJO_PARCIAL)).exists()}
+    bytes_descarga = sum(comprimido for comprimido, _ in descargas.values())
+    bytes_descomprimidos = sum(descomprimido for _, descomprimido in tamanhos.values())
+    rar = {archivo: t for archivo, t in tamanhos.items() if formato_por_nombre(archivo) == 'rar'}
+    mayor = max((comprimido for comprimido, _ in descargas.values()), default=0)
+    mayor_rar = max((comprimido for archivo, (comprimido, _) in rar.items() if archivo in descargas), default=0)
+
+    necesarios = {
+        "paralelo": int(bytes_descarga + bytes_descomprimidos + margen),
+        "secuencial": int(bytes_descomprimidos + mayor + margen),
+        "streaming": int(sum(descomprimido for _, descomprimido in rar.values()) + mayor_rar + margen),
+    }
+    _, libres = uso_disco(str(destino))
+    _logger.info(f"Espacio libre en {destino}: {libres / 1024 / 1024:.0f} MB. Necesario: "
+                 + ", ".join(f"{estrategia} {bytes_ / 1024 / 1024:.0f} MB" for estrategia, bytes_ in necesarios.items()))
+
+    if forzar:
+        estrategia = forzar
+        _logger.info(f"Estrategia {estrategia} indicada explicitamente")
+    else:
+        estrategia = next((e for e in ESTRATEGIAS if necesarios[e] <= libres), None)
+        if estrategia is None:
+            raise OSError(f"Espacio insuficiente en {destino}: hay {libres / 1024 / 1024:.0f} MB libres y hacen falta "
+                          f"al menos {necesarios['streaming'] / 1024 / 1024:.0f} MB incluso en modo streaming")
+        if estrategia != "paralelo":
+            _logger.warning(f"No hay espacio para el modo paralelo ({necesarios['paralelo'] / 1024 / 1024:.0f} MB > "
+                            f"{libres / 1024 / 1024:.0f} MB libres), se usa la estrategia {estrategia}")
+        else:
+            _logger.info(f"Estrategia {estrategia}: hay espacio para descargar y descomprimir todo a la vez")
+
+    return PlanEspacio(estrategia=estrategia, bytes_descarga=bytes_descarga, bytes_descomprimidos=bytes_descomprimidos,
+                       bytes_libres=libres, necesarios_paralelo=necesarios["paralelo"],
+                       necesarios_secuencial=necesarios["secuencial"], necesarios_streaming=necesarios["streaming"],
+                       tamanhos=tamanhos)
@@ -0,0 +1,373 @@
+import paramiko
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from metricas import registrar_reintento
+
+load_dotenv()
+
+_logger = logging.getLogger(__name__)
+
+# Configuración del pool (se puede ajustar desde el archivo .env)
+TAMANHO_POOL = int(os.getenv("SFTP_POOL_TAMANHO", "2"))
+CANALES_POR_TRANSPORTE = int(os.getenv("SFTP_CANALES_POR_TRANSPORTE", "8"))
+KEEPALIVE_SEGUNDOS = int(os.getenv("SFTP_KEEPALIVE", "30"))
+# Límites globales del proceso, sumando todos los servidores y cuentas (0 = sin límite)
+CONEXIONES_MAX = int(os.getenv("SFTP_CONEXIONES_MAX", "0"))
+ANCHO_BANDA_MAX = float(os.getenv("SFTP_ANCHO_BANDA_MB_S", "0")) * 1024 * 1024
+
+# Transportes abiertos en todo el proceso, si CONEXIONES_MAX los limita
+_conexiones: Optional[threading.BoundedSemaphore] = threading.BoundedSemaphore(CONEXIONES_MAX) if CONEXIONES_MAX > 0 else None
+
+
+class LimiteAnchoBanda:
+    """
+    Limita los bytes por segundo que transfieren todos los hilos del proceso juntos.
+
+    Cada transferencia reserva su turno antes de pedir los datos: el turno siguiente se adelanta
+    cantidad / bytes_por_segundo y, si va más de un segundo por delante del reloj, el hilo espera.
+    Así la media no pasa del límite y solo se permite una ráfaga de un segundo.
+
+    Attributes:
+        bytes_por_segundo (float): Límite; 0 lo desactiva.
+    """
+
+    def __init__(self, bytes_por_segundo: float = ANCHO_BANDA_MAX) -> None:
+        self.bytes_por_segundo = bytes_por_segundo
+        self._lock = threading.Lock()
+        self._siguiente = time.monotonic()
+
+    @property
+    def activo(self) -> bool:
+        return self.bytes_por_segundo > 0
+
+    def consumir(self, cantidad: int) -> None:
+        """
+        Espera, si hace falta, hasta que se puedan transferir 'cantidad' bytes sin pasar del límite.
+        """
+        if not self.activo or cantidad <= 0:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            self._siguiente = max(self._siguiente, ahora - 1) + cantidad / self.bytes_por_segundo
+            espera = self._siguiente - ahora - 1
+        if espera > 0:
+            time.sleep(espera)
+
+
+# Límite compartido por descargas, subidas y streaming de todas las cuentas
+LIMITE_ANCHO_BANDA = LimiteAnchoBanda()
+
+
+class PoolSFTP:
+    """
+    Mantiene un conjunto pequeño de transportes SSH autenticados contra un mismo servidor SFTP
+    y reparte canales SFTP sobre ellos.
+
+    Cada transporte paga el handshake (intercambio de claves y autenticación) una sola vez; a partir
+    de ahí cada etapa del proceso abre un canal nuevo sobre un transporte ya autenticado. Los
+    transportes se mantienen vivos con keepalives y se reconectan de forma transparente si se caen.
+
+    Con SFTP_CONEXIONES_MAX el total de transportes del proceso (todos los pools) queda limitado: un
+    pool que ya tiene transporte reparte más canales sobre él en vez de abrir otro, y uno sin ninguno
+    espera a que otro pool se cierre. Un transporte caído se descarta en cuanto se detecta, aunque
+    tenga canales prestados, para que su conexión global quede libre.
+
+    Attributes:
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        directorio (Optional[str]): Directorio remoto de trabajo de cada canal; None para el de inicio del usuario.
+            No cambia durante la vida del pool: cada directorio tiene su pool (ver obtener_pool).
+        tamanho (int): Cantidad máxima de transportes abiertos.
+        canales_por_transporte (int): Canales simultáneos por transporte antes de abrir otro.
+        keepalive (int): Intervalo en segundos entre keepalives.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 tamanho: int = TAMANHO_POOL,
+                 canales_por_transporte: int = CANALES_POR_TRANSPORTE,
+                 keepalive: int = KEEPALIVE_SEGUNDOS, directorio: Optional[str] = None) -> None:
+        self.host = host
+        self.port = port
+        self.username = username
+        self._password = password
+        self.directorio = directorio
+        self.tamanho = max(1, tamanho)
+        self.canales_por_transporte = max(1, canales_por_transporte)
+        self.keepalive = keepalive
+        self._lock = threading.Lock()
+        # Cada entrada es [transporte, canales en uso]
+        self._transportes: List[list] = []
+        # Bloques usar_pool que lo tienen reservado; se modifica bajo _pools_lock
+        self.usuarios = 0
+        # Sustituido por otro pool (ver retirar): cada transporte se cierra cuando le devuelven su último canal
+        self._retirado = False
+
+    def _conectar(self) -> paramiko.Transport:
+        """
+        Abre y autentica un transporte nuevo con keepalive activado.
+
+        Returns:
+            paramiko.Transport: Transporte autenticado.
+        """
+        _logger.info(f"Estableciendo transporte SFTP con {self.host}:{self.port}")
+        transport = paramiko.Transport((self.host, self.port))
+        try:
+            transport.connect(username=self.username, password=self._password)
+        except Exception:
+            transport.close()
+            raise
+        transport.set_keepalive(self.keepalive)
+        return transport
+
+    def _descartar(self, entrada: list) -> None:
+        entrada[0].close()
+        self._transportes = [e for e in self._transportes if e is not entrada]
+        _liberar_conexion()
+
+    def _reservar(self) -> list:
+        """
+        Escoge el transporte con menos canales en uso, abriendo o reconectando uno si hace falta.
+
+        Returns:
+            list: Entrada [transporte, canales en uso] con el contador ya incrementado.
+        """
+        # Conexión global ocupada mientras se esperaba fuera del lock
+        conexion = False
+        while True:
+            with self._lock:
+                # Descartar transportes caídos aunque tengan canales prestados (esos canales ya no sirven): si
+                # se esperara a que los devuelvan, su conexión global seguiría ocupada y el pool podría
+                # quedarse esperando una libre para siempre
+                for entrada in list(self._transportes):
+                    if not entrada[0].is_active():
+                        _logger.warning(f"Transporte SFTP con {self.host} caído, se descarta")
+                        self._descartar(entrada)
+
+                entrada = min(self._transportes, key=lambda e: e[1], default=None)
+                if entrada is None or (entrada[1] >= self.canales_por_transporte
+                                       and len(self._transportes) < self.tamanho):
+                    # Con SFTP_CONEXIONES_MAX solo se abre otro transporte si queda una conexión global libre
+                    if conexion or _ocupar_conexion():
+                        conexion = False
+                        try:
+                            entrada = [self._conectar(), 0]
+                        except Exception:
+                            _liberar_conexion()
+                            raise
+                        self._transportes.append(entrada)
+                if entrada is not None:
+                    if conexion:
+                        _liberar_conexion()
+                    entrada[1] += 1
+                    return entrada
+            # Sin transporte propio y con todas las conexiones ocupadas: se espera fuera del lock
+            _logger.info(f"Limite de {CONEXIONES_MAX} conexiones SFTP alcanzado, {self.host} espera una libre")
+            _conexiones.acquire()
+            conexion = True
+
+    def _liberar(self, entrada: list) -> None:
+        with self._lock:
+            entrada[1] -= 1
+            if self._retirado and entrada[1] == 0 and any(otra is entrada for otra in self._transportes):
+                self._descartar(entrada)
+
+    def retirar(self) -> None:
+        """
+        Cierra los transportes sin canales en uso y deja que los demás se cierren cuando terminen sus
+        canales. Se usa cuando otro pool lo sustituye mientras algún trabajo todavía transfiere con él.
+        """
+        with self._lock:
+            self._retirado = True
+            for entrada in list(self._transportes):
+                if entrada[1] == 0:
+                    self._descartar(entrada)
+
+    def _abrir_canal(self, entrada: list) -> Tuple[paramiko.SFTPClient, list]:
+        """
+        Abre un canal SFTP sobre el transporte dado. Si falla, descarta el transporte y lo intenta una
+        vez más sobre otro (reservado con _reservar, que reconecta si hace falta).
+
+        Args:
+            entrada (list): Entrada [transporte, canales en uso] reservada. Si falla se libera.
+
+        Returns:
+            Tuple[paramiko.SFTPClient, list]: Cliente SFTP sobre un canal nuevo y la entrada reservada
+            que hay que liberar al terminar.
+        """
+        try:
+            try:
+                return paramiko.SFTPClient.from_transport(entrada[0]), entrada
+            except (paramiko.SSHException, EOFError, OSError) as e:
+                _logger.warning(f"No se pudo abrir canal SFTP ({e}), reconectando transporte")
+                registrar_reintento("conexion")
+                with self._lock:
+                    if any(otra is entrada for otra in self._transportes):
+                        self._descartar(entrada)
+            self._liberar(entrada)
+            # Ya liberada: si _reservar falla no hay nada que liberar
+            entrada = None
+            entrada = self._reservar()
+            return paramiko.SFTPClient.from_transport(entrada[0]), entrada
+        except Exception:
+            if entrada is not None:
+                self._liberar(entrada)
+            raise
+
+    @contextmanager
+    def sesion(self) -> Iterator[paramiko.SFTPClient]:
+        """
+        Entrega un cliente SFTP sobre un transporte del pool. Al salir se cierra el canal,
+        pero el transporte queda abierto para la siguiente etapa.
+
+        Yields:
+            paramiko.SFTPClient: Cliente SFTP listo para usar.
+        """
+        sftp, entrada = self._abrir_canal(self._reservar())
+        try:
+            try:
+                if self.directorio:
+                    sftp.chdir(self.directorio)
+                yield sftp
+            finally:
+                sftp.close()
+        finally:
+            self._liberar(entrada)
+
+    def cerrar(self) -> None:
+        """
+        Cierra todos los transportes del pool.
+        """
+        with self._lock:
+            for entrada in list(self._transportes):
+                self._descartar(entrada)
+        _logger.info(f"Pool SFTP con {self.host}:{self.port} cerrado")
+
+
+def _ocupar_conexion() -> bool:
+    """
+    Ocupa una conexión global sin esperar. Devuelve False si SFTP_CONEXIONES_MAX ya está alcanzado.
+    """
+    return _conexiones is None or _conexiones.acquire(blocking=False)
+
+
+def _liberar_conexion() -> None:
+    if _conexiones is not None:
+        _conexiones.release()
+
+
+# Pools compartidos por proceso, uno por servidor, usuario y directorio remoto
+_pools: Dict[Tuple[str, int, str, Optional[str]], PoolSFTP] = {}
+_pools_lock = threading.Lock()
+# Pools sustituidos por un cambio de contraseña que todavía pueden tener canales en uso; los cierra cerrar_pools
+_retirados: List[PoolSFTP] = []
+# Directorio remoto de la cuenta en curso en este hilo o tarea asyncio (ver usar_pool)
+_directorio_actual: ContextVar[Optional[str]] = ContextVar("directorio_remoto", default=None)
+
+
+def _pool(host: str, port: int, username: str, password: str, directorio: Optional[str]) -> PoolSFTP:
+    """
+    Devuelve el pool de la clave, creándolo si no existe o si cambió la contraseña. Requiere _pools_lock.
+    """
+    clave = (host, int(port), username, directorio)
+    pool = _pools.get(clave)
+    if pool is None or pool._password != password:
+        # El anterior puede estar transfiriendo para un trabajo que lo obtuvo con obtener_pool: no se cierra,
+        # se retira. Uno reservado con usar_pool lo cierra además su último usuario
+        if pool is not None:
+            pool.retirar()
+            _retirados.append(pool)
+        pool = PoolSFTP(host, int(port), username, password, directorio=directorio)
+        _pools[clave] = pool
+    return pool
+
+
+def obtener_pool(host: str, port: int, username: str, password: str, directorio: Optional[str] = None) -> PoolSFTP:
+    """
+    Devuelve el pool compartido para el servidor, usuario y directorio remoto dados, creándolo si no existe.
+
+    Args:
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        password (str): Contraseña para el acceso SFTP.
+        directorio (Optional[str]): Directorio remoto de trabajo. Si no se indica, el de la cuenta en curso
+            (ver usar_pool); las etapas del proceso lo piden sin él.
+
+    Returns:
+        PoolSFTP: Pool de conexiones para ese servidor.
+    """
+    with _pools_lock:
+        return _pool(host, port, username, password, directorio if directorio is not None else _directorio_actual.get())
+
+
+@contextmanager
+def usar_pool(host: str, port: int, username: str, password: str, directorio: Optional[str] = None) -> Iterator[PoolSFTP]:
+    """
+    Reserva el pool de una cuenta mientras dura el bloque. Dentro del bloque (y en los hilos lanzados con
+    propagar_contexto) obtener_pool y sesion_sftp devuelven el pool de ese directorio remoto. Cuando
+    sale el último bloque que lo usa se cierra, liberando sus conexiones para las demás cuentas (ver
+    SFTP_CONEXIONES_MAX); mientras otro trabajo lo use sigue abierto.
+
+    Args:
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        password (str): Contraseña para el acceso SFTP.
+        directorio (Optional[str]): Directorio remoto de la cuenta (ver cuentas.py).
+
+    Yields:
+        PoolSFTP: Pool de la cuenta.
+    """
+    with _pools_lock:
+        pool = _pool(host, port, username, password, directorio)
+        pool.usuarios += 1
+    token = _directorio_actual.set(directorio)
+    try:
+        yield pool
+    finally:
+        _directorio_actual.reset(token)
+        with _pools_lock:
+            pool.usuarios -= 1
+            cerrar = pool.usuarios == 0
+            if cerrar and _pools.get((host, int(port), username, directorio)) is pool:
+                del _pools[(host, int(port), username, directorio)]
+            if cerrar and pool in _retirados:
+                _retirados.remove(pool)
+        if cerrar:
+            pool.cerrar()
+
+
+@contextmanager
+def sesion_sftp(host: str, port: int, username: str, password: str) -> Iterator[paramiko.SFTPClient]:
+    """
+    Atajo para obtener un cliente SFTP del pool compartido.
+
+    Args:
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        password (str): Contraseña para el acceso SFTP.
+
+    Yields:
+        paramiko.SFTPClient: Cliente SFTP listo para usar.
+    """
+    with obtener_pool(host, port, username, password).sesion() as sftp:
+        yield sftp
+
+
+def cerrar_pools() -> None:
+    """
+    Cierra todos los pools abiertos en el proceso.
+    """
+    with _pools_lock:
+        for pool in [*_pools.values(), *_retirados]:
+            pool.cerrar()
+        _pools.clear()
+        _retirados.clear()
@@ -0,0 +1,268 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from descompresion import IndiceExtraccion
+
+load_dotenv()
+
+_logger = logging.getLogger(__name__)
+
+# Base de datos del registro de ejecuciones (se puede ajustar desde el archivo .env)
+RUTA_REGISTRO = Path(os.getenv("REGISTRO_EJECUCIONES_RUTA", "registro_facturas.sqlite3"))
+
+# Etapas por las que pasa cada comprimido, en orden
+ETAPAS = ("listado", "descargado", "verificado", "extraido", "subido")
+_ORDEN = {etapa: posicion for posicion, etapa in enumerate(ETAPAS)}
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS comprimidos (
+    periodo TEXT NOT NULL,
+    archivo TEXT NOT NULL,
+    tamanho INTEGER,
+    mtime INTEGER,
+    etapa TEXT NOT NULL,
+    actualizado REAL NOT NULL,
+    PRIMARY KEY (periodo, archivo)
+);
+CREATE TABLE IF NOT EXISTS pdfs (
+    periodo TEXT NOT NULL,
+    pdf TEXT NOT NULL,
+    archivo TEXT NOT NULL,
+    tamanho INTEGER NOT NULL,
+    subido INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (periodo, pdf)
+);
+CREATE INDEX IF NOT EXISTS pdfs_por_archivo ON pdfs (periodo, archivo);
+"""
+
+
+class RegistroEjecuciones:
+    """
+    Registro local (SQLite) de la etapa alcanzada por cada comprimido y cada PDF de un periodo.
+
+    Cada comprimido avanza por ETAPAS: listado, descargado, verificado (tamaño igual al remoto),
+    extraido y subido. Al volver a ejecutar el proceso se lee el estado del periodo con una sola
+    consulta y cada comprimido retoma en su primera etapa incompleta: los ya subidos se omiten sin
+    consultar nada al servidor. Si el listado remoto muestra que un comprimido cambió de tamaño o
+    de fecha, vuelve a empezar desde el listado.
+
+    El registro sustituye a la variable global que guardaba la lista de archivos entre etapas y se
+    puede usar desde varios hilos (trabajos simultáneos de la API).
+
+    Attributes:
+        ruta (Path): Archivo de la base de datos.
+    """
+
+    def __init__(self, ruta: Optional[Path] = None) -> None:
+        self.ruta = Path(ruta or RUTA_REGISTRO)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(self.ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.executescript(_ESQUEMA)
+
+    def cerrar(self) -> None:
+        self._conexion.close()
+
+    def estado(self, periodo: str) -> Dict[str, str]:
+        """
+        Devuelve la etapa de cada comprimido del periodo.
+        """
+        with self._lock:
+            filas = self._conexion.execute("SELECT archivo, etapa FROM comprimidos WHERE periodo = ?", (periodo,)).fetchall()
+        return dict(filas)
+
+    def subidos(self, periodo: str) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+        """
+        Devuelve el tamaño y la fecha remotos con que se registró cada comprimido ya subido del periodo.
+        """
+        with self._lock:
+            filas = self._conexion.execute("SELECT archivo, tamanho, mtime FROM comprimidos "
+                                           "WHERE periodo = ? AND etapa = 'subido'", (periodo,)).fetchall()
+        return {archivo: (tamanho, mtime) for archivo, tamanho, mtime in filas}
+
+    def iniciar_periodo(self, periodo: str, archivos: List[str], atributos: Dict[str, List[int]]) -> List[str]:
+        """
+        Registra el listado de un periodo y devuelve los comprimidos que aún no están subidos.
+
+        Args:
+            periodo (str): Periodo 'YYYYMM'.
+            archivos (List[str]): Comprimidos del periodo en el servidor.
+            atributos (Dict[str, List[int]]): Tamaño y fecha remotos de cada comprimido (ConteoArchivos.atributos).
+
+        Returns:
+            List[str]: Comprimidos pendientes, en el orden recibido.
+        """
+        ahora = time.time()
+        with self._lock, self._conexion:
+            self._conexion.execute("BEGIN")
+            previos = {archivo: (tamanho, mtime) for archivo, tamanho, mtime in self._conexion.execute(
+                "SELECT archivo, tamanho, mtime FROM comprimidos WHERE periodo = ?", (periodo,))}
+            for archivo in archivos:
+                tamanho, mtime = (atributos.get(archivo) or [None, None])[:2]
+                if archivo not in previos:
+                    self._conexion.execute("INSERT INTO comprimidos VALUES (?, ?, ?, ?, 'listado', ?)",
+                                           (periodo, archivo, tamanho, mtime, ahora))
+                elif tamanho is not None and previos[archivo] != (tamanho, mtime):
+                    _logger.info(f"{archivo} cambio en el servidor desde la ultima ejecucion, se procesa de nuevo")
+                    self._conexion.execute("UPDATE comprimidos SET tamanho = ?, mtime = ?, etapa = 'listado', actualizado = ? "
+                                           "WHERE periodo = ? AND archivo = ?", (tamanho, mtime, ahora, periodo, archivo))
+                    self._conexion.execute("DELETE FROM pdfs WHERE periodo = ? AND archivo = ?", (periodo, archivo))
+            self._conexion.execute("COMMIT")
+        estado = self.estado(periodo)
+        pendientes = [archivo for archivo in archivos if estado.get(archivo) != "subido"]
+        if len(pendientes) < len(archivos):
+            _logger.info(f"{len(archivos) - len(pendientes)} de {len(archivos)} comprimidos de {periodo} ya se procesaron "
+                         f"en una ejecucion anterior, se omiten")
+        return pendientes
+
+    def pendientes(self, periodo: str, archivos: Iterable[str], etapa: str, destino: Optional[Path] = None) -> List[str]:
+        """
+        Devuelve los comprimidos que todavía no alcanzaron la etapa.
+
+        Args:
+            periodo (str): Periodo 'YYYYMM'.
+            archivos (Iterable[str]): Comprimidos a comprobar.
+            etapa (str): Etapa que deben haber alcanzado.
+            destino (Optional[Path]): Directorio de descarga. Si se indica, un comprimido descargado pero
+                todavía sin extraer que ya no está en disco cuenta como pendiente de descarga.
+
+        Returns:
+            List[str]: Comprimidos pendientes, en el orden recibido.
+        """
+        estado = self.estado(periodo)
+        pendientes = []
+        for archivo in archivos:
+            alcanzada = _ORDEN.get(estado.get(archivo, "listado"), 0)
+            if alcanzada < _ORDEN[etapa]:
+                pendientes.append(archivo)
+            elif destino is not None and alcanzada < _ORDEN["extraido"] and not (Path(destino) / archivo).exists():
+                pendientes.append(archivo)
+        return pendientes
+
+    def en_etapa(self, periodo: str, archivos: Iterable[str], etapa: str) -> List[str]:
+        """
+        Devuelve los comprimidos que están exactamente en la etapa (por ejemplo, verificados y sin extraer).
+        """
+        estado = self.estado(periodo)
+        return [archivo for archivo in archivos if estado.get(archivo) == etapa]
+
+    def avanzar(self, periodo: str, archivos: Iterable[str], etapa: str) -> None:
+        """
+        Marca los comprimidos en la etapa indicada (nunca los hace retroceder).
+        """
+        mayores = ETAPAS[_ORDEN[etapa]:]
+        with self._lock, self._conexion:
+            self._conexion.executemany(
+                f"UPDATE comprimidos SET etapa = ?, actualizado = ? WHERE periodo = ? AND archivo = ? "
+                f"AND etapa NOT IN ({', '.join('?' * len(mayores))})",
+                [(etapa, time.time(), periodo, archivo, *mayores) for archivo in archivos])
+
+    def registrar_descarga(self, periodo: str, archivos: Iterable[str], destino: Path) -> List[str]:
+        """
+        Marca como descargados los comprimidos presentes en disco y como verificados los que además
+        tienen el tamaño que indicó el listado remoto.
+
+        Returns:
+            List[str]: Comprimidos verificados.
+        """
+        archivos = list(archivos)
+        if not archivos:
+            return []
+        with self._lock:
+            tamanhos = dict(self._conexion.execute(
+                f"SELECT archivo, tamanho FROM comprimidos WHERE periodo = ? AND archivo IN ({', '.join('?' * len(archivos))})",
+                (periodo, *archivos)).fetchall())
+        descargados, verificados = [], []
+        for archivo in archivos:
+            try:
+                tamanho = (Path(destino) / archivo).stat().st_size
+            except FileNotFoundError:
+                continue
+            descargados.append(archivo)
+            if tamanhos.get(archivo) in (None, tamanho):
+                verificados.append(archivo)
+            else:
+                _logger.warning(f"{archivo}: {tamanho} bytes en disco y {tamanhos[archivo]} en el servidor")
+        self.avanzar(periodo, descargados, "descargado")
+        self.avanzar(periodo, verificados, "verificado")
+        return verificados
+
+    def registrar_extraccion(self, periodo: str, archivos: Iterable[str], carpeta: Path) -> List[str]:
+        """
+        Marca como extraídos los comprimidos que el índice de extracción de la carpeta da por
+        completos y guarda los PDF de cada uno (los del primer nivel, que son los que se suben).
+
+        Returns:
+            List[str]: Comprimidos extraídos.
+        """
+        indice = IndiceExtraccion(carpeta)
+        extraidos = [archivo for archivo in archivos if indice.entradas.get(archivo, {}).get("completo")]
+        with self._lock, self._conexion:
+            for archivo in extraidos:
+                self._conexion.execute("DELETE FROM pdfs WHERE periodo = ? AND archivo = ?", (periodo, archivo))
+                self._conexion.executemany(
+                    "INSERT OR REPLACE INTO pdfs (periodo, pdf, archivo, tamanho) VALUES (?, ?, ?, ?)",
+                    [(periodo, pdf, archivo, tamanho) for pdf, tamanho in indice.entradas[archivo]["miembros"].items()
+                     if '/' not in pdf and pdf.endswith('.pdf')])
+        self.avanzar(periodo, extraidos, "extraido")
+        return extraidos
+
+    def registrar_subida(self, periodo: str, en_servidor: Iterable[str]) -> List[str]:
+        """
+        Marca como subidos los PDF que ya están en el servidor y como subidos los comprimidos
+        extraídos cuyos PDF están todos en el servidor.
+
+        Args:
+            periodo (str): Periodo 'YYYYMM'.
+            en_servidor (Iterable[str]): Nombres de los PDF de la carpeta que quedaron en el servidor.
+
+        Returns:
+            List[str]: Comprimidos subidos.
+        """
+        with self._lock, self._conexion:
+            self._conexion.executemany("UPDATE pdfs SET subido = 1 WHERE periodo = ? AND pdf = ?",
+                                       [(periodo, pdf) for pdf in en_servidor])
+            subidos = [archivo for archivo, in self._conexion.execute(
+                "SELECT c.archivo FROM comprimidos c WHERE c.periodo = ? AND c.etapa = 'extraido' AND NOT EXISTS "
+                "(SELECT 1 FROM pdfs p WHERE p.periodo = c.periodo AND p.archivo = c.archivo AND p.subido = 0)",
+                (periodo,))]
+        self.avanzar(periodo, subidos, "subido")
+        return subidos
+
+    def olvidar(self, periodo: str) -> None:
+        """
+        Borra el registro de un periodo para que la próxima ejecución lo procese desde cero.
+        """
+        with self._lock, self._conexion:
+            self._conexion.execute("DELETE FROM comprimidos WHERE periodo = ?", (periodo,))
+            self._conexion.execute("DELETE FROM pdfs WHERE periodo = ?", (periodo,))
+
+
+# Un registro por archivo: cada cuenta (ver cuentas.py) tiene el suyo en su directorio de trabajo
+_registros: Dict[Path, RegistroEjecuciones] = {}
+_lock_registro = threading.Lock()
+
+
+def obtener_registro(ruta: Optional[Path] = None) -> RegistroEjecuciones:
+    """
+    Devuelve el registro de ejecuciones guardado en 'ruta' (por defecto REGISTRO_EJECUCIONES_RUTA),
+    abriéndolo la primera vez.
+    """
+    ruta = Path(ruta or RUTA_REGISTRO).resolve()
+    with _lock_registro:
+        if ruta not in _registros:
+            _registros[ruta] = RegistroEjecuciones(ruta)
+        return _registros[ruta]
+
+
+def ruta_registro(directorio_trabajo: Optional[Path] = None) -> Path:
+    """
+    Devuelve la ruta del registro de ejecuciones de un directorio de trabajo, o la configurada si no se indica.
+    """
+    return Path(directorio_trabajo) / RUTA_REGISTRO.name if directorio_trabajo else RUTA_REGISTRO
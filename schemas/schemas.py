@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional
+from datetime import datetime
 
 class ConteoArchivos(BaseModel):
     """    
@@ -9,7 +10,105 @@ class ConteoArchivos(BaseModel):
         tar_gz_files (List[str]): Lista de nombres de archivos .tar.gz encontrados.
         zip_files (List[str]): Lista de nombres de archivos .zip encontrados.
         rar_files (List[str]): Lista de nombres de archivos .rar encontrados.
+        periodos (Dict[str, List[str]]): Archivos de cada periodo 'YYYYMM', según el prefijo del nombre.
+        atributos (Dict[str, List[int]]): Tamaño y fecha de modificación remotos de cada comprimido, según el listado.
     """
     tar_gz_files: List[str]
     zip_files: List[str]
-    rar_files: List[str]
\ No newline at end of file
+    rar_files: List[str]
+    periodos: Dict[str, List[str]] = {}
+    atributos: Dict[str, List[int]] = {}
+
+class EstadoTrabajo(BaseModel):
+    """
+    Estado de un procesamiento de facturas lanzado en segundo plano.
+
+    Attributes:
+        id (str): Identificador del trabajo.
+        periodo (str): Periodo 'YYYYMM' que procesa el trabajo, o 'YYYYMM-YYYYMM' si procesa un rango.
+        cuenta (Optional[str]): Cuenta procesada (ver cuentas.py); None para la del archivo .env.
+        estado (str): 'en_cola', 'en_curso', 'terminado' o 'fallido'.
+        etapa (str): Etapa actual del proceso (autenticacion_sms, listado, descarga, descompresion, subida).
+        bytes_transferidos (int): Bytes descargados y subidos hasta el momento.
+        archivos_procesados (int): Archivos descargados, descomprimidos o subidos hasta el momento.
+        error (Optional[str]): Mensaje de error si el trabajo falló.
+        creado (datetime): Momento en que se creó el trabajo.
+        actualizado (datetime): Momento de la última actualización.
+    """
+    id: str
+    periodo: str
+    cuenta: Optional[str] = None
+    estado: str = "en_cola"
+    etapa: str = ""
+    bytes_transferidos: int = 0
+    archivos_procesados: int = 0
+    error: Optional[str] = None
+    creado: datetime
+    actualizado: datetime
+
+class PlanEspacio(BaseModel):
+    """
+    Resultado de la planificación de espacio en disco previa a la descarga y la descompresión.
+
+    Attributes:
+        estrategia (str): 'paralelo', 'secuencial' (borrando cada comprimido tras extraerlo) o 'streaming'.
+        bytes_descarga (int): Bytes de comprimidos que faltan por descargar.
+        bytes_descomprimidos (int): Bytes que ocupará lo extraído.
+        bytes_libres (int): Bytes libres en el disco de trabajo.
+        necesarios_paralelo (int): Bytes necesarios para descargar todo y descomprimir en paralelo.
+        necesarios_secuencial (int): Bytes necesarios procesando los comprimidos de uno en uno.
+        necesarios_streaming (int): Bytes necesarios en modo streaming (solo los .rar pasan por disco).
+        tamanhos (Dict[str, List[int]]): Tamaño comprimido y descomprimido de cada archivo.
+    """
+    estrategia: str
+    bytes_descarga: int
+    bytes_descomprimidos: int
+    bytes_libres: int
+    necesarios_paralelo: int
+    necesarios_secuencial: int
+    necesarios_streaming: int
+    tamanhos: Dict[str, List[int]] = {}
+
+class CuentaSFTP(BaseModel):
+    """
+    Cuenta SFTP que se procesa junto con otras (ver cuentas.py).
+
+    Attributes:
+        nombre (str): Nombre corto y único de la cuenta; identifica sus trabajos y su directorio de trabajo.
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        password (str): Contraseña; admite referencias a variables de entorno como '${PASSWORD_CUENTA}'.
+        directorio_remoto (str): Directorio remoto donde llegan los comprimidos y debajo del cual se suben los PDF.
+        directorio_trabajo (Optional[str]): Directorio local de descargas, registro e informes. Por defecto 'cuentas/<nombre>'.
+    """
+    nombre: str
+    host: str
+    port: int = 22
+    username: str
+    password: str
+    directorio_remoto: str = "."
+    directorio_trabajo: Optional[str] = None
+
+class Factura(BaseModel):
+    """
+    Entrada del catálogo de facturas (ver catalogo.py).
+
+    Attributes:
+        periodo (str): Periodo 'YYYYMM' de la factura.
+        archivo (str): Nombre del PDF.
+        telefono (Optional[str]): Número de teléfono sacado del nombre del PDF, si lo tiene.
+        cuenta (Optional[str]): Cuenta del cliente sacada del nombre del PDF, si lo tiene.
+        tamanho (int): Tamaño del PDF en bytes.
+        sha256 (Optional[str]): Hash SHA-256 del PDF.
+        ruta_remota (Optional[str]): Ruta del PDF en el servidor SFTP, si ya se subió.
+        actualizado (datetime): Momento en que se catalogó por última vez.
+    """
+    periodo: str
+    archivo: str
+    telefono: Optional[str] = None
+    cuenta: Optional[str] = None
+    tamanho: int
+    sha256: Optional[str] = None
+    ruta_remota: Optional[str] = None
+    actualizado: datetime
@@ -1,6 +1,10 @@
 import os
+import argparse
 from dotenv import load_dotenv
-from functions import ejecutar_descompactar_facturas
+from functions import ejecutar_descompactar_facturas, ejecutar_backfill
+from cuentas import cargar_cuentas, ejecutar_cuentas, ARCHIVO_CUENTAS
+from pool_sftp import cerrar_pools
+from sms import cerrar_despachador
 
 load_dotenv()
 
@@ -9,4 +13,23 @@ port = os.getenv("PORT")
 username = os.getenv("USER")
 password = os.getenv("PASSWORD")
 
-ejecutar_descompactar_facturas(host, int(port), username, password)
\ No newline at end of file
+parser = argparse.ArgumentParser(description="Procesamiento de facturas de Cubacel Online")
+parser.add_argument("--workers", type=int, default=None, help="Procesos usados para descomprimir (por defecto DESCOMPRESION_WORKERS o los núcleos disponibles)")
+parser.add_argument("--desde", default=None, help="Primer periodo YYYYMM a procesar (backfill); por defecto solo el mes vencido")
+parser.add_argument("--hasta", default=None, help="Último periodo YYYYMM a procesar (backfill); por defecto igual a --desde")
+parser.add_argument("--cuentas", nargs="?", const=str(ARCHIVO_CUENTAS), default=None,
+                    help=f"Procesa a la vez todas las cuentas del archivo indicado (por defecto {ARCHIVO_CUENTAS}) en lugar de la del .env")
+parser.add_argument("--simultaneas", type=int, default=None, help="Cuentas procesándose a la vez (por defecto CUENTAS_SIMULTANEAS)")
+args = parser.parse_args()
+
+try:
+    if args.cuentas:
+        ejecutar_cuentas(cargar_cuentas(args.cuentas), args.simultaneas, args.desde, args.hasta, workers=args.workers)
+    elif args.desde:
+        ejecutar_backfill(host, int(port), username, password, args.desde, args.hasta or args.desde, workers=args.workers)
+    else:
+        ejecutar_descompactar_facturas(host, int(port), username, password, workers=args.workers)
+finally:
+    cerrar_pools()
+    # Se da un margen para que salgan los SMS de fin de proceso antes de terminar
+    cerrar_despachador(timeout=30)
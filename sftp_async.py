@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+import paramiko
+from schemas.schemas import ConteoArchivos
+from pool_sftp import PoolSFTP, obtener_pool
+from listado_remoto import listar_con_snapshot
+from descargas import (CONCURRENCIA_DESCARGA, TAMANHO_BLOQUE_DESCARGA, planificar_descargas,
+                       descargar_bloque_registrado, completar_descarga, comprobar_descarga, registrar_resumen)
+from subidas import CONCURRENCIA_SUBIDA, indice_remoto, subir_archivo, VerificacionSubida
+from subidas import registrar_resumen as registrar_resumen_subida
+from trabajos import Progreso
+from metricas import propagar_contexto
+from catalogo import CatalogoFacturas
+
+_logger = logging.getLogger(__name__)
+
+
+class AdaptadorSFTPAsync:
+    """
+    Adaptador asyncio sobre clientes paramiko del pool.
+
+    Abre una cantidad fija de canales y ejecuta cada operación SFTP en un hilo de un pool acotado
+    con el canal que esté libre. La cola de canales hace de semáforo: puede haber miles de
+    corrutinas esperando una operación, pero nunca más hilos ni canales que 'canales'.
+
+    Attributes:
+        pool (PoolSFTP): Pool de donde se toman los canales.
+        canales (int): Canales abiertos y operaciones SFTP simultáneas.
+    """
+
+    def __init__(self, pool: PoolSFTP, canales: int) -> None:
+        self.pool = pool
+        self.canales = max(1, canales)
+        self._executor = ThreadPoolExecutor(max_workers=self.canales, thread_name_prefix="sftp-async")
+        self._pila = ExitStack()
+        self._cola: "asyncio.Queue[paramiko.SFTPClient]" = asyncio.Queue()
+
+    async def __aenter__(self) -> "AdaptadorSFTPAsync":
+        loop = asyncio.get_running_loop()
+        try:
+            for _ in range(self.canales):
+                sftp = await loop.run_in_executor(self._executor, propagar_contexto(self._pila.enter_context), self.pool.sesion())
+                self._cola.put_nowait(sftp)
+        except BaseException:
+            # __aexit__ no se llama si __aenter__ falla: los canales ya abiertos vuelven al pool aquí
+            await loop.run_in_executor(self._executor, self._pila.close)
+            self._executor.shutdown(wait=False)
+            raise
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._pila.close)
+        self._executor.shutdown(wait=False)
+
+    async def ejecutar(self, funcion: Callable[..., Any], *args) -> Any:
+        """
+        Ejecuta funcion(sftp, *args) en un hilo con un canal libre y devuelve su resultado.
+        """
+        sftp = await self._cola.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, propagar_contexto(funcion), sftp, *args)
+        finally:
+            self._cola.put_nowait(sftp)
+
+
+async def read_from_sftp_async(host: str, port: int, username: str, password: str) -> ConteoArchivos:
+    """
+    Versión asyncio de read_from_sftp: lista el directorio remoto sin bloquear el bucle de eventos.
+
+    Args:
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        password (str): Contraseña para el acceso SFTP.
+
+    Returns:
+        ConteoArchivos: Objeto que contiene listas de archivos .tar.gz, .zip y .rar y su índice por periodo.
+    """
+    async with AdaptadorSFTPAsync(obtener_pool(host, port, username, password), 1) as adaptador:
+        return await adaptador.ejecutar(listar_con_snapshot, host, port, username)
+
+
+async def descargar_archivos_sftp_async(host: str, port: int, username: str, password: str, archivos: List[str], destino: str,
+                                        concurrencia: Optional[int] = None, progreso: Optional[Progreso] = None) -> List[str]:
+    """
+    Versión asyncio de descargar_archivos_sftp. Cada bloque de cada archivo es una corrutina; un
+    semáforo limita cuántos bloques se descargan a la vez y el trabajo bloqueante de paramiko corre
+    en un pool de hilos del mismo tamaño. Usa el mismo manifiesto que la versión síncrona, así que
+    retoma descargas cortadas igual que ella.
+
+    Args:
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        password (str): Contraseña para el acceso SFTP.
+        archivos (List[str]): Nombres de los archivos remotos a descargar.
+        destino (str): Directorio local de descarga.
+        concurrencia (Optional[int]): Bloques descargándose a la vez. Por defecto DESCARGA_CONCURRENCIA.
+        progreso (Optional[Progreso]): Donde se suman los bytes y archivos descargados.
+
+    Returns:
+        List[str]: Nombres de los archivos descargados satisfactoriamente en esta ejecución.
+    """
+    concurrencia = concurrencia or CONCURRENCIA_DESCARGA
+    destino = Path(destino)
+    pool = obtener_pool(host, port, username, password)
+    loop = asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix="descarga-async") as executor:
+        manifiesto, pendientes = await loop.run_in_executor(
+            executor, planificar_descargas, pool, archivos, destino, TAMANHO_BLOQUE_DESCARGA)
+        if not pendientes:
+            return []
+
+        inicio = time.monotonic()
+        total_bytes = sum(longitud for bloques in pendientes.values() for _, longitud in bloques)
+        _logger.info(f"Descargando {len(pendientes)} archivos ({total_bytes / 1024 / 1024:.1f} MB pendientes) con {concurrencia} flujos asincronos")
+        semaforo = asyncio.Semaphore(concurrencia)
+
+        async def bloque(archivo: str, offset: int, longitud: int) -> None:
+            async with semaforo:
+                await loop.run_in_executor(executor, propagar_contexto(descargar_bloque_registrado),
+                                           pool, manifiesto, archivo, destino, offset, longitud, progreso)
+
+        async def descargar(archivo: str) -> Optional[str]:
+            resultados = await asyncio.gather(*(bloque(archivo, offset, longitud) for offset, longitud in pendientes[archivo]),
+                                              return_exceptions=True)
+            errores = [r for r in resultados if isinstance(r, Exception)]
+            if errores:
+                _logger.error(f"Error descargando el archivo: {archivo}: {errores[0]}")
+                return None
+            await loop.run_in_executor(executor, propagar_contexto(completar_descarga), manifiesto, archivo, destino, progreso)
+            return archivo
+
+        descargados = [archivo for archivo in await asyncio.gather(*(descargar(a) for a in pendientes)) if archivo]
+        manifiesto.guardar()
+
+    registrar_resumen(len(descargados), len(pendientes), total_bytes, time.monotonic() - inicio)
+    return descargados
+
+
+async def subir_carpeta_a_sftp_async(host: str, port: int, username: str, password: str, carpeta_local: str, carpeta_buscar: str,
+                                     concurrencia: Optional[int] = None, progreso: Optional[Progreso] = None,
+                                     catalogo: Optional[CatalogoFacturas] = None) -> List[Path]:
+    """
+    Versión asyncio de subir_carpeta_a_sftp: un listado remoto, diferencia local y una corrutina por
+    PDF pendiente, con tantos canales en uso como indique la concurrencia.
+
+    Args:
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        password (str): Contraseña para el acceso SFTP.
+        carpeta_local (str): Ruta del directorio local donde se buscará la carpeta.
+        carpeta_buscar (str): Nombre de la carpeta a buscar y subir.
+        concurrencia (Optional[int]): Canales subiendo a la vez. Por defecto SUBIDA_CONCURRENCIA.
+        progreso (Optional[Progreso]): Donde se suman los bytes y archivos subidos.
+        catalogo (Optional[CatalogoFacturas]): Catálogo donde se anotan los PDF de la carpeta con su ruta remota.
+
+    Returns:
+        List[Path]: PDF de la carpeta que quedaron en el sftp (los que ya estaban y los subidos ahora).
+    """
+    carpeta_encontrada = Path(carpeta_local) / carpeta_buscar
+    if not carpeta_encontrada.is_dir():
+        _logger.warning(f"No se encontró la carpeta {carpeta_buscar} en la carpeta {carpeta_local}")
+        return []
+
+    concurrencia = concurrencia or CONCURRENCIA_SUBIDA
+    async with AdaptadorSFTPAsync(obtener_pool(host, port, username, password), concurrencia) as adaptador:
+        home_directory = await adaptador.ejecutar(lambda sftp: sftp.normalize("."))
+        remote_directory_path = f"{home_directory.rstrip('/')}/{carpeta_encontrada.name}"
+        indice = await adaptador.ejecutar(indice_remoto, remote_directory_path)
+
+        archivos_pdf = await asyncio.to_thread(lambda: list(carpeta_encontrada.glob('*.pdf')))
+        verificacion = VerificacionSubida(carpeta_encontrada, remote_directory_path)
+        pendientes = await adaptador.ejecutar(verificacion.pendientes, archivos_pdf, indice)
+        _logger.info(f"{len(archivos_pdf) - len(pendientes)} archivos ya estaban en el sftp (verificacion por {verificacion.modo}), {len(pendientes)} por subir")
+
+        inicio = time.monotonic()
+        resultados = await asyncio.gather(*(adaptador.ejecutar(subir_archivo, archivo, remote_directory_path, progreso)
+                                            for archivo in pendientes))
+        subidos = [archivo for archivo, ok in zip(pendientes, resultados) if ok]
+        por_subir = set(pendientes)
+        en_servidor = [archivo for archivo in archivos_pdf if archivo not in por_subir] + subidos
+        await adaptador.ejecutar(verificacion.registrar, en_servidor, indice)
+    if catalogo is not None:
+        await asyncio.to_thread(catalogo.registrar_carpeta, carpeta_encontrada.name, carpeta_encontrada, en_servidor, remote_directory_path)
+    registrar_resumen_subida(subidos, len(pendientes), time.monotonic() - inicio, concurrencia)
+    _logger.info(f"Cantidad de archivos verificados: {len(archivos_pdf)}")
+    _logger.info(f"Cantidad de archivos subidos al sftp: {len(subidos)}")
+    return en_servidor
+
+
+def _en_bucle(corrutina: Callable[..., Any], loop: asyncio.AbstractEventLoop) -> Callable[..., Any]:
+    """
+    Convierte una corrutina en una función síncrona que la programa en 'loop' y espera su resultado.
+    Se usa desde el hilo donde corre el proceso para hacer las transferencias en el bucle de eventos
+    de la API; el informe de la ejecución se propaga a la corrutina.
+    """
+    def en_bucle(*args, **kwargs):
+        return asyncio.run_coroutine_threadsafe(propagar_contexto(corrutina)(*args, **kwargs), loop).result()
+    return en_bucle
+
+
+async def ejecutar_descompactar_facturas_async(host: str, port: int, username: str, password: str,
+                                               modo_streaming: Optional[bool] = None, workers: Optional[int] = None,
+                                               progreso: Optional[Progreso] = None,
+                                               directorio_trabajo: Optional[Path] = None) -> None:
+    """
+    Versión asyncio de ejecutar_descompactar_facturas, pensada para correr dentro del bucle de
+    eventos de FastAPI. El proceso es el mismo (procesar_periodo) y corre en un hilo para que el
+    registro, los SMS, los logs y la descompresión no bloqueen el bucle; el listado, la descarga y la
+    subida se hacen con las versiones asyncio de este módulo, programadas en el bucle de la API.
+
+    Args:
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        password (str): Contraseña para el acceso SFTP.
+        modo_streaming (Optional[bool]): Activa el modo streaming. Por defecto se toma de MODO_STREAMING en el .env.
+        workers (Optional[int]): Procesos usados para descomprimir. Por defecto DESCOMPRESION_WORKERS.
+        progreso (Optional[Progreso]): Donde se reporta la etapa y el avance si el proceso corre como trabajo.
+        directorio_trabajo (Optional[Path]): Directorio local de la cuenta. Por defecto, el directorio actual.
+
+    Returns:
+        None
+    """
+    # Importación diferida: functions importa los motores que usa este módulo
+    from functions import ejecutar_descompactar_facturas
+
+    loop = asyncio.get_running_loop()
+    descargar_en_bucle = _en_bucle(descargar_archivos_sftp_async, loop)
+
+    def descargar(conteo_archivos: ConteoArchivos, host: str, port: int, username: str, password: str,
+                  archivos: List[str], destino: str, progreso: Optional[Progreso] = None) -> List[str]:
+        # Misma firma que descargar_archivos_sftp; la versión asyncio no necesita el conteo
+        descargados = descargar_en_bucle(host, port, username, password, archivos, destino, progreso=progreso)
+        comprobar_descarga(archivos, Path(destino))
+        return descargados
+
+    await asyncio.to_thread(ejecutar_descompactar_facturas, host, port, username, password, modo_streaming, workers,
+                            progreso, directorio_trabajo, descargar, _en_bucle(subir_carpeta_a_sftp_async, loop),
+                            _en_bucle(read_from_sftp_async, loop))
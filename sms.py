@@ -1,16 +1,33 @@
 import requests
 from typing import List, Optional
 import logging
-from pathlib import Path
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from metricas import propagar_contexto, registrar_error, registrar_reintento
+
+load_dotenv()
 
 _logger = logging.getLogger(__name__)
 
+# Configuración del envío de SMS (se puede ajustar desde el archivo .env)
+TIMEOUT_SMS = float(os.getenv("SMS_TIMEOUT", "10"))
+REINTENTOS_SMS = int(os.getenv("SMS_REINTENTOS", "3"))
+WORKERS_SMS = int(os.getenv("SMS_WORKERS", "4"))
+# Vigencia del token en segundos si el servidor no la indica en la respuesta
+TTL_TOKEN_SMS = int(os.getenv("SMS_TOKEN_TTL", "3000"))
+DESTINOS_SMS = [destino.strip() for destino in os.getenv("SMS_DESTINOS", "51368261,52888880").split(",") if destino.strip()]
+REMITENTE_SMS = "Medin"
+
 # Paso 1: Autenticación para obtener el token
-def obtener_token_servidor_sms(auth_url:str,username:str,password:str) -> Optional[str]:
+def obtener_token_servidor_sms(auth_url:str,username:str,password:str, session: Optional[requests.Session] = None) -> Optional[str]:
     auth_data = {"username": username, "password": password}
-        
+
     try:
-        response = requests.post(auth_url, json=auth_data, verify=False)
+        response = (session or requests).post(auth_url, json=auth_data, verify=False, timeout=TIMEOUT_SMS)
         response.raise_for_status()
         token = response.json()["token"]  # Token obtenido
         _logger.info(f"Token obtenido por parte del servidor sms")
@@ -20,7 +37,7 @@ def obtener_token_servidor_sms(auth_url:str,username:str,password:str) -> Option
         return None
 
 # Paso 2: Usar el token para enviar SMS
-def envio_sms(sms_url:str, token:str, mensaje_sms:str, destinos: List[str]) -> None:
+def envio_sms(sms_url:str, token:str, mensaje_sms:str, destinos: List[str], session: Optional[requests.Session] = None) -> None:
 
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
 
@@ -30,14 +47,204 @@ def envio_sms(sms_url:str, token:str, mensaje_sms:str, destinos: List[str]) -> N
             "sms": {
                 "destination": destino,
                 "message": mensaje_sms,
-                "sender": "Medin"
+                "sender": REMITENTE_SMS
             }
         }
         try:
-            sms_response = requests.post(sms_url, json=sms_data, headers=headers, verify=False)
+            sms_response = (session or requests).post(sms_url, json=sms_data, headers=headers, verify=False, timeout=TIMEOUT_SMS)
             if sms_response.status_code == 200:
-                print(f"SMS enviado a {destino}: {sms_response.json()}")
+                _logger.info(f"SMS enviado a {destino}: {sms_response.json()}")
             else:
-                print(f"Error enviando SMS a {destino}: {sms_response.status_code}")
+                _logger.error(f"Error enviando SMS a {destino}: {sms_response.status_code}")
         except Exception as e:
-            _logger.error(f"Fallo de envio del sms")
\ No newline at end of file
+            _logger.error(f"Fallo de envio del sms a {destino}: {e}")
+
+
+class ClienteSMS:
+    """
+    Cliente del servidor de SMS con una sesión HTTP reutilizable y el token en caché.
+
+    El token se pide una sola vez y se reutiliza hasta que vence (según 'expires_in' si el servidor
+    lo devuelve, o SMS_TOKEN_TTL) o hasta que el servidor responde 401. Cada envío tiene timeout y se
+    reintenta con espera creciente ante errores de red o respuestas 5xx.
+
+    Attributes:
+        auth_url (str): URL de autenticación.
+        sms_url (str): URL de envío de SMS.
+        username (str): Usuario del servidor de SMS.
+        password (str): Contraseña del servidor de SMS.
+        reintentos (int): Intentos por mensaje.
+    """
+
+    def __init__(self, auth_url: str, username: str, password: str, sms_url: str, reintentos: int = REINTENTOS_SMS,
+                 conexiones: int = WORKERS_SMS) -> None:
+        self.auth_url = auth_url
+        self.sms_url = sms_url
+        self.username = username
+        self.password = password
+        self.reintentos = max(1, reintentos)
+        self.session = requests.Session()
+        self.session.verify = False
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=conexiones)
+        self.session.mount("https://", adaptador)
+        self.session.mount("http://", adaptador)
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._vence = 0.0
+
+    def token(self, renovar: bool = False) -> Optional[str]:
+        """
+        Devuelve el token vigente, pidiéndolo al servidor solo si no hay uno o venció.
+        """
+        with self._lock:
+            if renovar or self._token is None or time.monotonic() >= self._vence:
+                try:
+                    response = self.session.post(self.auth_url, json={"username": self.username, "password": self.password},
+                                                 timeout=TIMEOUT_SMS)
+                    response.raise_for_status()
+                    datos = response.json()
+                    self._token = datos["token"]
+                    # Se renueva un poco antes del vencimiento para no usar un token a punto de caducar
+                    self._vence = time.monotonic() + max(int(datos.get("expires_in", TTL_TOKEN_SMS)) - 30, 30)
+                    _logger.info(f"Token obtenido por parte del servidor sms")
+                except (requests.RequestException, KeyError, ValueError) as e:
+                    _logger.error(f"Fallo en la obtencion del token {e}")
+                    self._token = None
+            return self._token
+
+    def enviar(self, mensaje_sms: str, destino: str) -> bool:
+        """
+        Envía un SMS a un destino, con reintentos.
+
+        Args:
+            mensaje_sms (str): Texto del mensaje.
+            destino (str): Número de destino.
+
+        Returns:
+            bool: True si el servidor aceptó el mensaje.
+        """
+        sms_data = {"channel": "SMS", "sms": {"destination": destino, "message": mensaje_sms, "sender": REMITENTE_SMS}}
+        renovar = False
+        for intento in range(1, self.reintentos + 1):
+            if intento > 1:
+                registrar_reintento("sms")
+                time.sleep(min(2 ** (intento - 2), 30))
+            token = self.token(renovar)
+            renovar = False
+            if token is None:
+                continue
+            try:
+                response = self.session.post(self.sms_url, json=sms_data, timeout=TIMEOUT_SMS,
+                                             headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"})
+            except requests.RequestException as e:
+                _logger.warning(f"Fallo de envio del sms a {destino} (intento {intento}/{self.reintentos}): {e}")
+                continue
+            if response.status_code == 200:
+                _logger.info(f"SMS enviado a {destino}")
+                return True
+            if response.status_code == 401:
+                renovar = True
+            elif response.status_code < 500:
+                # Un error del cliente no se arregla reintentando
+                break
+            _logger.warning(f"Error enviando SMS a {destino}: {response.status_code} (intento {intento}/{self.reintentos})")
+        registrar_error("sms")
+        _logger.error(f"No se pudo enviar el SMS a {destino}")
+        return False
+
+    def cerrar(self) -> None:
+        self.session.close()
+
+
+class DespachadorSMS:
+    """
+    Cola de envío de SMS en segundo plano.
+
+    notificar() encola el mensaje y vuelve enseguida; los envíos a los distintos destinos se hacen a
+    la vez en un pool de hilos, de modo que el procesamiento de facturas nunca espera al servidor de SMS.
+
+    Attributes:
+        cliente (ClienteSMS): Cliente usado para los envíos.
+        destinos (List[str]): Destinos por defecto de los mensajes.
+    """
+
+    def __init__(self, cliente: ClienteSMS, destinos: List[str], workers: int = WORKERS_SMS) -> None:
+        self.cliente = cliente
+        self.destinos = destinos
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="sms")
+        self._lock = threading.Lock()
+        self._pendientes: List[Future] = []
+
+    def notificar(self, mensaje_sms: str, destinos: Optional[List[str]] = None) -> None:
+        """
+        Encola un mensaje para todos los destinos indicados (o los de por defecto).
+        """
+        with self._lock:
+            self._pendientes = [futuro for futuro in self._pendientes if not futuro.done()]
+            for destino in destinos or self.destinos:
+                self._pendientes.append(self._executor.submit(propagar_contexto(self.cliente.enviar), mensaje_sms, destino))
+
+    def esperar(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera a que se envíen los mensajes encolados.
+
+        Returns:
+            bool: True si no quedó ninguno pendiente.
+        """
+        with self._lock:
+            pendientes = list(self._pendientes)
+        return not wait(pendientes, timeout=timeout).not_done
+
+    def cerrar(self, timeout: Optional[float] = None) -> None:
+        if not self.esperar(timeout):
+            _logger.warning("Quedaron SMS sin enviar al cerrar el despachador")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.cliente.cerrar()
+
+
+_despachador: Optional[DespachadorSMS] = None
+_lock_despachador = threading.Lock()
+
+
+def obtener_despachador() -> Optional[DespachadorSMS]:
+    """
+    Devuelve el despachador de SMS del proceso, creándolo con las credenciales del archivo .env.
+
+    Returns:
+        Optional[DespachadorSMS]: Despachador, o None si faltan AUTH_URL, SMS_URL, USERNAME_SMS o PASSWORD_SMS.
+    """
+    global _despachador
+    with _lock_despachador:
+        if _despachador is None:
+            auth_url, sms_url = os.getenv("AUTH_URL"), os.getenv("SMS_URL")
+            username_sms, password_sms = os.getenv("USERNAME_SMS"), os.getenv("PASSWORD_SMS")
+            if not all([auth_url, sms_url, username_sms, password_sms]):
+                return None
+            _despachador = DespachadorSMS(ClienteSMS(auth_url, username_sms, password_sms, sms_url), DESTINOS_SMS)
+        return _despachador
+
+
+def notificar(mensaje_sms: str, destinos: Optional[List[str]] = None) -> None:
+    """
+    Encola un SMS sin esperar su envío. Si el servidor de SMS no está configurado solo se registra en el log.
+
+    Args:
+        mensaje_sms (str): Texto del mensaje.
+        destinos (Optional[List[str]]): Números de destino. Por defecto SMS_DESTINOS.
+    """
+    despachador = obtener_despachador()
+    if despachador is None:
+        _logger.warning(f"Servidor de SMS no configurado, no se envia: {mensaje_sms}")
+        return
+    despachador.notificar(mensaje_sms, destinos)
+
+
+def cerrar_despachador(timeout: Optional[float] = None) -> None:
+    """
+    Espera como mucho 'timeout' segundos a los SMS pendientes y libera el despachador.
+    """
+    global _despachador
+    with _lock_despachador:
+        despachador, _despachador = _despachador, None
+    if despachador:
+        despachador.cerrar(timeout)
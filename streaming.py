@@ -0,0 +1,314 @@
+import hashlib
+import io
+import logging
+import os
+import posixpath
+import shutil
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple
+import paramiko
+from dotenv import load_dotenv
+from pool_sftp import PoolSFTP, LIMITE_ANCHO_BANDA
+from subidas import (NOMBRE_MANIFIESTO, escribir_manifiesto_remoto, indice_remoto, leer_manifiesto_remoto,
+                     modo_verificacion)
+from trabajos import Progreso
+from metricas import registrar_archivo, registrar_error
+from descompresion import FILTRO_MIEMBROS, detectar_formato
+from catalogo import CatalogoFacturas
+
+load_dotenv()
+
+_logger = logging.getLogger(__name__)
+
+# Memoria máxima que se lee por adelantado del archivo remoto y tamaño del búfer de copia
+VENTANA_LECTURA = int(os.getenv("STREAMING_VENTANA_MB", "4")) * 1024 * 1024
+TAMANHO_COPIA = 1024 * 1024
+TAMANHO_PETICION = 32 * 1024
+# Formatos que se pueden leer en flujo (rarfile necesita el archivo local)
+FORMATOS_STREAMING = ("zip", "tar.gz")
+
+
+class ArchivoRemotoConVentana(io.RawIOBase):
+    """
+    Envoltorio de solo lectura sobre un paramiko.SFTPFile que pide los datos por ventanas.
+
+    Cada ventana se pide de una vez con readv, así que la lectura secuencial no espera un viaje de
+    ida y vuelta por cada petición de 32 KB, y la memoria usada nunca pasa del tamaño de la ventana.
+    Admite seek, por lo que zipfile puede leer el directorio central y saltar entre miembros.
+
+    Attributes:
+        tamanho (int): Tamaño del archivo remoto en bytes.
+        ventana (int): Bytes pedidos por adelantado en cada recarga.
+    """
+
+    def __init__(self, remoto: paramiko.SFTPFile, tamanho: int, ventana: int = VENTANA_LECTURA) -> None:
+        super().__init__()
+        self._remoto = remoto
+        self.tamanho = tamanho
+        self.ventana = max(ventana, TAMANHO_PETICION)
+        self._pos = 0
+        self._buffer = b""
+        self._inicio_buffer = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.tamanho
+        self._pos = max(0, offset)
+        return self._pos
+
+    def _recargar(self) -> None:
+        fin = min(self._pos + self.ventana, self.tamanho)
+        peticiones = [(offset, min(TAMANHO_PETICION, fin - offset)) for offset in range(self._pos, fin, TAMANHO_PETICION)]
+        self._buffer = b"".join(self._remoto.readv(peticiones))
+        self._inicio_buffer = self._pos
+
+    def readinto(self, destino) -> int:
+        # Se llena el destino completo (salvo fin de archivo) porque zipfile no tolera lecturas cortas
+        leidos = 0
+        while leidos < len(destino) and self._pos < self.tamanho:
+            desplazamiento = self._pos - self._inicio_buffer
+            if not (0 <= desplazamiento < len(self._buffer)):
+                self._recargar()
+                desplazamiento = 0
+            datos = self._buffer[desplazamiento:desplazamiento + len(destino) - leidos]
+            destino[leidos:leidos + len(datos)] = datos
+            leidos += len(datos)
+            self._pos += len(datos)
+        return leidos
+
+
+class LectorConHash(io.RawIOBase):
+    """
+    Envoltorio de solo lectura que calcula el SHA-256 de lo que se lee a través de él.
+
+    Attributes:
+        leidos (int): Bytes leídos hasta ahora.
+    """
+
+    def __init__(self, flujo: IO[bytes]) -> None:
+        super().__init__()
+        self._flujo = flujo
+        self._hash = hashlib.sha256()
+        self.leidos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, tamanho: int = -1) -> bytes:
+        datos = self._flujo.read(tamanho)
+        self._hash.update(datos)
+        self.leidos += len(datos)
+        return datos
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def formato_remoto(lector: IO[bytes], archivo: str) -> Optional[str]:
+    """
+    Reconoce el formato de un comprimido remoto por sus primeros bytes (ver descompresion.detectar_formato)
+    y deja el lector al principio.
+    """
+    cabecera = lector.read(8)
+    lector.seek(0)
+    return detectar_formato(Path(archivo), cabecera)
+
+
+def miembros_pdf_remotos(remoto: IO[bytes], formato: str) -> Iterator[Tuple[str, Callable[[], IO[bytes]], int]]:
+    """
+    Recorre los PDF de un comprimido remoto sin descargarlo, entregando cada miembro como flujo.
+
+    Solo se entregan los PDF del primer nivel del comprimido que cumplen FILTRO_MIEMBROS, que son los
+    mismos que subir_carpeta_a_sftp sube tras una descompresión normal.
+
+    Args:
+        remoto (IO[bytes]): Archivo remoto abierto (normalmente un ArchivoRemotoConVentana).
+        formato (str): Formato del comprimido según formato_remoto.
+
+    Yields:
+        Tuple[str, Callable[[], IO[bytes]], int]: Nombre del PDF, función que abre un flujo con su
+        contenido y tamaño descomprimido. En los tar.gz el miembro solo se puede abrir una vez.
+    """
+    if formato == "zip":
+        with zipfile.ZipFile(remoto) as zip_ref:
+            for info in zip_ref.infolist():
+                if not info.is_dir() and '/' not in info.filename and info.filename.endswith('.pdf') and FILTRO_MIEMBROS(info.filename):
+                    yield info.filename, lambda info=info: zip_ref.open(info), info.file_size
+    elif formato == "tar.gz":
+        # Modo flujo: el tar se recorre una sola vez y los miembros que no se leen se saltan
+        with tarfile.open(fileobj=remoto, mode='r|gz') as tar_ref:
+            for info in tar_ref:
+                if info.isfile() and '/' not in info.name and info.name.endswith('.pdf') and FILTRO_MIEMBROS(info.name):
+                    yield info.name, lambda info=info: tar_ref.extractfile(info), info.size
+    else:
+        raise ValueError(f"Formato no soportado en modo streaming: {formato}")
+
+
+def _sha256_miembro(abrir: Callable[[], IO[bytes]]) -> str:
+    with abrir() as miembro:
+        lector = LectorConHash(miembro)
+        for _ in iter(lambda: lector.read(TAMANHO_COPIA), b""):
+            pass
+    return lector.hexdigest()
+
+
+def subir_miembros_a_sftp(sftp: paramiko.SFTPClient, miembros: Iterator[Tuple[str, Callable[[], IO[bytes]], int]],
+                          remote_directory_path: str, existentes: Dict[str, int],
+                          progreso: Optional[Progreso] = None, hashes: Optional[Dict[str, dict]] = None,
+                          modo: Optional[str] = None, facturas: Optional[Dict[str, dict]] = None) -> Tuple[int, int, int]:
+    """
+    Escribe cada miembro directamente en un archivo remoto, sin pasar por el disco local.
+
+    El SHA-256 de cada PDF subido se calcula mientras se copia y se anota en 'hashes'. Con
+    SUBIDA_VERIFICACION=hash un PDF que ya está en el servidor con el mismo tamaño solo se omite si su
+    hash coincide con el del manifiesto remoto (para eso se lee el miembro, sin subirlo); si no figura
+    en el manifiesto o es distinto se sube de nuevo, igual que en el camino normal (ver
+    subidas.VerificacionSubida).
+
+    Args:
+        sftp (paramiko.SFTPClient): Cliente SFTP donde se escriben los PDF.
+        miembros (Iterator[Tuple[str, Callable[[], IO[bytes]], int]]): Miembros entregados por miembros_pdf_remotos.
+        remote_directory_path (str): Directorio remoto de destino (ya creado).
+        existentes (Dict[str, int]): Tamaño de los archivos que ya hay en el directorio remoto.
+        progreso (Optional[Progreso]): Donde se suman los bytes y archivos subidos.
+        hashes (Optional[Dict[str, dict]]): Manifiesto de hashes de la carpeta remota; se actualiza con
+            el tamaño y el sha256 de los PDF subidos o comprobados.
+        modo (Optional[str]): Modo de verificación, 'tamanho' o 'hash'. Por defecto SUBIDA_VERIFICACION.
+        facturas (Optional[Dict[str, dict]]): Donde se anota el tamaño y el sha256 (None si no se calculó)
+            de cada PDF que quedó en el servidor, para el catálogo.
+
+    Returns:
+        Tuple[int, int, int]: Cantidad de verificados, cantidad de subidos y bytes subidos.
+    """
+    modo = modo_verificacion(modo)
+    hashes = {} if hashes is None else hashes
+    verificados = subidos = bytes_subidos = 0
+    for nombre, abrir, tamanho in miembros:
+        verificados += 1
+        sha256 = None
+        subir = existentes.get(nombre) != tamanho
+        if not subir and modo == "hash":
+            subir = True
+            if hashes.get(nombre, {}).get("tamanho") == tamanho:
+                sha256 = _sha256_miembro(abrir)
+                subir = hashes[nombre].get("sha256") != sha256
+                if subir:
+                    _logger.info(f"{nombre} tiene el mismo tamaño en el sftp pero no el mismo hash en su manifiesto, se sube de nuevo")
+        if subir:
+            inicio = time.monotonic()
+            with abrir() as miembro, sftp.open(f"{remote_directory_path}/{nombre}", 'wb') as destino:
+                flujo = LectorConHash(miembro)
+                destino.set_pipelined(True)
+                if LIMITE_ANCHO_BANDA.activo:
+                    for bloque in iter(lambda: flujo.read(TAMANHO_COPIA), b""):
+                        LIMITE_ANCHO_BANDA.consumir(len(bloque))
+                        destino.write(bloque)
+                else:
+                    shutil.copyfileobj(flujo, destino, TAMANHO_COPIA)
+            sha256 = flujo.hexdigest()
+            existentes[nombre] = tamanho
+            hashes[nombre] = {"tamanho": tamanho, "sha256": sha256}
+            registrar_archivo("streaming", tamanho, time.monotonic() - inicio)
+            subidos += 1
+            bytes_subidos += tamanho
+            if progreso:
+                progreso.sumar(bytes_transferidos=tamanho, archivos=1)
+        # Un PDF repetido en otro comprimido del periodo no pierde el hash que ya se le calculó
+        if facturas is not None and (sha256 is not None or facturas.get(nombre, {}).get("tamanho") != tamanho):
+            facturas[nombre] = {"tamanho": tamanho, "sha256": sha256}
+    return verificados, subidos, bytes_subidos
+
+
+def procesar_archivos_streaming(pool: PoolSFTP, archivos: List[str], ventana: Optional[int] = None,
+                                progreso: Optional[Progreso] = None, catalogo: Optional[CatalogoFacturas] = None) -> List[str]:
+    """
+    Descomprime los comprimidos directamente desde el servidor SFTP y sube sus PDF a la carpeta
+    remota 'YYYYMM' correspondiente, sin escribir ni el comprimido ni los PDF en el disco local.
+
+    Es la alternativa en flujo a descargar_archivos_sftp + descomprimir_archivos + subir_carpeta_a_sftp.
+    El formato se reconoce por los primeros bytes del comprimido, como en la descompresión normal.
+    Los .rar no se pueden leer en flujo (rarfile necesita el archivo local), así que se devuelven
+    para que sigan el camino normal, igual que los tar.gz con un PDF que hay que volver a leer.
+    Con SUBIDA_VERIFICACION=hash el manifiesto de hashes de cada carpeta remota se actualiza con los
+    PDF subidos. Con catálogo, los PDF quedan anotados sin ruta local.
+
+    Args:
+        pool (PoolSFTP): Pool de conexiones SFTP.
+        archivos (List[str]): Nombres de los comprimidos remotos a procesar.
+        ventana (Optional[int]): Bytes leídos por adelantado de cada comprimido. Por defecto STREAMING_VENTANA_MB.
+        progreso (Optional[Progreso]): Donde se suman los bytes y archivos subidos.
+        catalogo (Optional[CatalogoFacturas]): Catálogo donde se anotan los PDF (ver catalogo.py).
+
+    Returns:
+        List[str]: Comprimidos que no se pudieron procesar en flujo y deben seguir el camino normal.
+    """
+    ventana = ventana or VENTANA_LECTURA
+    modo = modo_verificacion()
+    no_procesados = []
+    with pool.sesion() as sftp_lectura, pool.sesion() as sftp_escritura:
+        home_directory = sftp_escritura.normalize(".")
+        indices: Dict[str, Dict[str, int]] = {}
+        manifiestos: Dict[str, Tuple[Dict[str, dict], Dict[str, dict]]] = {}
+        # PDF que quedaron en cada carpeta remota, para el catálogo
+        facturas: Dict[str, Dict[str, dict]] = {}
+        for archivo in archivos:
+            remote_directory_path = f"{home_directory.rstrip('/')}/{archivo[:6]}"
+            inicio = time.monotonic()
+            try:
+                with sftp_lectura.open(archivo, 'rb') as remoto:
+                    lector = ArchivoRemotoConVentana(remoto, remoto.stat().st_size, ventana)
+                    formato = formato_remoto(lector, archivo)
+                    if formato not in FORMATOS_STREAMING:
+                        _logger.warning(f"El archivo {archivo} no se puede procesar en modo streaming, se procesara de forma normal")
+                        no_procesados.append(archivo)
+                        continue
+                    if remote_directory_path not in indices:
+                        indices[remote_directory_path] = indice_remoto(sftp_escritura, remote_directory_path)
+                        remotas = (leer_manifiesto_remoto(sftp_escritura, remote_directory_path)
+                                   if NOMBRE_MANIFIESTO in indices[remote_directory_path] else {})
+                        manifiestos[remote_directory_path] = (remotas, dict(remotas))
+                    _logger.info(f"Procesando en modo streaming: {archivo}")
+                    verificados, subidos, bytes_subidos = subir_miembros_a_sftp(
+                        sftp_escritura, miembros_pdf_remotos(lector, formato), remote_directory_path,
+                        indices[remote_directory_path], progreso, manifiestos[remote_directory_path][1], modo,
+                        facturas.setdefault(remote_directory_path, {}))
+                duracion = time.monotonic() - inicio
+                _logger.info(f"{archivo}: {verificados} PDF verificados, {subidos} subidos "
+                             f"({bytes_subidos / 1024 / 1024:.1f} MB en {duracion:.1f} s)")
+            except tarfile.StreamError as e:
+                _logger.warning(f"{archivo}: un PDF distinto en el sftp no se puede volver a leer en flujo ({e}), "
+                                f"se procesara de forma normal")
+                no_procesados.append(archivo)
+            except Exception as e:
+                registrar_error("streaming")
+                _logger.error(f"Error procesando en modo streaming el archivo {archivo}: {e}")
+                no_procesados.append(archivo)
+
+        if modo == "hash":
+            for remote_directory_path, (remotas, entradas) in manifiestos.items():
+                entradas = {nombre: entrada for nombre, entrada in entradas.items()
+                            if nombre in indices[remote_directory_path]}
+                if entradas != remotas:
+                    try:
+                        escribir_manifiesto_remoto(sftp_escritura, remote_directory_path, entradas)
+                    except IOError as e:
+                        _logger.error(f"No se pudo escribir el manifiesto de hashes en {remote_directory_path}: {e}")
+    if catalogo is not None:
+        for remote_directory_path, entradas in facturas.items():
+            if entradas:
+                catalogo.registrar_remotos(posixpath.basename(remote_directory_path), entradas, remote_directory_path)
+    return no_procesados
@@ -0,0 +1,428 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+import paramiko
+from dotenv import load_dotenv
+from pool_sftp import PoolSFTP, LIMITE_ANCHO_BANDA
+from trabajos import Progreso
+from metricas import registrar_archivo, registrar_error, propagar_contexto
+from descargas import calcular_sha256
+from log_configuration import por_archivo
+
+load_dotenv()
+
+_logger = logging.getLogger(__name__)
+
+# Configuración del motor de subidas (se puede ajustar desde el archivo .env)
+CONCURRENCIA_SUBIDA = int(os.getenv("SUBIDA_CONCURRENCIA", "4"))
+# Cómo se decide si un PDF ya está en el servidor: 'tamanho' (solo el tamaño del listado) o 'hash'
+# (manifiesto de SHA-256 de la carpeta, ver VerificacionSubida)
+MODO_VERIFICACION = os.getenv("SUBIDA_VERIFICACION", "tamanho").lower()
+# PDF que se comprueban al azar con la extensión check-file del servidor, si la tiene (0 para no comprobar)
+MUESTRA_CHECK_FILE = int(os.getenv("SUBIDA_MUESTRA_CHECK_FILE", "5"))
+
+MODOS_VERIFICACION = ("tamanho", "hash")
+
+
+def modo_verificacion(modo: Optional[str] = None) -> str:
+    """
+    Devuelve el modo de verificación de las subidas (por defecto SUBIDA_VERIFICACION) comprobando que
+    es válido. Lo usan la subida desde disco y la de streaming, para que un error de escritura en el
+    .env no las haga verificar distinto.
+
+    Raises:
+        ValueError: Si el modo no es uno de MODOS_VERIFICACION.
+    """
+    modo = (modo or MODO_VERIFICACION).lower()
+    if modo not in MODOS_VERIFICACION:
+        raise ValueError(f"Modo de verificación desconocido: {modo}. Debe ser uno de {', '.join(MODOS_VERIFICACION)}")
+    return modo
+
+# Manifiesto de hashes, en la carpeta local y en la remota (empieza por punto: no se sube con los PDF)
+NOMBRE_MANIFIESTO = ".manifiesto_subida.json"
+# Algoritmos de check-file en orden de preferencia. Se piden de uno en uno: paramiko descarta el nombre
+# del algoritmo que eligió el servidor, así que solo así se sabe con qué hash comparar
+ALGORITMOS_CHECK_FILE = ("sha256", "sha1", "md5")
+# check-file devuelve un hash por bloque, como rsync. Con bloques de 64 KB cada bloque se lee de una
+# sola vez en el servidor (algunas implementaciones calculan mal los bloques mayores)
+BLOQUE_CHECK_FILE = 64 * 1024
+
+
+def indice_remoto(sftp: paramiko.SFTPClient, remote_directory_path: str, crear: bool = True) -> Dict[str, int]:
+    """
+    Lista una sola vez el directorio remoto y devuelve el tamaño de cada archivo por nombre.
+
+    Args:
+        sftp (paramiko.SFTPClient): Cliente SFTP.
+        remote_directory_path (str): Directorio remoto a listar.
+        crear (bool): Si es True y el directorio no existe, se crea y se devuelve un índice vacío.
+
+    Returns:
+        Dict[str, int]: Tamaño en bytes de cada archivo del directorio, por nombre.
+    """
+    try:
+        return {atributos.filename: atributos.st_size for atributos in sftp.listdir_attr(remote_directory_path)}
+    except FileNotFoundError:
+        if not crear:
+            raise
+        _logger.info(f"Directorio remoto {remote_directory_path} no existe. Intentando crearlo...")
+        sftp.mkdir(remote_directory_path)
+        _logger.info(f"Directorio remoto creado exitosamente: {remote_directory_path}")
+        return {}
+
+
+def calcular_pendientes(archivos_locales: List[Path], indice: Dict[str, int]) -> List[Path]:
+    """
+    Compara los archivos locales con el índice remoto y devuelve los que faltan o cambiaron de tamaño.
+
+    Args:
+        archivos_locales (List[Path]): Archivos locales candidatos a subir.
+        indice (Dict[str, int]): Índice remoto devuelto por indice_remoto.
+
+    Returns:
+        List[Path]: Archivos que hay que subir.
+    """
+    return [archivo for archivo in archivos_locales if indice.get(archivo.name) != archivo.stat().st_size]
+
+
+class ManifiestoHashes:
+    """
+    Hash SHA-256 de cada PDF de una carpeta local, guardado como JSON en la propia carpeta.
+
+    El hash de un PDF solo se recalcula si cambió su tamaño o su fecha de modificación, así que
+    verificar de nuevo una carpeta ya subida no vuelve a leer los PDF.
+
+    Attributes:
+        ruta (Path): Ruta del archivo JSON.
+        entradas (Dict[str, dict]): Tamaño, mtime_ns y sha256 de cada PDF, por nombre.
+    """
+
+    def __init__(self, carpeta: Path) -> None:
+        self.ruta = Path(carpeta) / NOMBRE_MANIFIESTO
+        try:
+            self.entradas: Dict[str, dict] = json.loads(self.ruta.read_text())
+        except FileNotFoundError:
+            self.entradas = {}
+        except ValueError as e:
+            _logger.warning(f"Manifiesto de hashes ilegible, se recalcula: {e}")
+            self.entradas = {}
+
+    def actualizar(self, archivos: List[Path]) -> Dict[str, dict]:
+        """
+        Calcula el hash de los PDF nuevos o cambiados (varios a la vez) y devuelve las entradas de todos.
+
+        Args:
+            archivos (List[Path]): PDF de la carpeta.
+
+        Returns:
+            Dict[str, dict]: Tamaño y sha256 de cada PDF, por nombre.
+        """
+        estados = {archivo.name: archivo.stat() for archivo in archivos}
+        cambiados = [archivo for archivo in archivos
+                     if (self.entradas.get(archivo.name, {}).get("tamanho"), self.entradas.get(archivo.name, {}).get("mtime_ns"))
+                     != (estados[archivo.name].st_size, estados[archivo.name].st_mtime_ns)]
+        if cambiados:
+            inicio = time.monotonic()
+            with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1), thread_name_prefix="hash") as executor:
+                for archivo, sha256 in zip(cambiados, executor.map(calcular_sha256, cambiados)):
+                    self.entradas[archivo.name] = {"tamanho": estados[archivo.name].st_size,
+                                                   "mtime_ns": estados[archivo.name].st_mtime_ns, "sha256": sha256}
+            _logger.info(f"Hash calculado para {len(cambiados)} PDF en {time.monotonic() - inicio:.1f} s")
+        self.entradas = {nombre: entrada for nombre, entrada in self.entradas.items() if nombre in estados}
+        return {nombre: {"tamanho": entrada["tamanho"], "sha256": entrada["sha256"]} for nombre, entrada in self.entradas.items()}
+
+    def guardar(self) -> None:
+        temporal = self.ruta.with_suffix(".tmp")
+        temporal.write_text(json.dumps(self.entradas, indent=1))
+        temporal.replace(self.ruta)
+
+
+def leer_manifiesto_remoto(sftp: paramiko.SFTPClient, remote_directory_path: str) -> Dict[str, dict]:
+    """
+    Descarga en una sola lectura el manifiesto de hashes de una carpeta remota.
+
+    Returns:
+        Dict[str, dict]: Tamaño y sha256 de cada PDF según el manifiesto, o vacío si no hay manifiesto.
+    """
+    try:
+        with sftp.open(f"{remote_directory_path}/{NOMBRE_MANIFIESTO}", "rb") as remoto:
+            return json.loads(remoto.read())
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        _logger.warning(f"Manifiesto remoto ilegible en {remote_directory_path}, se ignora: {e}")
+        return {}
+
+
+def escribir_manifiesto_remoto(sftp: paramiko.SFTPClient, remote_directory_path: str, entradas: Dict[str, dict]) -> None:
+    """
+    Escribe el manifiesto de hashes en la carpeta remota: primero en un temporal y luego se renombra,
+    para que nunca quede a medias.
+    """
+    destino = f"{remote_directory_path}/{NOMBRE_MANIFIESTO}"
+    temporal = destino + ".tmp"
+    with sftp.open(temporal, "wb") as remoto:
+        remoto.write(json.dumps(entradas, sort_keys=True).encode())
+    try:
+        sftp.posix_rename(temporal, destino)
+    except IOError:
+        # Servidor sin la extensión posix-rename: rename de SFTP no sobrescribe
+        try:
+            sftp.remove(destino)
+        except FileNotFoundError:
+            pass
+        sftp.rename(temporal, destino)
+
+
+def _hashes_por_bloque(archivo: Path, algoritmo: str) -> bytes:
+    """
+    Calcula localmente lo que devolvería check-file: el hash de cada bloque de BLOQUE_CHECK_FILE, concatenados.
+    """
+    salida = b""
+    with open(archivo, "rb") as f:
+        for bloque in iter(lambda: f.read(BLOQUE_CHECK_FILE), b""):
+            salida += hashlib.new(algoritmo, bloque).digest()
+    return salida
+
+
+def comprobar_check_file(sftp: paramiko.SFTPClient, remote_directory_path: str, archivos: List[Path]) -> Optional[List[Path]]:
+    """
+    Compara el contenido de unos PDF locales con los remotos usando la extensión check-file de SFTP:
+    el servidor calcula los hashes y solo viajan unos bytes por archivo.
+
+    Los algoritmos de ALGORITMOS_CHECK_FILE se piden de uno en uno y el que el servidor rechace no se
+    vuelve a pedir. Los PDF vacíos no tienen bloques que comparar y solo se comprueba su tamaño.
+
+    Args:
+        sftp (paramiko.SFTPClient): Cliente SFTP.
+        remote_directory_path (str): Carpeta remota.
+        archivos (List[Path]): PDF locales a comprobar.
+
+    Returns:
+        Optional[List[Path]]: PDF cuyo contenido en el servidor es distinto, o None si el servidor no
+        tiene la extensión o no admite ninguno de los algoritmos.
+    """
+    algoritmos = list(ALGORITMOS_CHECK_FILE)
+    distintos = []
+    for archivo in archivos:
+        ruta_remota = f"{remote_directory_path}/{archivo.name}"
+        try:
+            if archivo.stat().st_size == 0:
+                if sftp.stat(ruta_remota).st_size != 0:
+                    distintos.append(archivo)
+                continue
+            remotos = None
+            with sftp.open(ruta_remota, "rb") as remoto:
+                while algoritmos and remotos is None:
+                    try:
+                        remotos = remoto.check(algoritmos[0], block_size=BLOQUE_CHECK_FILE)
+                    except IOError as e:
+                        _logger.info(f"check-file con {algoritmos[0]} no disponible ({e})")
+                        algoritmos.pop(0)
+        except FileNotFoundError:
+            distintos.append(archivo)
+            continue
+        if remotos is None:
+            _logger.info("El servidor no admite check-file con ningun algoritmo conocido, no se comprueban hashes remotos")
+            return None
+        if _hashes_por_bloque(archivo, algoritmos[0]) != remotos:
+            distintos.append(archivo)
+    return distintos
+
+
+class VerificacionSubida:
+    """
+    Decide qué PDF de una carpeta hay que subir y deja constancia de lo que quedó en el servidor.
+
+    - tamanho: un PDF está subido si el listado remoto lo muestra con el mismo tamaño.
+    - hash: además, su SHA-256 debe coincidir con el del manifiesto de la carpeta remota. El manifiesto
+      local (ManifiestoHashes) evita releer los PDF y el remoto se descarga de una sola vez, así que la
+      comparación cuesta lo mismo que el listado. Si el servidor tiene la extensión check-file, una
+      muestra de los PDF que parecen subidos se comprueba además contra los hashes que calcula el
+      propio servidor. Los PDF que ya estaban en el servidor pero no figuran en el manifiesto (por
+      ejemplo, subidos antes de activar este modo) se vuelven a subir una vez.
+
+    Attributes:
+        carpeta (Path): Carpeta local con los PDF.
+        remote_directory_path (str): Carpeta remota.
+        modo (str): Modo de verificación.
+    """
+
+    def __init__(self, carpeta: Path, remote_directory_path: str, modo: Optional[str] = None,
+                 muestra: Optional[int] = None) -> None:
+        self.carpeta = Path(carpeta)
+        self.remote_directory_path = remote_directory_path
+        self.modo = modo_verificacion(modo)
+        self.muestra = MUESTRA_CHECK_FILE if muestra is None else muestra
+        self._locales: Dict[str, dict] = {}
+        self._remotas: Dict[str, dict] = {}
+        self._pendientes: set = set()
+
+    def pendientes(self, sftp: paramiko.SFTPClient, archivos: List[Path], indice: Dict[str, int]) -> List[Path]:
+        """
+        Devuelve los PDF que faltan en el servidor o cuyo contenido es distinto.
+
+        Args:
+            sftp (paramiko.SFTPClient): Cliente SFTP.
+            archivos (List[Path]): PDF locales de la carpeta.
+            indice (Dict[str, int]): Listado de la carpeta remota (ver indice_remoto).
+
+        Returns:
+            List[Path]: PDF que hay que subir.
+        """
+        pendientes = calcular_pendientes(archivos, indice)
+        if self.modo == "tamanho":
+            return pendientes
+
+        manifiesto = ManifiestoHashes(self.carpeta)
+        self._locales = manifiesto.actualizar(archivos)
+        manifiesto.guardar()
+        self._remotas = leer_manifiesto_remoto(sftp, self.remote_directory_path) if NOMBRE_MANIFIESTO in indice else {}
+        por_subir = set(pendientes)
+        sin_hash = [archivo for archivo in archivos if archivo not in por_subir
+                    and self._remotas.get(archivo.name, {}).get("sha256") != self._locales[archivo.name]["sha256"]]
+        if sin_hash:
+            _logger.info(f"{len(sin_hash)} PDF tienen el mismo tamaño en el sftp pero no el mismo hash en su manifiesto, se suben de nuevo")
+        pendientes += sin_hash
+
+        por_subir = set(pendientes)
+        iguales = [archivo for archivo in archivos if archivo not in por_subir]
+        if self.muestra and iguales:
+            muestra = random.sample(iguales, min(self.muestra, len(iguales)))
+            distintos = comprobar_check_file(sftp, self.remote_directory_path, muestra)
+            if distintos:
+                _logger.warning(f"check-file: {len(distintos)} de {len(muestra)} PDF comprobados son distintos en el sftp "
+                                f"pese al manifiesto, se suben de nuevo: {[archivo.name for archivo in distintos]}")
+                pendientes += distintos
+            elif distintos is not None:
+                _logger.info(f"check-file: los {len(muestra)} PDF comprobados coinciden con el sftp")
+        self._pendientes = {archivo.name for archivo in pendientes}
+        return pendientes
+
+    def registrar(self, sftp: paramiko.SFTPClient, en_servidor: List[Path], indice: Dict[str, int]) -> None:
+        """
+        Actualiza el manifiesto remoto con los hashes de los PDF que quedaron en el servidor.
+
+        Args:
+            sftp (paramiko.SFTPClient): Cliente SFTP.
+            en_servidor (List[Path]): PDF de la carpeta que quedaron en el servidor.
+            indice (Dict[str, int]): Listado de la carpeta remota antes de subir.
+        """
+        if self.modo == "tamanho":
+            return
+        # Se conservan las entradas de los PDF remotos que no se intentaron subir (una subida fallida
+        # pudo dejar el remoto a medias)
+        entradas = {nombre: entrada for nombre, entrada in self._remotas.items()
+                    if nombre in indice and nombre not in self._pendientes}
+        entradas.update({archivo.name: self._locales[archivo.name] for archivo in en_servidor})
+        if entradas != self._remotas:
+            escribir_manifiesto_remoto(sftp, self.remote_directory_path, entradas)
+
+
+def subir_archivos_paralelo(pool: PoolSFTP, archivos: List[Path], remote_directory_path: str,
+                            concurrencia: Optional[int] = None, progreso: Optional[Progreso] = None) -> List[Path]:
+    """
+    Sube una lista de archivos a un directorio remoto usando varios canales del pool a la vez.
+
+    Cada trabajador toma un canal una sola vez y lo reutiliza para todos los archivos que le tocan.
+    Las escrituras se envían en modo pipelined (sin esperar confirmación por cada bloque) y no se
+    hace el stat de confirmación que hace sftp.put por defecto.
+
+    Args:
+        pool (PoolSFTP): Pool de conexiones SFTP.
+        archivos (List[Path]): Archivos locales a subir.
+        remote_directory_path (str): Directorio remoto de destino (ya creado).
+        concurrencia (Optional[int]): Cantidad de canales subiendo a la vez. Por defecto SUBIDA_CONCURRENCIA.
+        progreso (Optional[Progreso]): Donde se suman los bytes y archivos subidos.
+
+    Returns:
+        List[Path]: Archivos subidos satisfactoriamente. Si ningún trabajador consigue canal, lista vacía
+            con los errores registrados en el log y en las métricas.
+    """
+    concurrencia = max(1, min(concurrencia or CONCURRENCIA_SUBIDA, len(archivos)))
+    if not archivos:
+        return []
+
+    cola: "queue.Queue[Path]" = queue.Queue()
+    for archivo in archivos:
+        cola.put(archivo)
+    subidos: List[Path] = []
+    lock = threading.Lock()
+
+    def trabajador() -> None:
+        try:
+            with pool.sesion() as sftp:
+                while True:
+                    try:
+                        archivo = cola.get_nowait()
+                    except queue.Empty:
+                        return
+                    if subir_archivo(sftp, archivo, remote_directory_path, progreso):
+                        with lock:
+                            subidos.append(archivo)
+        except Exception as e:
+            # Sin canal (conexión caída o SFTP_CONEXIONES_MAX agotado) los archivos siguen en la cola para los demás
+            registrar_error("subida")
+            _logger.error(f"No se pudo abrir un canal de subida: {e}")
+
+    inicio = time.monotonic()
+    hilos = [threading.Thread(target=propagar_contexto(trabajador), name=f"subida-{i}") for i in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    registrar_resumen(subidos, len(archivos), time.monotonic() - inicio, concurrencia)
+    return subidos
+
+
+def subir_archivo(sftp: paramiko.SFTPClient, archivo: Path, remote_directory_path: str,
+                  progreso: Optional[Progreso] = None) -> bool:
+    """
+    Sube un archivo con escritura pipelined y sin stat de confirmación.
+
+    Args:
+        sftp (paramiko.SFTPClient): Cliente SFTP.
+        archivo (Path): Archivo local a subir.
+        remote_directory_path (str): Directorio remoto de destino.
+        progreso (Optional[Progreso]): Donde se suman los bytes y archivos subidos.
+
+    Returns:
+        bool: True si se subió, False si hubo un error (que queda registrado en el log).
+    """
+    remote_file_path = f"{remote_directory_path}/{archivo.name}"
+    inicio = time.monotonic()
+    try:
+        # El callback de put llega tras cada escritura: con límite de ancho de banda frena las siguientes
+        enviados = [0]
+
+        def limitar(transferidos: int, _total: int) -> None:
+            LIMITE_ANCHO_BANDA.consumir(transferidos - enviados[0])
+            enviados[0] = transferidos
+
+        sftp.put(str(archivo), remote_file_path, callback=limitar if LIMITE_ANCHO_BANDA.activo else None, confirm=False)
+    except Exception as e:
+        registrar_error("subida")
+        _logger.error(f"Error subiendo el archivo {archivo}: {e}")
+        return False
+    tamanho = archivo.stat().st_size
+    registrar_archivo("subida", tamanho, time.monotonic() - inicio)
+    if progreso:
+        progreso.sumar(bytes_transferidos=tamanho, archivos=1)
+    _logger.debug("Archivo %s subido a %s", archivo, remote_file_path, extra=por_archivo("subida"))
+    return True
+
+
+def registrar_resumen(subidos: List[Path], total: int, duracion: float, canales: int) -> None:
+    duracion = max(duracion, 1e-6)
+    megas = sum(archivo.stat().st_size for archivo in subidos) / 1024 / 1024
+    _logger.info(f"Subida terminada: {len(subidos)}/{total} archivos, {megas:.1f} MB en {duracion:.1f} s "
+                 f"({len(subidos) / duracion:.1f} archivos/s, {megas / duracion:.2f} MB/s) con {canales} canales")
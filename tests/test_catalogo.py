@@ -0,0 +1,70 @@
+import pytest
+from catalogo import CatalogoFacturas, identificadores
+
+
+@pytest.fixture
+def catalogo(tmp_path):
+    catalogo = CatalogoFacturas(tmp_path / "catalogo.sqlite3")
+    yield catalogo
+    catalogo.cerrar()
+
+
+def _carpeta(tmp_path, periodo, nombres):
+    carpeta = tmp_path / periodo
+    carpeta.mkdir()
+    for nombre in nombres:
+        (carpeta / nombre).write_bytes(b"%PDF " + nombre.encode())
+    return carpeta
+
+
+@pytest.mark.parametrize("nombre, esperado", [
+    ("53512345.pdf", ("53512345", None)),
+    ("5353512345.pdf", ("53512345", None)),
+    ("factura_52345678.pdf", ("52345678", None)),
+    ("123456_5352345678.pdf", ("52345678", "123456")),
+    ("123456_52345678_resumen.pdf", ("52345678", "123456")),
+    ("512345678.pdf", (None, None)),
+    ("resumen.pdf", (None, None)),
+])
+def test_identificadores(nombre, esperado):
+    assert identificadores(nombre) == esperado
+
+
+def test_buscar_por_periodo_telefono_y_cuenta(tmp_path, catalogo):
+    catalogo.registrar_carpeta("202401", _carpeta(tmp_path, "202401", ["1_53512345.pdf", "2_52345678.pdf"]), [])
+    catalogo.registrar_carpeta("202402", _carpeta(tmp_path, "202402", ["1_53512345.pdf"]), [])
+
+    assert [f.periodo for f in catalogo.buscar(telefono="53512345")] == ["202402", "202401"]
+    # El prefijo 53 se quita antes de buscar
+    assert len(catalogo.buscar(telefono="5353512345")) == 2
+    assert [f.archivo for f in catalogo.buscar(periodo="202401", cuenta="2")] == ["2_52345678.pdf"]
+    assert [f.archivo for f in catalogo.buscar(periodo="202401")] == ["1_53512345.pdf", "2_52345678.pdf"]
+    assert len(catalogo.buscar(limite=1)) == 1
+    assert catalogo.buscar(cuenta="3") == []
+
+
+def test_al_extraer_se_cataloga_sin_ruta_remota_y_la_subida_la_completa(tmp_path, catalogo):
+    carpeta = _carpeta(tmp_path, "202401", ["53512345.pdf"])
+    catalogo.registrar_carpeta("202401", carpeta, [])
+    factura, = catalogo.buscar(periodo="202401")
+    assert factura.ruta_remota is None and factura.sha256
+    assert catalogo.ruta_local("202401", "53512345.pdf") == (carpeta / "53512345.pdf").resolve()
+
+    catalogo.registrar_carpeta("202401", carpeta, [carpeta / "53512345.pdf"], "/home/u/202401")
+    assert catalogo.buscar(periodo="202401")[0].ruta_remota == "/home/u/202401/53512345.pdf"
+    # Extraer de nuevo no borra la ruta remota
+    catalogo.registrar_carpeta("202401", carpeta, [])
+    assert catalogo.buscar(periodo="202401")[0].ruta_remota == "/home/u/202401/53512345.pdf"
+
+
+def test_los_pdf_en_streaming_se_catalogan_sin_ruta_local(catalogo):
+    catalogo.registrar_remotos("202401", {"53512345.pdf": {"tamanho": 10, "sha256": "ab"}}, "/home/u/202401")
+    factura, = catalogo.buscar(telefono="53512345")
+    assert factura.ruta_remota == "/home/u/202401/53512345.pdf"
+    assert catalogo.ruta_local("202401", "53512345.pdf") is None
+
+    # Sin hash (ya estaba en el servidor con el mismo tamaño) se conserva el anterior
+    catalogo.registrar_remotos("202401", {"53512345.pdf": {"tamanho": 10, "sha256": None}}, "/home/u/202401")
+    assert catalogo.buscar(telefono="53512345")[0].sha256 == "ab"
+    catalogo.registrar_remotos("202401", {"53512345.pdf": {"tamanho": 11, "sha256": None}}, "/home/u/202401")
+    assert catalogo.buscar(telefono="53512345")[0].sha256 is None
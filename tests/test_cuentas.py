@@ -0,0 +1,20 @@
+import json
+import pytest
+from cuentas import cargar_cuentas
+
+
+def _cuentas(tmp_path, *directorios):
+    ruta = tmp_path / "cuentas.json"
+    ruta.write_text(json.dumps([{"nombre": f"c{i}", "host": "h", "username": "u", "password": "p", "directorio_remoto": directorio}
+                                for i, directorio in enumerate(directorios)]))
+    return ruta
+
+
+def test_cuentas_del_mismo_usuario_con_directorios_distintos(tmp_path):
+    cuentas = cargar_cuentas(_cuentas(tmp_path, "/a", "/b", "."))
+    assert [cuenta.directorio_remoto for cuenta in cuentas] == ["/a", "/b", "."]
+
+
+def test_no_se_repite_servidor_usuario_y_directorio(tmp_path):
+    with pytest.raises(ValueError, match="c1"):
+        cargar_cuentas(_cuentas(tmp_path, "/a", "/a"))
@@ -0,0 +1,94 @@
+import json
+import threading
+import descargas
+from descargas import ManifiestoDescargas, SUFIJO_PARCIAL, _planificar_archivo, calcular_sha256, planificar_bloques
+
+
+def test_planificar_bloques():
+    assert planificar_bloques(0, 4) == [(0, 0)]
+    assert planificar_bloques(10, 4) == [(0, 4), (4, 4), (8, 2)]
+
+
+def test_descarga_nueva_reserva_parte_y_planifica_todo(tmp_path):
+    manifiesto = ManifiestoDescargas(tmp_path)
+    bloques = _planificar_archivo(manifiesto, "a.zip", 10, 100, tmp_path, 4)
+    assert bloques == [(0, 4), (4, 4), (8, 2)]
+    assert (tmp_path / ("a.zip" + SUFIJO_PARCIAL)).stat().st_size == 10
+    assert manifiesto.entrada("a.zip")["completo"] is False
+
+
+def test_retoma_solo_los_bloques_que_faltan(tmp_path):
+    manifiesto = ManifiestoDescargas(tmp_path)
+    _planificar_archivo(manifiesto, "a.zip", 10, 100, tmp_path, 4)
+    manifiesto.marcar_bloque("a.zip", 0)
+    manifiesto.marcar_bloque("a.zip", 8)
+    manifiesto.guardar()
+
+    retomado = ManifiestoDescargas(tmp_path)
+    assert _planificar_archivo(retomado, "a.zip", 10, 100, tmp_path, 4) == [(4, 4)]
+
+
+def test_archivo_cambiado_en_el_servidor_se_descarga_de_nuevo(tmp_path):
+    manifiesto = ManifiestoDescargas(tmp_path)
+    _planificar_archivo(manifiesto, "a.zip", 10, 100, tmp_path, 4)
+    manifiesto.marcar_bloque("a.zip", 0)
+    assert _planificar_archivo(manifiesto, "a.zip", 10, 200, tmp_path, 4) == [(0, 4), (4, 4), (8, 2)]
+
+
+def test_archivo_completo_y_sin_cambios_se_omite(tmp_path):
+    manifiesto = ManifiestoDescargas(tmp_path)
+    _planificar_archivo(manifiesto, "a.zip", 3, 100, tmp_path, 4)
+    (tmp_path / ("a.zip" + SUFIJO_PARCIAL)).write_bytes(b"abc")
+    descargas._finalizar_archivo(manifiesto, "a.zip", tmp_path)
+
+    entrada = manifiesto.entrada("a.zip")
+    assert entrada["completo"] and entrada["sha256"] == calcular_sha256(tmp_path / "a.zip")
+    assert _planificar_archivo(manifiesto, "a.zip", 3, 100, tmp_path, 4) == []
+
+
+def test_archivo_local_alterado_se_descarga_de_nuevo(tmp_path):
+    manifiesto = ManifiestoDescargas(tmp_path)
+    _planificar_archivo(manifiesto, "a.zip", 3, 100, tmp_path, 4)
+    (tmp_path / ("a.zip" + SUFIJO_PARCIAL)).write_bytes(b"abc")
+    descargas._finalizar_archivo(manifiesto, "a.zip", tmp_path)
+    manifiesto.actualizar("a.zip", mtime_local=0)
+    (tmp_path / "a.zip").write_bytes(b"xyz")
+    assert _planificar_archivo(manifiesto, "a.zip", 3, 100, tmp_path, 4) == [(0, 3)]
+
+
+def test_manifiesto_ilegible_se_ignora(tmp_path):
+    (tmp_path / ManifiestoDescargas.NOMBRE).write_text("{no es json")
+    assert ManifiestoDescargas(tmp_path).entradas == {}
+
+
+def test_marcar_bloque_guarda_cada_n_bloques(tmp_path, monkeypatch):
+    monkeypatch.setattr(descargas, "GUARDAR_MANIFIESTO_BLOQUES", 3)
+    monkeypatch.setattr(descargas, "GUARDAR_MANIFIESTO_S", 3600)
+    manifiesto = ManifiestoDescargas(tmp_path)
+    manifiesto.reiniciar("a.zip", 40, 100, 4)
+    manifiesto.guardar()
+    manifiesto.marcar_bloque("a.zip", 0)
+    manifiesto.marcar_bloque("a.zip", 4)
+    assert json.loads(manifiesto.ruta.read_text())["a.zip"]["bloques_completos"] == []
+    manifiesto.marcar_bloque("a.zip", 8)
+    assert json.loads(manifiesto.ruta.read_text())["a.zip"]["bloques_completos"] == [0, 4, 8]
+
+
+def test_marcar_bloque_desde_varios_hilos(tmp_path, monkeypatch):
+    monkeypatch.setattr(descargas, "GUARDAR_MANIFIESTO_BLOQUES", 1)
+    manifiesto = ManifiestoDescargas(tmp_path)
+    for i in range(8):
+        manifiesto.reiniciar(f"{i}.zip", 4 * 200, 100, 4)
+
+    def marcar(i: int) -> None:
+        for offset in range(0, 4 * 200, 4):
+            manifiesto.marcar_bloque(f"{i}.zip", offset)
+
+    hilos = [threading.Thread(target=marcar, args=(i,)) for i in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    manifiesto.guardar()
+    guardado = json.loads(manifiesto.ruta.read_text())
+    assert all(len(guardado[f"{i}.zip"]["bloques_completos"]) == 200 for i in range(8))
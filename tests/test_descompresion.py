@@ -0,0 +1,100 @@
+import zipfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+import descompresion
+from metricas import InformeEjecucion
+from descompresion import descomprimir_en_paralelo, BackendComprimido, FiltroMiembros, IndiceExtraccion, listar_miembros, registrar_backend
+
+
+@pytest.mark.parametrize("nombre, esperado", [
+    ("1.pdf", True),
+    ("facturas/1.pdf", True),
+    ("1.PDF", False),
+    ("resumen.txt", False),
+    ("borradores/1.pdf", False),
+    ("copia_1.pdf", False),
+])
+def test_filtro_por_glob_y_regex(nombre, esperado):
+    filtro = FiltroMiembros.desde_texto(" *.pdf , ", "borradores/*, re:^copia_")
+    assert filtro(nombre) is esperado
+
+
+def test_el_glob_se_compara_con_la_ruta_y_con_el_nombre():
+    filtro = FiltroMiembros(["facturas/*.pdf", "resumen.txt"])
+    assert filtro("facturas/1.pdf")
+    assert not filtro("otras/1.pdf")
+    assert filtro("otras/resumen.txt")
+
+
+def test_listar_miembros_solo_devuelve_los_que_cumplen_el_filtro(tmp_path):
+    comprimido = tmp_path / "202401_a.zip"
+    with zipfile.ZipFile(comprimido, "w") as zf:
+        zf.writestr("1.pdf", b"%PDF 1")
+        zf.writestr("leeme.txt", b"texto")
+        zf.writestr("anexos/", b"")
+        zf.writestr("anexos/2.pdf", b"%PDF 22")
+    assert listar_miembros(comprimido, FiltroMiembros()) == {"1.pdf": 6, "anexos/2.pdf": 7}
+    assert listar_miembros(comprimido, FiltroMiembros(excluir=["anexos/*"])) == {"1.pdf": 6}
+
+
+def test_cambiar_el_filtro_cambia_la_clave_de_extraccion(tmp_path):
+    comprimido = tmp_path / "202401_a.zip"
+    comprimido.write_bytes(b"zip")
+    assert (IndiceExtraccion.clave(comprimido, None, FiltroMiembros())
+            != IndiceExtraccion.clave(comprimido, None, FiltroMiembros(["*.pdf", "*.xml"])))
+
+
+def test_un_motor_a_medio_implementar_falla_al_registrarlo():
+    class SoloLista(BackendComprimido):
+        nombre, formato = "solo_lista", "zip"
+
+        def listar(self, file_path):
+            return {}
+
+    with pytest.raises(TypeError):
+        registrar_backend(SoloLista())
+
+    class SinFormato(SoloLista):
+        formato = ""
+
+        def extraer(self, file_path, output_dir, quiere, buffer):
+            return 0
+
+    with pytest.raises(ValueError):
+        registrar_backend(SinFormato())
+
+
+class EjecutorConCaida:
+    """ProcessPoolExecutor que ejecuta en el mismo proceso y simula la muerte del que extrae 'malo.zip'."""
+
+    def __init__(self, **_) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+    def submit(self, funcion, file_path, *args):
+        tarea = Future()
+        if file_path.name == "malo.zip":
+            tarea.set_exception(BrokenProcessPool("proceso terminado"))
+        else:
+            tarea.set_result(funcion(file_path, *args))
+        return tarea
+
+
+def test_un_proceso_caido_solo_hace_fallar_su_archivo(tmp_path, monkeypatch):
+    for nombre in ("bueno.zip", "malo.zip"):
+        with zipfile.ZipFile(tmp_path / nombre, "w") as zf:
+            zf.writestr(f"{nombre}.pdf", b"%PDF")
+    salida = tmp_path / "202401"
+    salida.mkdir()
+    monkeypatch.setattr(descompresion, "ProcessPoolExecutor", EjecutorConCaida)
+    with InformeEjecucion("descompresion", tmp_path) as informe:
+        descomprimir_en_paralelo([(tmp_path / "bueno.zip", salida), (tmp_path / "malo.zip", salida)], workers=2)
+    assert informe.resumen()["totales"]["descompresion"]["errores"] == 1
+    entradas = IndiceExtraccion(salida).entradas
+    assert entradas["bueno.zip"]["completo"] and "malo.zip" not in entradas
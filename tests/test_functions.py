@@ -0,0 +1,43 @@
+import paramiko
+import pytest
+import functions
+from functions import descargar_archivos_sftp, rango_periodos
+from metricas import InformeEjecucion
+
+
+def test_rango_periodos_incluye_los_extremos_y_cruza_el_anho():
+    assert rango_periodos("202311", "202402") == ["202311", "202312", "202401", "202402"]
+    assert rango_periodos("202401", "202401") == ["202401"]
+
+
+@pytest.mark.parametrize("desde, hasta", [
+    ("202402", "202401"),
+    ("202413", "202414"),
+    ("20241", "202402"),
+    ("2024-01", "202402"),
+    ("202401", ""),
+])
+def test_rango_periodos_rechaza_periodos_invalidos(desde, hasta):
+    with pytest.raises(ValueError):
+        rango_periodos(desde, hasta)
+
+
+def test_un_error_de_conexion_en_la_descarga_se_propaga_y_se_cuenta(tmp_path, monkeypatch):
+    def caida(*args, **kwargs):
+        raise paramiko.SSHException("conexion perdida")
+
+    monkeypatch.setattr(functions, "obtener_pool", lambda *args: None)
+    monkeypatch.setattr(functions, "descargar_archivos_paralelo", caida)
+    with InformeEjecucion("descarga", tmp_path) as informe:
+        with pytest.raises(paramiko.SSHException):
+            descargar_archivos_sftp(None, "h", 22, "u", "p", ["202401_a.zip"], str(tmp_path))
+    assert informe.resumen()["totales"]["descarga"]["errores"] == 1
+
+
+def test_la_descarga_falla_si_falta_algun_comprimido(tmp_path, monkeypatch):
+    # Los bloques fallidos se registran en descargas.py y el archivo no llega a disco
+    monkeypatch.setattr(functions, "obtener_pool", lambda *args: None)
+    monkeypatch.setattr(functions, "descargar_archivos_paralelo",
+                        lambda pool, archivos, destino, **kwargs: (destino / archivos[0]).write_bytes(b"zip"))
+    with pytest.raises(IOError, match="202401_b.zip"):
+        descargar_archivos_sftp(None, "h", 22, "u", "p", ["202401_a.zip", "202401_b.zip"], str(tmp_path))
@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+import listado_remoto
+from listado_remoto import refrescar_snapshot
+
+
+class SftpFalso:
+    def __init__(self, directorio, archivos):
+        self.directorio = directorio
+        self.archivos = archivos
+
+    def getcwd(self):
+        return self.directorio
+
+    def stat(self, ruta):
+        return SimpleNamespace(st_mtime=100)
+
+    def listdir_attr(self, ruta):
+        assert ruta == (self.directorio or ".")
+        return [SimpleNamespace(filename=nombre, st_size=1, st_mtime=100) for nombre in self.archivos]
+
+
+def test_cada_directorio_remoto_tiene_su_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(listado_remoto, "DIRECTORIO_CACHE", tmp_path)
+    a = refrescar_snapshot(SftpFalso("/a", ["202401_a.zip"]), "h", 22, "u")
+    b = refrescar_snapshot(SftpFalso("/b", ["202401_b.zip"]), "h", 22, "u")
+    inicio = refrescar_snapshot(SftpFalso(None, ["202401_c.zip"]), "h", 22, "u")
+    assert len({a.ruta, b.ruta, inicio.ruta}) == 3
+    assert inicio.ruta.name == "listado_h_22_u.json"
+
+    # Listar /b no borró el snapshot de /a
+    sin_cambios = SftpFalso("/a", [])
+    sin_cambios.listdir_attr = None
+    assert list(refrescar_snapshot(sin_cambios, "h", 22, "u").entradas) == ["202401_a.zip"]
@@ -0,0 +1,44 @@
+import threading
+from metricas import InformeEjecucion, propagar_contexto, registrar_archivo, registrar_error
+
+
+def test_informes_solapados_no_se_cuentan_lo_del_otro(tmp_path):
+    listos = threading.Barrier(2)
+    resumenes = {}
+
+    def ejecucion(nombre: str, archivos: int) -> None:
+        with InformeEjecucion(nombre, tmp_path) as informe:
+            listos.wait()
+            for _ in range(archivos):
+                registrar_archivo("subida", 100, 0.01)
+            listos.wait()
+        resumenes[nombre] = informe.resumen()
+
+    hilos = [threading.Thread(target=ejecucion, args=("a", 3)), threading.Thread(target=ejecucion, args=("b", 5))]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert resumenes["a"]["totales"]["subida"]["archivos"] == 3
+    assert resumenes["b"]["totales"]["subida"]["bytes"] == 500
+
+
+def test_hilos_lanzados_con_propagar_contexto(tmp_path):
+    with InformeEjecucion("c", tmp_path) as informe:
+        hilos = [threading.Thread(target=propagar_contexto(registrar_error), args=("descarga",)) for _ in range(4)]
+        hilos.append(threading.Thread(target=registrar_error, args=("descarga",)))
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+    assert informe.resumen()["totales"]["descarga"]["errores"] == 4
+
+
+def test_fuera_del_with_no_se_suma(tmp_path):
+    informe = InformeEjecucion("d", tmp_path)
+    with informe:
+        registrar_archivo("descarga", 10, 0.5)
+    registrar_archivo("descarga", 10, 0.5)
+    totales = informe.resumen()["totales"]["descarga"]
+    assert (totales["bytes"], totales["archivos"], totales["latencia_media_s"]) == (10, 1, 0.5)
+    assert list(tmp_path.glob("d_informe_*.json"))
@@ -0,0 +1,89 @@
+import io
+import zipfile
+from contextlib import contextmanager
+import pytest
+import planificacion
+from planificacion import planificar_espacio
+
+
+class _Lectura(io.BytesIO):
+    def readv(self, peticiones):
+        for offset, longitud in peticiones:
+            self.seek(offset)
+            yield self.read(longitud)
+
+
+class PoolFalso:
+    """Pool con un servidor en memoria: nombre del comprimido -> contenido."""
+
+    def __init__(self, archivos: dict) -> None:
+        self.archivos = archivos
+        self.sesiones = 0
+
+    @contextmanager
+    def sesion(self):
+        self.sesiones += 1
+        yield self
+
+    def open(self, ruta: str, modo: str):
+        return _Lectura(self.archivos[ruta])
+
+    def stat(self, ruta: str):
+        return type("Atributos", (), {"st_size": len(self.archivos[ruta])})()
+
+
+def _zip(tamanho_pdf: int) -> bytes:
+    datos = io.BytesIO()
+    with zipfile.ZipFile(datos, "w") as zip_ref:
+        zip_ref.writestr("factura.pdf", b"x" * tamanho_pdf)
+    return datos.getvalue()
+
+
+@pytest.fixture
+def libres(monkeypatch):
+    def fijar(bytes_libres: int) -> None:
+        monkeypatch.setattr(planificacion, "uso_disco", lambda _: (0, bytes_libres))
+    return fijar
+
+
+def test_suma_descarga_y_lo_extraido(tmp_path, libres):
+    pool = PoolFalso({"a.zip": _zip(1000), "b.zip": _zip(3000)})
+    libres(10 ** 9)
+    plan = planificar_espacio(pool, ["a.zip", "b.zip"], tmp_path, margen=0, forzar=None)
+    assert plan.estrategia == "paralelo"
+    assert plan.bytes_descomprimidos == 4000
+    assert plan.bytes_descarga == len(pool.archivos["a.zip"]) + len(pool.archivos["b.zip"])
+    assert plan.necesarios_secuencial == 4000 + len(pool.archivos["b.zip"])
+
+
+def test_solo_suma_la_descarga_de_lo_que_falta_descargar(tmp_path, libres):
+    pool = PoolFalso({"a.zip": _zip(1000), "b.zip": _zip(3000)})
+    libres(10 ** 9)
+    plan = planificar_espacio(pool, ["a.zip", "b.zip"], tmp_path, margen=0, a_descargar=["a.zip"])
+    assert plan.bytes_descarga == len(pool.archivos["a.zip"])
+    # El comprimido mayor que ya está en disco no cuenta para el secuencial
+    assert plan.necesarios_secuencial == 4000 + len(pool.archivos["a.zip"])
+
+
+def test_ya_descargado_en_disco_no_suma_descarga(tmp_path, libres):
+    pool = PoolFalso({"a.zip": _zip(1000)})
+    (tmp_path / "a.zip").write_bytes(pool.archivos["a.zip"])
+    libres(10 ** 9)
+    assert planificar_espacio(pool, ["a.zip"], tmp_path, margen=0).bytes_descarga == 0
+
+
+def test_sin_nada_por_extraer_no_consulta_el_servidor(tmp_path, libres):
+    pool = PoolFalso({})
+    libres(0)
+    plan = planificar_espacio(pool, [], tmp_path, margen=0)
+    assert plan.estrategia == "paralelo" and pool.sesiones == 0
+
+
+def test_elige_secuencial_y_falla_sin_espacio(tmp_path, libres):
+    pool = PoolFalso({"a.zip": _zip(1000), "b.zip": _zip(3000)})
+    libres(4000 + len(pool.archivos["b.zip"]))
+    assert planificar_espacio(pool, ["a.zip", "b.zip"], tmp_path, margen=0).estrategia == "secuencial"
+    # Ni en streaming (sin .rar solo hace falta el margen)
+    libres(10)
+    with pytest.raises(OSError):
+        planificar_espacio(pool, ["a.zip", "b.zip"], tmp_path, margen=100)
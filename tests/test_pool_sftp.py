@@ -0,0 +1,99 @@
+import threading
+import paramiko
+import pytest
+import pool_sftp
+from metricas import propagar_contexto
+from pool_sftp import PoolSFTP, obtener_pool, usar_pool
+
+
+class TransporteFalso:
+    def __init__(self) -> None:
+        self.activo = True
+
+    def is_active(self) -> bool:
+        return self.activo
+
+    def close(self) -> None:
+        self.activo = False
+
+
+class SftpFalso:
+    def __init__(self) -> None:
+        self.directorio = None
+
+    def chdir(self, directorio: str) -> None:
+        self.directorio = directorio
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture(autouse=True)
+def sin_red(monkeypatch):
+    monkeypatch.setattr(PoolSFTP, "_conectar", lambda self: TransporteFalso())
+    monkeypatch.setattr(paramiko.SFTPClient, "from_transport", lambda transporte: SftpFalso())
+    monkeypatch.setattr(pool_sftp, "_pools", {})
+
+
+def test_cada_directorio_tiene_su_pool():
+    with usar_pool("h", 22, "u", "p", "/a") as pool_a:
+        assert obtener_pool("h", 22, "u", "p") is pool_a
+        with pool_a.sesion() as sftp:
+            assert sftp.directorio == "/a"
+        with usar_pool("h", 22, "u", "p", "/b") as pool_b:
+            assert pool_b is not pool_a and obtener_pool("h", 22, "u", "p") is pool_b
+        assert obtener_pool("h", 22, "u", "p") is pool_a
+    assert obtener_pool("h", 22, "u", "p").directorio is None
+
+
+def test_el_pool_se_cierra_al_salir_su_ultimo_usuario():
+    with usar_pool("h", 22, "u", "p", "/a") as pool:
+        with pool.sesion():
+            pass
+        with usar_pool("h", 22, "u", "p", "/a") as otro:
+            assert otro is pool
+        # Sigue abierto: el primer bloque todavía lo usa
+        assert pool._transportes and pool._transportes[0][0].is_active()
+    assert not pool._transportes
+    assert obtener_pool("h", 22, "u", "p", "/a") is not pool
+
+
+def test_los_hilos_lanzados_con_propagar_contexto_usan_el_pool_de_la_cuenta():
+    vistos = []
+    with usar_pool("h", 22, "u", "p", "/a") as pool:
+        hilo = threading.Thread(target=propagar_contexto(lambda: vistos.append(obtener_pool("h", 22, "u", "p"))))
+        hilo.start()
+        hilo.join()
+    assert vistos == [pool]
+
+
+def test_transporte_caido_con_canales_prestados_libera_su_conexion(monkeypatch):
+    monkeypatch.setattr(pool_sftp, "_conexiones", threading.BoundedSemaphore(1))
+    pool = PoolSFTP("h", 22, "u", "p", canales_por_transporte=1)
+    prestada = pool._reservar()
+    prestada[0].close()
+
+    resultado = []
+    hilo = threading.Thread(target=lambda: resultado.append(pool._reservar()), daemon=True)
+    hilo.start()
+    hilo.join(timeout=2)
+    assert resultado and resultado[0] is not prestada and resultado[0][0].is_active()
+    # El canal prestado sobre el transporte caído se devuelve sin afectar al nuevo
+    pool._liberar(prestada)
+    assert resultado[0][1] == 1
+
+
+def test_cambiar_la_contrasena_no_corta_las_transferencias_del_pool_anterior(monkeypatch):
+    monkeypatch.setattr(pool_sftp, "_retirados", [])
+    anterior = obtener_pool("h", 22, "u", "vieja")
+    with anterior.sesion():
+        with anterior.sesion():
+            pass
+        transporte = anterior._transportes[0][0]
+        nuevo = obtener_pool("h", 22, "u", "nueva")
+        assert nuevo is not anterior
+        # El canal en uso sigue vivo hasta que se devuelve
+        assert transporte.is_active()
+    assert not transporte.is_active() and not anterior._transportes
+    pool_sftp.cerrar_pools()
+    assert pool_sftp._retirados == []
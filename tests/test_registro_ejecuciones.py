@@ -0,0 +1,79 @@
+import pytest
+from descompresion import IndiceExtraccion
+from registro_ejecuciones import RegistroEjecuciones, obtener_registro, ruta_registro
+
+ARCHIVOS = ["202401_a.zip", "202401_b.rar"]
+ATRIBUTOS = {"202401_a.zip": [3, 100], "202401_b.rar": [5, 100]}
+
+
+@pytest.fixture
+def registro(tmp_path):
+    registro = RegistroEjecuciones(tmp_path / "registro.sqlite3")
+    yield registro
+    registro.cerrar()
+
+
+def _extraer(carpeta, archivo, miembros):
+    # Lo que deja descompresion.descomprimir_archivos en la carpeta del periodo
+    carpeta.mkdir(exist_ok=True)
+    indice = IndiceExtraccion(carpeta)
+    indice.entradas[archivo] = {"completo": True, "miembros": miembros}
+    indice.guardar()
+
+
+def test_cada_comprimido_avanza_por_sus_etapas_hasta_subido(tmp_path, registro):
+    assert registro.iniciar_periodo("202401", ARCHIVOS, ATRIBUTOS) == ARCHIVOS
+    assert registro.estado("202401") == dict.fromkeys(ARCHIVOS, "listado")
+
+    # b.rar quedó a medias: descargado pero con otro tamaño que el remoto
+    (tmp_path / "202401_a.zip").write_bytes(b"abc")
+    (tmp_path / "202401_b.rar").write_bytes(b"ab")
+    assert registro.registrar_descarga("202401", ARCHIVOS, tmp_path) == ["202401_a.zip"]
+    assert registro.estado("202401") == {"202401_a.zip": "verificado", "202401_b.rar": "descargado"}
+    assert registro.pendientes("202401", ARCHIVOS, "verificado") == ["202401_b.rar"]
+
+    carpeta = tmp_path / "202401"
+    _extraer(carpeta, "202401_a.zip", {"1.pdf": 10, "2.pdf": 20, "sub/3.pdf": 30})
+    assert registro.registrar_extraccion("202401", ["202401_a.zip"], carpeta) == ["202401_a.zip"]
+    assert registro.en_etapa("202401", ARCHIVOS, "extraido") == ["202401_a.zip"]
+
+    # Falta un PDF en el servidor: el comprimido sigue extraído
+    assert registro.registrar_subida("202401", ["1.pdf"]) == []
+    assert registro.registrar_subida("202401", ["2.pdf"]) == ["202401_a.zip"]
+    assert registro.subidos("202401") == {"202401_a.zip": (3, 100)}
+
+    # Otra ejecución omite lo subido; avanzar nunca hace retroceder
+    assert registro.iniciar_periodo("202401", ARCHIVOS, ATRIBUTOS) == ["202401_b.rar"]
+    registro.avanzar("202401", ["202401_a.zip"], "descargado")
+    assert registro.estado("202401")["202401_a.zip"] == "subido"
+
+
+def test_un_comprimido_cambiado_en_el_servidor_empieza_de_nuevo(registro):
+    registro.iniciar_periodo("202401", ARCHIVOS, ATRIBUTOS)
+    registro.avanzar("202401", ARCHIVOS, "subido")
+    cambiados = {**ATRIBUTOS, "202401_b.rar": [6, 200]}
+    assert registro.iniciar_periodo("202401", ARCHIVOS, cambiados) == ["202401_b.rar"]
+    assert registro.estado("202401")["202401_b.rar"] == "listado"
+    # Sin atributos en el listado no se da por cambiado
+    assert registro.iniciar_periodo("202401", ARCHIVOS, {}) == ["202401_b.rar"]
+
+
+def test_descargado_sin_extraer_que_ya_no_esta_en_disco_se_descarga_de_nuevo(tmp_path, registro):
+    registro.iniciar_periodo("202401", ARCHIVOS, ATRIBUTOS)
+    registro.avanzar("202401", ARCHIVOS, "verificado")
+    (tmp_path / "202401_a.zip").write_bytes(b"abc")
+    assert registro.pendientes("202401", ARCHIVOS, "verificado") == []
+    assert registro.pendientes("202401", ARCHIVOS, "verificado", tmp_path) == ["202401_b.rar"]
+    # Ya extraído, no hace falta el comprimido
+    registro.avanzar("202401", ["202401_b.rar"], "extraido")
+    assert registro.pendientes("202401", ARCHIVOS, "verificado", tmp_path) == []
+
+
+def test_olvidar_y_un_registro_por_directorio_de_trabajo(tmp_path, registro):
+    registro.iniciar_periodo("202401", ARCHIVOS, ATRIBUTOS)
+    registro.olvidar("202401")
+    assert registro.estado("202401") == {}
+
+    uno = obtener_registro(ruta_registro(tmp_path / "uno"))
+    assert obtener_registro(ruta_registro(tmp_path / "uno")) is uno
+    assert obtener_registro(ruta_registro(tmp_path / "dos")) is not uno
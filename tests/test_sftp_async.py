@@ -0,0 +1,37 @@
+import asyncio
+from contextlib import contextmanager
+import paramiko
+import pytest
+from sftp_async import AdaptadorSFTPAsync
+
+
+class PoolFalso:
+    def __init__(self, canales_disponibles: int) -> None:
+        self.disponibles = canales_disponibles
+        self.abiertos = 0
+
+    @contextmanager
+    def sesion(self):
+        if self.disponibles == 0:
+            raise paramiko.SSHException("sin conexiones")
+        self.disponibles -= 1
+        self.abiertos += 1
+        try:
+            yield object()
+        finally:
+            self.abiertos -= 1
+            self.disponibles += 1
+
+
+def test_si_falla_un_canal_los_ya_abiertos_vuelven_al_pool():
+    pool = PoolFalso(2)
+    adaptador = AdaptadorSFTPAsync(pool, 3)
+
+    async def abrir():
+        async with adaptador:
+            pass
+
+    with pytest.raises(paramiko.SSHException):
+        asyncio.run(abrir())
+    assert pool.abiertos == 0 and pool.disponibles == 2
+    assert adaptador._executor._shutdown
@@ -0,0 +1,104 @@
+import hashlib
+import io
+import tarfile
+import zipfile
+import pytest
+import subidas
+from streaming import formato_remoto, miembros_pdf_remotos, procesar_archivos_streaming, subir_miembros_a_sftp
+
+
+class _Escritura(io.BytesIO):
+    def __init__(self, destino: dict, ruta: str) -> None:
+        super().__init__()
+        self._destino, self._ruta = destino, ruta
+
+    def set_pipelined(self, _: bool) -> None:
+        pass
+
+    def close(self) -> None:
+        self._destino[self._ruta] = self.getvalue()
+        super().close()
+
+
+class SftpFalso:
+    def __init__(self) -> None:
+        self.archivos = {}
+
+    def open(self, ruta: str, modo: str):
+        assert modo == "wb"
+        return _Escritura(self.archivos, ruta)
+
+
+def _zip(miembros: dict) -> io.BytesIO:
+    datos = io.BytesIO()
+    with zipfile.ZipFile(datos, "w") as zip_ref:
+        for nombre, contenido in miembros.items():
+            zip_ref.writestr(nombre, contenido)
+    datos.seek(0)
+    return datos
+
+
+def _tar_gz(miembros: dict) -> io.BytesIO:
+    datos = io.BytesIO()
+    with tarfile.open(fileobj=datos, mode="w:gz") as tar_ref:
+        for nombre, contenido in miembros.items():
+            info = tarfile.TarInfo(nombre)
+            info.size = len(contenido)
+            tar_ref.addfile(info, io.BytesIO(contenido))
+    datos.seek(0)
+    return datos
+
+
+def test_formato_por_firma_aunque_la_extension_mienta():
+    assert formato_remoto(_zip({"a.pdf": b"x"}), "202409_facturas.tar.gz") == "zip"
+    assert formato_remoto(_tar_gz({"a.pdf": b"x"}), "202409_facturas.zip") == "tar.gz"
+    assert formato_remoto(io.BytesIO(b"Rar!\x1a\x07\x00"), "202409_facturas.zip") == "rar"
+
+
+def test_solo_pdf_del_primer_nivel():
+    comprimido = _zip({"a.pdf": b"a", "b.txt": b"b", "sub/c.pdf": b"c"})
+    assert [nombre for nombre, _, _ in miembros_pdf_remotos(comprimido, "zip")] == ["a.pdf"]
+
+
+def test_subida_anota_el_hash_de_lo_subido():
+    sftp = SftpFalso()
+    hashes = {}
+    resultado = subir_miembros_a_sftp(sftp, miembros_pdf_remotos(_zip({"a.pdf": b"hola"}), "zip"), "/r/202409", {},
+                                      hashes=hashes, modo="tamanho")
+    assert resultado == (1, 1, 4)
+    assert sftp.archivos["/r/202409/a.pdf"] == b"hola"
+    assert hashes == {"a.pdf": {"tamanho": 4, "sha256": hashlib.sha256(b"hola").hexdigest()}}
+
+
+def test_modo_hash_sube_de_nuevo_si_el_contenido_cambio():
+    sftp = SftpFalso()
+    hashes = {"a.pdf": {"tamanho": 4, "sha256": hashlib.sha256(b"hola").hexdigest()},
+              "b.pdf": {"tamanho": 4, "sha256": hashlib.sha256(b"xxxx").hexdigest()}}
+    comprimido = _zip({"a.pdf": b"hola", "b.pdf": b"chau"})
+    resultado = subir_miembros_a_sftp(sftp, miembros_pdf_remotos(comprimido, "zip"), "/r", {"a.pdf": 4, "b.pdf": 4},
+                                      hashes=hashes, modo="hash")
+    assert resultado == (2, 1, 4)
+    assert list(sftp.archivos) == ["/r/b.pdf"]
+    assert hashes["b.pdf"]["sha256"] == hashlib.sha256(b"chau").hexdigest()
+
+
+def test_modo_tamanho_omite_los_del_mismo_tamanho():
+    sftp = SftpFalso()
+    comprimido = _tar_gz({"a.pdf": b"hola"})
+    assert subir_miembros_a_sftp(sftp, miembros_pdf_remotos(comprimido, "tar.gz"), "/r", {"a.pdf": 4}, modo="tamanho") == (1, 0, 0)
+
+
+def test_tar_gz_distinto_no_se_puede_releer_en_flujo():
+    hashes = {"a.pdf": {"tamanho": 4, "sha256": "otro"}}
+    with pytest.raises(tarfile.StreamError):
+        subir_miembros_a_sftp(SftpFalso(), miembros_pdf_remotos(_tar_gz({"a.pdf": b"hola"}), "tar.gz"), "/r",
+                              {"a.pdf": 4}, hashes=hashes, modo="hash")
+
+
+def test_un_modo_de_verificacion_desconocido_falla_tambien_en_streaming(monkeypatch):
+    with pytest.raises(ValueError, match="hahs"):
+        subir_miembros_a_sftp(SftpFalso(), [], "/r", {}, modo="hahs")
+    # Sin tocar el servidor: el pool no se usa
+    monkeypatch.setattr(subidas, "MODO_VERIFICACION", "hahs")
+    with pytest.raises(ValueError, match="hahs"):
+        procesar_archivos_streaming(None, ["202409_facturas.zip"])
@@ -0,0 +1,112 @@
+import hashlib
+import threading
+from contextlib import contextmanager
+import paramiko
+import pytest
+import subidas
+from metricas import InformeEjecucion
+from subidas import BLOQUE_CHECK_FILE, comprobar_check_file, subir_archivos_paralelo
+
+
+class _Remoto:
+    def __init__(self, datos: bytes, admitidos: tuple) -> None:
+        self.datos, self.admitidos = datos, admitidos
+        self.pedidos = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+    def check(self, algoritmo: str, block_size: int):
+        self.pedidos.append(algoritmo)
+        if algoritmo not in self.admitidos:
+            raise IOError("algoritmo no admitido")
+        return b"".join(hashlib.new(algoritmo, self.datos[i:i + block_size]).digest()
+                        for i in range(0, len(self.datos), block_size))
+
+
+class SftpFalso:
+    def __init__(self, archivos: dict, admitidos=("sha256", "sha1", "md5")) -> None:
+        self.archivos, self.admitidos = archivos, admitidos
+        self.remotos = []
+
+    def open(self, ruta: str, modo: str):
+        if ruta not in self.archivos:
+            raise FileNotFoundError(ruta)
+        remoto = _Remoto(self.archivos[ruta], self.admitidos)
+        self.remotos.append(remoto)
+        return remoto
+
+    def stat(self, ruta: str):
+        if ruta not in self.archivos:
+            raise FileNotFoundError(ruta)
+        return type("Atributos", (), {"st_size": len(self.archivos[ruta])})()
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    (tmp_path / "igual.pdf").write_bytes(b"a" * (BLOQUE_CHECK_FILE + 10))
+    (tmp_path / "distinto.pdf").write_bytes(b"b" * 100)
+    (tmp_path / "falta.pdf").write_bytes(b"c")
+    return tmp_path
+
+
+def test_detecta_distintos_y_faltantes(pdfs):
+    sftp = SftpFalso({"r/igual.pdf": b"a" * (BLOQUE_CHECK_FILE + 10), "r/distinto.pdf": b"x" * 100})
+    distintos = comprobar_check_file(sftp, "r", [pdfs / "igual.pdf", pdfs / "distinto.pdf", pdfs / "falta.pdf"])
+    assert [p.name for p in distintos] == ["distinto.pdf", "falta.pdf"]
+    assert all(r.pedidos == ["sha256"] for r in sftp.remotos)
+
+
+def test_pide_el_siguiente_algoritmo_y_no_repite_el_rechazado(pdfs):
+    sftp = SftpFalso({"r/igual.pdf": b"a" * (BLOQUE_CHECK_FILE + 10), "r/distinto.pdf": b"x" * 100}, admitidos=("md5",))
+    distintos = comprobar_check_file(sftp, "r", [pdfs / "igual.pdf", pdfs / "distinto.pdf"])
+    assert [p.name for p in distintos] == ["distinto.pdf"]
+    assert [r.pedidos for r in sftp.remotos] == [["sha256", "sha1", "md5"], ["md5"]]
+
+
+def test_sin_algoritmos_admitidos_devuelve_none(pdfs):
+    sftp = SftpFalso({"r/igual.pdf": b"a"}, admitidos=())
+    assert comprobar_check_file(sftp, "r", [pdfs / "igual.pdf"]) is None
+
+
+def test_pdf_vacio_solo_compara_tamanho(tmp_path):
+    (tmp_path / "vacio.pdf").write_bytes(b"")
+    sftp = SftpFalso({"r/vacio.pdf": b""}, admitidos=())
+    assert comprobar_check_file(sftp, "r", [tmp_path / "vacio.pdf"]) == []
+    assert sftp.remotos == []
+    assert comprobar_check_file(SftpFalso({"r/vacio.pdf": b"x"}), "r", [tmp_path / "vacio.pdf"]) == [tmp_path / "vacio.pdf"]
+
+
+class PoolConCanales:
+    def __init__(self, canales: int) -> None:
+        self.canales = canales
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def sesion(self):
+        with self.lock:
+            if self.canales == 0:
+                raise paramiko.SSHException("sin conexiones")
+            self.canales -= 1
+        yield object()
+
+
+def test_un_trabajador_sin_canal_deja_sus_archivos_a_los_demas(tmp_path, monkeypatch):
+    archivos = [tmp_path / f"{i}.pdf" for i in range(6)]
+    for archivo in archivos:
+        archivo.write_bytes(b"%PDF")
+    monkeypatch.setattr(subidas, "subir_archivo", lambda sftp, archivo, *args: True)
+    with InformeEjecucion("subida", tmp_path) as informe:
+        subidos = subir_archivos_paralelo(PoolConCanales(1), archivos, "/remoto", concurrencia=3)
+    assert sorted(subidos) == sorted(archivos)
+    assert informe.resumen()["totales"]["subida"]["errores"] == 2
+
+
+def test_sin_ningun_canal_no_se_sube_nada_y_se_registra(tmp_path, monkeypatch):
+    monkeypatch.setattr(subidas, "subir_archivo", lambda sftp, archivo, *args: True)
+    with InformeEjecucion("subida", tmp_path) as informe:
+        assert subir_archivos_paralelo(PoolConCanales(0), [tmp_path / "1.pdf"], "/remoto") == []
+    assert informe.resumen()["totales"]["subida"]["errores"] == 1
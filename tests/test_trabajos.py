@@ -0,0 +1,75 @@
+import threading
+from datetime import datetime, timedelta
+import pytest
+from trabajos import GestorTrabajos
+
+
+@pytest.fixture
+def gestor():
+    gestor = GestorTrabajos(workers=4)
+    yield gestor
+    gestor.cerrar()
+
+
+def _bloqueante(evento: threading.Event):
+    def funcion(progreso) -> None:
+        progreso.etapa("descarga")
+        evento.wait(5)
+    return funcion
+
+
+def test_mismo_periodo_devuelve_el_trabajo_activo(gestor):
+    evento = threading.Event()
+    primero = gestor.iniciar(["202409"], _bloqueante(evento))
+    assert gestor.iniciar(["202409"], _bloqueante(evento)) is primero
+    evento.set()
+    gestor.esperar([primero], intervalo=0.01)
+    assert primero.estado == "terminado"
+    assert gestor.iniciar(["202409"], _bloqueante(evento)) is not primero
+
+
+def test_backfill_choca_con_un_periodo_en_curso(gestor):
+    evento = threading.Event()
+    mes = gestor.iniciar(["202409"], _bloqueante(evento))
+    backfill = gestor.iniciar(["202407", "202408", "202409"], _bloqueante(evento))
+    assert backfill is mes
+    evento.set()
+
+
+def test_cuentas_distintas_no_chocan(gestor):
+    evento = threading.Event()
+    propia = gestor.iniciar(["202409"], _bloqueante(evento))
+    otra = gestor.iniciar(["202409"], _bloqueante(evento), cuenta="espejo")
+    assert otra is not propia and otra.cuenta == "espejo"
+    assert gestor.iniciar(["202408", "202409"], _bloqueante(evento), cuenta="espejo") is otra
+    evento.set()
+
+
+def test_periodo_de_un_rango(gestor):
+    evento = threading.Event()
+    evento.set()
+    trabajo = gestor.iniciar(["202407", "202408", "202409"], _bloqueante(evento))
+    assert trabajo.periodo == "202407-202409"
+
+
+def test_trabajo_fallido_libera_sus_periodos(gestor):
+    def falla(progreso) -> None:
+        raise RuntimeError("sin conexion")
+
+    trabajo = gestor.esperar([gestor.iniciar(["202409"], falla)], intervalo=0.01)[0]
+    assert trabajo.estado == "fallido" and trabajo.error == "sin conexion"
+    assert gestor.iniciar(["202409"], falla) is not trabajo
+
+
+def test_se_purgan_los_trabajos_terminados():
+    gestor = GestorTrabajos(workers=1, retencion=3600, maximo=2)
+    try:
+        terminados = [gestor.esperar([gestor.iniciar([f"20240{i}"], lambda progreso: None)], intervalo=0.01)[0]
+                      for i in range(1, 5)]
+        assert [trabajo.id for trabajo in gestor.listar()] == [trabajo.id for trabajo in terminados[-2:]]
+
+        terminados[-1].actualizado = datetime.now() - timedelta(hours=2)
+        assert [trabajo.id for trabajo in gestor.listar()] == [terminados[-2].id]
+        assert gestor.obtener(terminados[-1].id) is None
+    finally:
+        gestor.cerrar()
@@ -0,0 +1,23 @@
+from pathlib import Path
+from cuentas import vigilante_cuenta
+from registro_ejecuciones import obtener_registro, ruta_registro
+from schemas.schemas import CuentaSFTP
+
+
+def test_el_vigilante_de_una_cuenta_usa_su_directorio_y_su_registro(tmp_path):
+    cuenta = CuentaSFTP(nombre="espejo", host="h", username="u", password="p", directorio_remoto="/entrada",
+                        directorio_trabajo=str(tmp_path / "espejo"))
+    procesados = []
+    vigilante = vigilante_cuenta(cuenta, procesar=lambda *args: procesados.append(args), desde="202401")
+    assert vigilante.directorio_remoto == "/entrada"
+    assert vigilante.directorio_trabajo == Path(cuenta.directorio_trabajo)
+
+    # Subido según el registro de la cuenta: deja de ser candidato
+    registro = obtener_registro(ruta_registro(vigilante.directorio_trabajo))
+    registro.iniciar_periodo("202401", ["202401_facturas.zip"], {"202401_facturas.zip": [10, 100]})
+    registro.avanzar("202401", ["202401_facturas.zip"], "subido")
+    entradas = {"202401_facturas.zip": {"tamanho": 10, "mtime": 100},
+                "202402_facturas.zip": {"tamanho": 20, "mtime": 200}}
+    assert vigilante.candidatos(entradas) == ["202402_facturas.zip"]
+    # El registro del directorio actual no interviene
+    assert obtener_registro(ruta_registro(tmp_path / "otra")).subidos("202401") == {}
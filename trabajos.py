@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from schemas.schemas import EstadoTrabajo
+
+load_dotenv()
+
+_logger = logging.getLogger(__name__)
+
+# Trabajos que pueden ejecutarse a la vez (se puede ajustar desde el archivo .env)
+WORKERS_TRABAJOS = int(os.getenv("TRABAJOS_WORKERS", "2"))
+# Segundos que un trabajo terminado o fallido se sigue mostrando en /jobs
+RETENCION_TRABAJOS = float(os.getenv("TRABAJOS_RETENCION_S", "86400"))
+# Máximo de trabajos terminados o fallidos que se conservan; se descartan primero los más antiguos
+MAXIMO_TRABAJOS = int(os.getenv("TRABAJOS_MAXIMO", "500"))
+
+ESTADOS_ACTIVOS = ("en_cola", "en_curso")
+
+
+class Progreso:
+    """
+    Punto de reporte de avance que las etapas del proceso actualizan mientras trabajan.
+
+    Es seguro llamarlo desde varios hilos a la vez (descargas y subidas en paralelo).
+
+    Attributes:
+        estado (EstadoTrabajo): Estado del trabajo que se va actualizando.
+    """
+
+    def __init__(self, estado: EstadoTrabajo) -> None:
+        self.estado = estado
+        self._lock = threading.Lock()
+
+    def etapa(self, nombre: str) -> None:
+        with self._lock:
+            self.estado.etapa = nombre
+            self.estado.actualizado = datetime.now()
+        _logger.info(f"Trabajo {self.estado.id}: etapa {nombre}")
+
+    def sumar(self, bytes_transferidos: int = 0, archivos: int = 0) -> None:
+        with self._lock:
+            self.estado.bytes_transferidos += bytes_transferidos
+            self.estado.archivos_procesados += archivos
+            self.estado.actualizado = datetime.now()
+
+
+class GestorTrabajos:
+    """
+    Ejecuta procesamientos de facturas en un pool de hilos en segundo plano y guarda su estado.
+
+    Cada trabajo ocupa uno o varios periodos de una cuenta (None es la cuenta del archivo .env). Una
+    petición que toca algún periodo de la misma cuenta que ya se está procesando no lanza un trabajo
+    nuevo: devuelve el trabajo en curso, de modo que dos disparos (el mes vencido, un backfill, el
+    vigilante o una cuenta) nunca procesan el mismo mes de la misma cuenta a la vez.
+
+    Los trabajos terminados se conservan RETENCION_TRABAJOS segundos, y como mucho MAXIMO_TRABAJOS.
+
+    Attributes:
+        workers (int): Cantidad de trabajos que pueden ejecutarse a la vez.
+        retencion (float): Segundos que se conserva un trabajo terminado.
+        maximo (int): Trabajos terminados que se conservan como mucho.
+    """
+
+    def __init__(self, workers: int = WORKERS_TRABAJOS, retencion: float = RETENCION_TRABAJOS,
+                 maximo: int = MAXIMO_TRABAJOS) -> None:
+        self.workers = workers
+        self.retencion = retencion
+        self.maximo = maximo
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="trabajo")
+        self._lock = threading.Lock()
+        self._trabajos: Dict[str, EstadoTrabajo] = {}
+        # Trabajo activo de cada (cuenta, periodo), y claves que ocupa cada trabajo activo
+        self._activos: Dict[Tuple[str, str], str] = {}
+        self._claves: Dict[str, List[Tuple[str, str]]] = {}
+        # Referencias a las tareas asyncio en curso para que no las recoja el recolector de basura
+        self._tareas: Set[asyncio.Task] = set()
+
+    def iniciar(self, periodos: List[str], funcion: Callable[..., None], *args, cuenta: Optional[str] = None,
+                **kwargs) -> EstadoTrabajo:
+        """
+        Lanza funcion(*args, progreso=..., **kwargs) en segundo plano, salvo que ya haya un trabajo
+        activo para alguno de los periodos de la misma cuenta. Si funcion es una corrutina se programa
+        como tarea en el bucle de eventos en curso (hay que llamar desde dentro de él); si no, corre en
+        el pool de hilos.
+
+        Args:
+            periodos (List[str]): Periodos 'YYYYMM' que se van a procesar (varios en un backfill).
+            funcion (Callable[..., None]): Función del proceso; debe aceptar el argumento progreso.
+            cuenta (Optional[str]): Nombre de la cuenta (ver cuentas.py); None para la del archivo .env.
+
+        Returns:
+            EstadoTrabajo: Trabajo recién creado o el que ya estaba activo para alguno de esos periodos.
+        """
+        claves = [(cuenta or "", periodo) for periodo in periodos]
+        with self._lock:
+            for clave in claves:
+                activo = self._activos.get(clave)
+                if activo is not None:
+                    _logger.info(f"Ya hay un trabajo activo para el periodo {clave[1]}{' de ' + cuenta if cuenta else ''}: {activo}")
+                    return self._trabajos[activo]
+            self._purgar()
+            ahora = datetime.now()
+            periodo = periodos[0] if len(periodos) == 1 else f"{periodos[0]}-{periodos[-1]}"
+            estado = EstadoTrabajo(id=uuid.uuid4().hex, periodo=periodo, cuenta=cuenta, creado=ahora, actualizado=ahora)
+            self._trabajos[estado.id] = estado
+            self._claves[estado.id] = claves
+            for clave in claves:
+                self._activos[clave] = estado.id
+        if asyncio.iscoroutinefunction(funcion):
+            tarea = asyncio.get_running_loop().create_task(self._ejecutar_async(estado, funcion, args, kwargs))
+            self._tareas.add(tarea)
+            tarea.add_done_callback(self._tareas.discard)
+        else:
+            self._executor.submit(self._ejecutar, estado, funcion, args, kwargs)
+        return estado
+
+    def _purgar(self) -> None:
+        # Se llama con el lock tomado: descarta los trabajos terminados viejos o que sobran
+        limite = datetime.now().timestamp() - self.retencion
+        terminados = sorted((estado for estado in self._trabajos.values() if estado.id not in self._claves),
+                            key=lambda estado: estado.actualizado)
+        sobran = max(0, len(terminados) - self.maximo)
+        for indice, estado in enumerate(terminados):
+            if indice < sobran or estado.actualizado.timestamp() < limite:
+                del self._trabajos[estado.id]
+
+    def _ejecutar(self, estado: EstadoTrabajo, funcion: Callable[..., None], args: tuple, kwargs: dict) -> None:
+        estado.estado = "en_curso"
+        try:
+            funcion(*args, progreso=Progreso(estado), **kwargs)
+            estado.estado = "terminado"
+        except Exception as e:
+            self._fallido(estado, e)
+        finally:
+            self._finalizar(estado)
+
+    async def _ejecutar_async(self, estado: EstadoTrabajo, funcion: Callable[..., None], args: tuple, kwargs: dict) -> None:
+        estado.estado = "en_curso"
+        try:
+            await funcion(*args, progreso=Progreso(estado), **kwargs)
+            estado.estado = "terminado"
+        except Exception as e:
+            self._fallido(estado, e)
+        finally:
+            self._finalizar(estado)
+
+    def _fallido(self, estado: EstadoTrabajo, error: Exception) -> None:
+        _logger.error(f"Trabajo {estado.id} del periodo {estado.periodo} fallido: {error}")
+        estado.estado = "fallido"
+        estado.error = str(error)
+
+    def _finalizar(self, estado: EstadoTrabajo) -> None:
+        estado.actualizado = datetime.now()
+        with self._lock:
+            for clave in self._claves.pop(estado.id, []):
+                self._activos.pop(clave, None)
+
+    def obtener(self, id_trabajo: str) -> Optional[EstadoTrabajo]:
+        return self._trabajos.get(id_trabajo)
+
+    def listar(self) -> List[EstadoTrabajo]:
+        with self._lock:
+            self._purgar()
+            return list(self._trabajos.values())
+
+    def esperar(self, trabajos: List[EstadoTrabajo], intervalo: float = 1) -> List[EstadoTrabajo]:
+        """
+        Bloquea hasta que los trabajos indicados terminen o fallen y los devuelve.
+        """
+        while any(trabajo.estado in ESTADOS_ACTIVOS for trabajo in trabajos):
+            time.sleep(intervalo)
+        return trabajos
+
+    def cerrar(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for tarea in list(self._tareas):
+            tarea.cancel()
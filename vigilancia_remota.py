@@ -0,0 +1,228 @@
+import argparse
+import logging
+import os
+import posixpath
+import signal
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+import paramiko
+from dotenv import load_dotenv
+from schemas.schemas import ConteoArchivos
+from functions import ejecutar_archivos_nuevos, fecha_mes_vencido
+from listado_remoto import construir_conteo, extraer_fecha, refrescar_snapshot, tipo_comprimido
+from log_configuration import configurar_logging
+from pool_sftp import cerrar_pools, obtener_pool, usar_pool
+from registro_ejecuciones import RegistroEjecuciones, obtener_registro, ruta_registro
+from sms import cerrar_despachador
+
+load_dotenv()
+
+_logger = logging.getLogger(__name__)
+
+# Configuración del vigilante remoto (se puede ajustar desde el archivo .env)
+INTERVALO_VIGILANCIA = float(os.getenv("VIGILANCIA_INTERVALO", "60"))
+# Segundos que el tamaño y la fecha de un comprimido nuevo deben seguir iguales para darlo por terminado de subir
+ESTABLE_VIGILANCIA = float(os.getenv("VIGILANCIA_ESTABLE_S", "120"))
+# Espera antes de volver a intentar un comprimido cuyo procesamiento falló
+REINTENTO_VIGILANCIA = float(os.getenv("VIGILANCIA_REINTENTO_S", "900"))
+# Primer periodo YYYYMM que se vigila; por defecto el mes vencido
+DESDE_VIGILANCIA = os.getenv("VIGILANCIA_DESDE", "")
+
+
+class VigilanteRemoto:
+    """
+    Vigila el directorio remoto y procesa cada comprimido nuevo en cuanto termina de llegar.
+
+    En cada sondeo se refresca el snapshot del listado (ver listado_remoto.SnapshotRemoto): un stat
+    del directorio y solo si cambió un listdir_attr. Los comprimidos de periodos desde 'desde' que el
+    registro de ejecuciones no tiene como subidos (o que cambiaron desde que se subieron) son
+    candidatos. Como un archivo que crece no cambia la fecha del directorio, a cada candidato se le
+    hace un stat y se le sigue el tamaño y la fecha: cuando llevan 'estable' segundos sin cambiar en
+    al menos dos sondeos se procesan solo esos comprimidos, agrupados por periodo.
+
+    Si después del procesamiento un comprimido no quedó subido, se vuelve a intentar pasados
+    'reintento' segundos.
+
+    Vigila una sola cuenta: por defecto la del .env, en el directorio de inicio del usuario y con el
+    registro del directorio actual. Para las cuentas de cuentas.py se crea uno por cuenta con su
+    directorio remoto y su directorio de trabajo (ver cuentas.vigilante_cuenta).
+
+    Attributes:
+        host (str): Dirección del servidor SFTP.
+        port (int): Puerto del servidor SFTP.
+        username (str): Nombre de usuario para el acceso SFTP.
+        directorio_remoto (Optional[str]): Directorio remoto de la cuenta; None para el de inicio del usuario.
+        directorio_trabajo (Optional[Path]): Directorio local de la cuenta (registro, descargas e informes).
+        desde (str): Primer periodo 'YYYYMM' vigilado.
+        estable (float): Segundos sin cambios para dar un comprimido por completo.
+        reintento (float): Segundos de espera tras un procesamiento fallido.
+        observados (Dict[str, Tuple[int, int, float]]): Tamaño, fecha y desde cuándo no cambian, por candidato.
+        en_espera (Dict[str, float]): Comprimidos fallidos y el momento (epoch) a partir del cual se reintentan.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 procesar: Optional[Callable[[str, List[str], ConteoArchivos], None]] = None,
+                 desde: Optional[str] = None, estable: float = ESTABLE_VIGILANCIA,
+                 reintento: float = REINTENTO_VIGILANCIA, directorio_remoto: Optional[str] = None,
+                 directorio_trabajo: Optional[Path] = None) -> None:
+        self.host = host
+        self.port = port
+        self.username = username
+        self._password = password
+        self.directorio_remoto = directorio_remoto
+        self.directorio_trabajo = directorio_trabajo
+        self.desde = desde or DESDE_VIGILANCIA or fecha_mes_vencido()
+        self.estable = estable
+        self.reintento = reintento
+        self.observados: Dict[str, Tuple[int, int, float]] = {}
+        self.en_espera: Dict[str, float] = {}
+        self._procesar = procesar or self._procesar_directo
+        self._detener = threading.Event()
+
+    def _procesar_directo(self, periodo: str, archivos: List[str], conteo_archivos: ConteoArchivos) -> None:
+        with self._pool_cuenta():
+            ejecutar_archivos_nuevos(self.host, self.port, self.username, self._password, periodo, archivos, conteo_archivos,
+                                     directorio_trabajo=self.directorio_trabajo)
+
+    def _pool_cuenta(self):
+        # El pool de una cuenta se reserva con usar_pool; el de la cuenta del .env lo comparten los
+        # trabajos de la API y no se cierra al salir
+        if self.directorio_remoto is None:
+            return nullcontext()
+        return usar_pool(self.host, self.port, self.username, self._password, self.directorio_remoto)
+
+    def _registro(self) -> RegistroEjecuciones:
+        return obtener_registro(ruta_registro(self.directorio_trabajo))
+
+    def candidatos(self, entradas: Dict[str, dict]) -> List[str]:
+        """
+        Devuelve los comprimidos del listado que hay que vigilar: de periodos desde 'desde', no subidos
+        (o cambiados desde que se subieron) y sin reintento pendiente.
+        """
+        registro = self._registro()
+        ahora = time.time()
+        subidos: Dict[str, Dict[str, Tuple[Optional[int], Optional[int]]]] = {}
+        candidatos = []
+        for nombre, entrada in entradas.items():
+            periodo = extraer_fecha(nombre)
+            if tipo_comprimido(nombre) is None or not periodo.isdigit() or periodo < self.desde:
+                continue
+            if self.en_espera.get(nombre, 0) > ahora:
+                continue
+            if periodo not in subidos:
+                subidos[periodo] = registro.subidos(periodo)
+            if subidos[periodo].get(nombre) == (entrada["tamanho"], int(entrada["mtime"] or 0)):
+                continue
+            candidatos.append(nombre)
+        return sorted(candidatos)
+
+    def estables(self, sftp: paramiko.SFTPClient, directorio: str, candidatos: List[str]) -> Dict[str, List[int]]:
+        """
+        Hace un stat de cada candidato y devuelve el tamaño y la fecha de los que ya no cambian.
+        """
+        ahora = time.time()
+        estables = {}
+        for nombre in candidatos:
+            try:
+                atributos = sftp.stat(posixpath.join(directorio, nombre))
+            except FileNotFoundError:
+                self.observados.pop(nombre, None)
+                continue
+            actual = (atributos.st_size, int(atributos.st_mtime or 0))
+            previo = self.observados.get(nombre)
+            if previo is None or previo[:2] != actual:
+                if previo is None:
+                    _logger.info(f"Comprimido nuevo en el servidor: {nombre} ({actual[0]} bytes), se espera a que termine de llegar")
+                self.observados[nombre] = (*actual, ahora)
+            elif ahora - previo[2] >= self.estable:
+                estables[nombre] = list(actual)
+        # Lo que ya no es candidato (subido o borrado) deja de seguirse
+        for nombre in self.observados.keys() - set(candidatos):
+            del self.observados[nombre]
+        return estables
+
+    def revisar(self) -> List[str]:
+        """
+        Hace un sondeo del directorio remoto y procesa los comprimidos que terminaron de llegar.
+
+        Returns:
+            List[str]: Comprimidos que se procesaron en este sondeo.
+        """
+        try:
+            pool = obtener_pool(self.host, self.port, self.username, self._password, self.directorio_remoto)
+            with pool.sesion() as sftp:
+                snapshot = refrescar_snapshot(sftp, self.host, self.port, self.username)
+                estables = self.estables(sftp, snapshot.directorio, self.candidatos(snapshot.entradas))
+        except (paramiko.SSHException, OSError) as e:
+            _logger.error(f"No se pudo revisar el directorio remoto: {e}")
+            return []
+
+        por_periodo: Dict[str, List[str]] = {}
+        for nombre in estables:
+            por_periodo.setdefault(extraer_fecha(nombre), []).append(nombre)
+        procesados = []
+        for periodo, archivos in sorted(por_periodo.items()):
+            if self._detener.is_set():
+                break
+            _logger.info(f"{len(archivos)} comprimidos de {periodo} terminaron de llegar, se procesan")
+            conteo_archivos = construir_conteo(archivos, {nombre: {"tamanho": estables[nombre][0], "mtime": estables[nombre][1]}
+                                                          for nombre in archivos})
+            try:
+                self._procesar(periodo, archivos, conteo_archivos)
+            except Exception as e:
+                _logger.error(f"Procesamiento de los comprimidos nuevos de {periodo} fallido: {e}")
+            # El registro de ejecuciones dice qué quedó subido, haya o no excepción
+            subidos = self._registro().subidos(periodo)
+            for nombre in archivos:
+                self.observados.pop(nombre, None)
+                if subidos.get(nombre) == tuple(estables[nombre]):
+                    procesados.append(nombre)
+                    self.en_espera.pop(nombre, None)
+                else:
+                    _logger.warning(f"{nombre} no quedo subido, se reintenta en {self.reintento:.0f} s")
+                    self.en_espera[nombre] = time.time() + self.reintento
+        return procesados
+
+    def ejecutar(self, intervalo: float = INTERVALO_VIGILANCIA) -> None:
+        """
+        Sondea el directorio remoto cada 'intervalo' segundos hasta que se llame a detener().
+        """
+        _logger.info(f"Vigilando {self.username}@{self.host}:{self.port}:{self.directorio_remoto or '~'} cada {intervalo:.0f} s "
+                     f"(periodos desde {self.desde}, comprimidos estables durante {self.estable:.0f} s)")
+        with self._pool_cuenta():
+            while not self._detener.is_set():
+                self.revisar()
+                self._detener.wait(intervalo)
+
+    def esperar(self, segundos: float) -> bool:
+        """
+        Espera hasta 'segundos' o hasta que se detenga el vigilante. Devuelve True si se detuvo.
+        """
+        return self._detener.wait(segundos)
+
+    def detener(self) -> None:
+        self._detener.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vigila el servidor SFTP y procesa cada comprimido nuevo en cuanto termina de llegar")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_VIGILANCIA, help="Segundos entre sondeos")
+    parser.add_argument("--estable", type=float, default=ESTABLE_VIGILANCIA,
+                        help="Segundos que un comprimido debe seguir igual para procesarlo")
+    parser.add_argument("--desde", default=None, help="Primer periodo YYYYMM vigilado; por defecto el mes vencido")
+    args = parser.parse_args()
+
+    configurar_logging(args.desde or DESDE_VIGILANCIA or fecha_mes_vencido())
+    vigilante = VigilanteRemoto(os.getenv("IP_FTP"), int(os.getenv("PORT")), os.getenv("USER"), os.getenv("PASSWORD"),
+                                desde=args.desde, estable=args.estable)
+    signal.signal(signal.SIGTERM, lambda *_: vigilante.detener())
+    try:
+        vigilante.ejecutar(args.intervalo)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cerrar_pools()
+        cerrar_despachador(timeout=30)